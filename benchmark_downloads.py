@@ -0,0 +1,570 @@
+"""
+Benchmark de Throughput de Downloads (ponta a ponta, offline)
+Servidor HTTP local com mídia sintética (progressiva e HLS) + extrator yt-dlp de teste
+Dispara /api/download com concorrência 1..64 e mede MB/s, latência por estágio e CPU
+
+Uso:
+    python benchmark_downloads.py
+    python benchmark_downloads.py --mode hls --concurrency 1,4,16,64 --size-mb 4
+    python benchmark_downloads.py --via queue --json resultado.json
+    python benchmark_downloads.py --mode audio --audio-format m4a      (requer ffmpeg)
+
+Tudo roda num diretório temporário (config.json, downloads/, bancos SQLite):
+as configurações e a pasta de downloads reais não são tocadas.
+"""
+
+import argparse
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+MB = 1024 * 1024
+# Taxa nominal da mídia sintética (vídeo 8 Mbps + áudio 128 kbps)
+VIDEO_KBPS = 8000
+AUDIO_KBPS = 128
+STAGES = ('api', 'queue', 'setup', 'transfer', 'postprocess', 'total')
+
+
+# ----------------------------------------------------------------------
+# Mídia sintética
+# ----------------------------------------------------------------------
+
+def _write_random(path: Path, size: int):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, MB)
+            f.write(os.urandom(chunk))
+            remaining -= chunk
+
+
+def generate_media(root: Path, size_mb: float, segment_sec: int, ffmpeg: Optional[str],
+                   video_encoder: Optional[str]) -> Dict[str, Any]:
+    """
+    Cria progressive.mp4, hls/index.m3u8 (+ segmentos) e media.json em root
+
+    Com ffmpeg: mídia real (testsrc2 + seno), válida para os fixups e conversões
+    do yt-dlp. Sem ffmpeg: bytes aleatórios (o yt-dlp não inspeciona o conteúdo)
+    e sem o modo áudio.
+    """
+    hls_dir = root / 'hls'
+    hls_dir.mkdir(parents=True, exist_ok=True)
+    duration = max(1.0, size_mb * MB * 8 / ((VIDEO_KBPS + AUDIO_KBPS) * 1000))
+
+    if ffmpeg and video_encoder:
+        run = functools.partial(subprocess.run, check=True, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        run([ffmpeg, '-y', '-loglevel', 'error',
+             '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30',
+             '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000',
+             '-t', f"{duration:.2f}",
+             '-c:v', video_encoder, '-b:v', f"{VIDEO_KBPS}k", '-g', '60',
+             '-c:a', 'aac', '-b:a', f"{AUDIO_KBPS}k",
+             '-movflags', '+faststart', str(root / 'progressive.mp4')])
+        run([ffmpeg, '-y', '-loglevel', 'error', '-i', str(root / 'progressive.mp4'),
+             '-c', 'copy', '-f', 'hls', '-hls_time', str(segment_sec), '-hls_playlist_type', 'vod',
+             '-hls_segment_filename', str(hls_dir / 'seg%04d.ts'), str(hls_dir / 'index.m3u8')])
+        run([ffmpeg, '-y', '-loglevel', 'error', '-i', str(root / 'progressive.mp4'),
+             '-vn', '-c:a', 'copy', str(root / 'audio.m4a')])
+        vcodec = 'avc1.64001f' if video_encoder == 'libx264' else 'mp4v.20.8'
+        encoded = True
+    else:
+        _write_random(root / 'progressive.mp4', int(size_mb * MB))
+        # Segmentos de ~segment_sec na taxa nominal
+        segment_size = max(64 * 1024, int((VIDEO_KBPS + AUDIO_KBPS) * 1000 / 8 * segment_sec))
+        segments = max(1, int(size_mb * MB) // segment_size)
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{segment_sec}',
+                 '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:VOD']
+        for i in range(segments):
+            _write_random(hls_dir / f'seg{i:04d}.ts', segment_size)
+            lines += [f'#EXTINF:{float(segment_sec):.3f},', f'seg{i:04d}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        (hls_dir / 'index.m3u8').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        vcodec = 'avc1.64001f'
+        encoded = False
+
+    meta = {
+        'duration': round(duration, 2),
+        'encoded': encoded,
+        'vcodec': vcodec,
+        'acodec': 'mp4a.40.2',
+        'sizes': {
+            'progressive': (root / 'progressive.mp4').stat().st_size,
+            'hls': sum(p.stat().st_size for p in hls_dir.glob('*.ts')),
+        }
+    }
+    if (root / 'audio.m4a').exists():
+        meta['sizes']['audio'] = (root / 'audio.m4a').stat().st_size
+    (root / 'media.json').write_text(json.dumps(meta, indent=2), encoding='utf-8')
+    return meta
+
+
+# ----------------------------------------------------------------------
+# Servidor de mídia (processo separado: sua CPU não entra na medição)
+# ----------------------------------------------------------------------
+
+class _MediaHandler(SimpleHTTPRequestHandler):
+    """Arquivos estáticos com keep-alive e latência de primeiro byte opcional"""
+
+    protocol_version = 'HTTP/1.1'
+    latency_sec = 0.0
+
+    def do_GET(self):
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_media(root: str, latency_ms: float, ready):
+    handler = type('_Handler', (_MediaHandler,), {'latency_sec': latency_ms / 1000.0})
+    ThreadingHTTPServer.request_queue_size = 256
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=root))
+    server.daemon_threads = True
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_media_server(root: Path, latency_ms: float = 0.0):
+    """Inicia o servidor (spawn: o filho não herda as threads do app) e retorna (processo, URL base)"""
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    proc = ctx.Process(target=_serve_media, args=(str(root), latency_ms, ready),
+                       name='bench-media-server', daemon=True)
+    proc.start()
+    port = ready.get(timeout=30)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+# ----------------------------------------------------------------------
+# Extrator yt-dlp de teste
+# ----------------------------------------------------------------------
+
+class BenchIE(InfoExtractor):
+    """URLs http://127.0.0.1:<porta>/bench/<progressive|hls|audio>/<id> do servidor local"""
+
+    IE_NAME = 'vinc:bench'
+    _VALID_URL = r'https?://127\.0\.0\.1:\d+/bench/(?P<kind>progressive|hls|audio)/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        kind, video_id = self._match_valid_url(url).group('kind', 'id')
+        base = url.split('/bench/')[0]
+        # Uma requisição de metadados, como a página/API de um site real
+        meta = self._download_json(f"{base}/media.json", video_id)
+        common = {'vcodec': meta['vcodec'], 'acodec': meta['acodec'], 'height': 720, 'width': 1280, 'fps': 30}
+
+        if kind == 'hls':
+            formats = self._extract_m3u8_formats(f"{base}/hls/index.m3u8", video_id, 'mp4',
+                                                 entry_protocol='m3u8_native', m3u8_id='hls')
+            for fmt in formats:
+                fmt.update(common)
+        elif kind == 'audio':
+            formats = [{
+                'format_id': 'audio',
+                'url': f"{base}/audio.m4a",
+                'ext': 'm4a',
+                'vcodec': 'none',
+                'acodec': meta['acodec'],
+                'abr': AUDIO_KBPS,
+                'filesize': meta['sizes'].get('audio'),
+            }]
+        else:
+            formats = [dict(common, format_id='progressive', url=f"{base}/progressive.mp4",
+                            ext='mp4', filesize=meta['sizes']['progressive'])]
+
+        return {
+            'id': video_id,
+            'title': f"bench {video_id}",
+            'artist': 'VINC Bench',
+            'duration': meta['duration'],
+            'formats': formats,
+        }
+
+
+def install_bench_extractor():
+    """Coloca BenchIE à frente dos extratores padrão em todo YoutubeDL criado no processo"""
+    original = yt_dlp.YoutubeDL.add_default_info_extractors
+    if getattr(original, '_vinc_bench', False):
+        return
+
+    def add_default_info_extractors(self):
+        self.add_info_extractor(BenchIE())
+        original(self)
+
+    add_default_info_extractors._vinc_bench = True
+    yt_dlp.YoutubeDL.add_default_info_extractors = add_default_info_extractors
+
+
+# ----------------------------------------------------------------------
+# Cliente: dispara downloads e acompanha o status pela API
+# ----------------------------------------------------------------------
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class StageRecorder(MutableMapping):
+    """
+    Envolve download_status e marca o instante de cada transição de estágio
+
+    Marcas (precisas, sem consultas periódicas):
+        seen: download_video começou | first_byte: primeiro hook de progresso
+        processing: transferência concluída | done: completed/erro
+    """
+
+    ORDER = ('seen', 'first_byte', 'processing', 'done')
+    TERMINAL = ('completed', 'error', 'failed', 'paused', 'canceled')
+
+    def __init__(self, inner: MutableMapping):
+        self.inner = inner
+        self._marks: Dict[str, Dict[str, float]] = {}
+        self._cond = threading.Condition()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.inner[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self.inner[key] = value
+        state = value.get('status') if isinstance(value, dict) else None
+        if state == 'downloading' and value.get('filename'):
+            stage = 'first_byte'
+        elif state == 'processing':
+            stage = 'processing'
+        elif state in self.TERMINAL:
+            stage = 'done'
+        else:
+            stage = 'seen'
+        now = time.perf_counter()
+        with self._cond:
+            marks = self._marks.setdefault(key, {})
+            # Estágio pulado (ex.: sem pós-processamento) herda a marca seguinte
+            for previous in self.ORDER[:self.ORDER.index(stage) + 1]:
+                marks.setdefault(previous, now)
+            if stage == 'done':
+                self._cond.notify_all()
+
+    def __delitem__(self, key: str):
+        del self.inner[key]
+        with self._cond:
+            self._marks.pop(key, None)
+
+    def __iter__(self):
+        return iter(self.inner)
+
+    def __len__(self) -> int:
+        return len(self.inner)
+
+    def wait_done(self, key: str, timeout: float) -> Dict[str, float]:
+        """Aguarda o estado final de key e retorna as marcas"""
+        with self._cond:
+            self._cond.wait_for(lambda: 'done' in self._marks.get(key, {}), timeout=timeout)
+            return dict(self._marks.get(key, {}))
+
+
+def _stage_result(client, recorder: StageRecorder, job_id: str, started: float,
+                  accepted: float, timeout: float) -> Dict[str, Any]:
+    """Aguarda o job e lê o status final pela API, como a interface faz"""
+    marks = recorder.wait_done(job_id, timeout)
+    result = client.get(f'/api/download-status/{job_id}').get_json() or {}
+    if 'done' not in marks:
+        result = {'status': 'timeout'}
+    stages = {'api': accepted - started}
+    if 'done' in marks:
+        stages.update({
+            'queue': marks['seen'] - started,
+            'setup': marks['first_byte'] - marks['seen'],
+            'transfer': marks['processing'] - marks['first_byte'],
+            'postprocess': marks['done'] - marks['processing'],
+            'total': marks['done'] - started,
+        })
+    return {
+        'id': job_id,
+        'ok': result.get('status') == 'completed',
+        'error': result.get('error') or (None if result.get('status') == 'completed' else result.get('status')),
+        'filename': result.get('filename'),
+        'stream_copy': result.get('stream_copy'),
+        'stages': stages,
+    }
+
+
+class BenchmarkRunner:
+    """Executa os níveis de concorrência contra o app Flask (no mesmo processo)"""
+
+    def __init__(self, web, recorder: StageRecorder, base_url: str, mode: str, via: str,
+                 payload_bytes: int, audio_format: str, timeout: float):
+        self.web = web
+        self.recorder = recorder
+        self.base_url = base_url
+        self.mode = mode
+        self.via = via
+        self.payload_bytes = payload_bytes
+        self.audio_format = audio_format
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        """Um test client por thread (como conexões separadas de navegadores)"""
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.web.app.test_client()
+        return self._local.client
+
+    def _url(self, label: str) -> str:
+        kind = 'audio' if self.mode == 'audio' else self.mode
+        # ID único: o arquivo de downloads nunca pula um job
+        return f"{self.base_url}/bench/{kind}/{label}-{uuid.uuid4().hex[:8]}"
+
+    def _direct_job(self, label: str) -> Dict[str, Any]:
+        """POST /api/download e acompanha até o fim (slot do cliente ocupado o tempo todo)"""
+        job_id = f"bench-{uuid.uuid4().hex[:12]}"
+        started = time.perf_counter()
+        response = self.client.post('/api/download', json={
+            'url': self._url(label),
+            'video_id': job_id,
+            'quality': 'best',
+            'audio_only': self.mode == 'audio',
+            'audio_format': self.audio_format,
+        }).get_json() or {}
+        accepted = time.perf_counter()
+        if not response.get('success'):
+            return {'id': job_id, 'ok': False, 'error': response.get('error'),
+                    'stages': {'api': accepted - started}}
+        return _stage_result(self.client, self.recorder, job_id, started, accepted, self.timeout)
+
+    def _queue_job(self, label: str) -> Dict[str, Any]:
+        """
+        Enfileira direto em download_queue (mesma chamada de /api/queue/add após a análise)
+        e acompanha; o despachante limita o paralelismo a simultaneous_transfers
+        """
+        self.client.get('/api/queue/status')  # garante o despachante (before_request)
+        started = time.perf_counter()
+        task_id = self.web.download_queue.add(
+            url=self._url(label), title=f"bench {label}", platform='Outros',
+            quality='best', format=self.audio_format if self.mode == 'audio' else 'mp4'
+        )
+        accepted = time.perf_counter()
+        return _stage_result(self.client, self.recorder, task_id, started, accepted, self.timeout)
+
+    def run_level(self, concurrency: int, jobs: int) -> Dict[str, Any]:
+        """Roda `jobs` downloads com até `concurrency` simultâneos"""
+        if self.via == 'queue':
+            # Despachante lê simultaneous_transfers a cada requisição
+            self.web.get_config_manager().update({'simultaneous_transfers': concurrency})
+            worker, pool_size = self._queue_job, jobs
+        else:
+            worker, pool_size = self._direct_job, concurrency
+
+        before = os.times()
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='bench-client') as pool:
+            results = list(pool.map(worker, [f"c{concurrency}-{i}" for i in range(jobs)]))
+        wall = time.perf_counter() - wall_start
+        after = os.times()
+
+        ok = [r for r in results if r['ok']]
+        cpu_self = (after.user - before.user) + (after.system - before.system)
+        cpu_children = (after.children_user - before.children_user) \
+            + (after.children_system - before.children_system)
+        mbytes = len(ok) * self.payload_bytes / MB
+        stages = {}
+        for stage in STAGES:
+            values = [r['stages'][stage] for r in ok if stage in r['stages']]
+            stages[stage] = {
+                'p50_ms': round(_percentile(values, 50) * 1000, 1) if values else None,
+                'p95_ms': round(_percentile(values, 95) * 1000, 1) if values else None,
+                'max_ms': round(max(values) * 1000, 1) if values else None,
+            }
+        errors = sorted({str(r.get('error')) for r in results if not r['ok']})
+        self._cleanup(results)
+        return {
+            'concurrency': concurrency,
+            'jobs': jobs,
+            'ok': len(ok),
+            'failed': len(results) - len(ok),
+            'errors': errors[:5],
+            'wall_sec': round(wall, 3),
+            'mb': round(mbytes, 2),
+            'mb_per_sec': round(mbytes / wall, 2) if wall else 0.0,
+            'stream_copies': sum(1 for r in ok if r.get('stream_copy')),
+            'cpu': {
+                'app_sec': round(cpu_self, 2),
+                'children_sec': round(cpu_children, 2),
+                'percent_of_core': round((cpu_self + cpu_children) / wall * 100, 1) if wall else 0.0,
+                'ms_per_mb': round((cpu_self + cpu_children) * 1000 / mbytes, 1) if mbytes else None,
+            },
+            'stages': stages,
+        }
+
+    def _cleanup(self, results: List[Dict[str, Any]]):
+        """Apaga os arquivos do nível (o disco não cresce com o número de jobs)"""
+        for result in results:
+            if result['id'] in self.recorder:
+                del self.recorder[result['id']]
+            path = result.get('filename')
+            if path and os.path.isfile(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _print_table(levels: List[Dict[str, Any]], out):
+    def ms(value):
+        return f"{value:.0f}" if value is not None else '-'
+
+    header = (f"{'conc':>4} {'jobs':>5} {'ok':>4} {'MB/s':>8} {'total p50/p95':>15} "
+              f"{'fila':>6} {'setup':>6} {'transf':>7} {'pós':>6} {'CPU s':>7} {'CPU %':>6} {'ms/MB':>6}")
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for level in levels:
+        st = level['stages']
+        print(f"{level['concurrency']:>4} {level['jobs']:>5} {level['ok']:>4} {level['mb_per_sec']:>8.1f} "
+              f"{ms(st['total']['p50_ms']) + '/' + ms(st['total']['p95_ms']):>15} "
+              f"{ms(st['queue']['p50_ms']):>6} {ms(st['setup']['p50_ms']):>6} "
+              f"{ms(st['transfer']['p50_ms']):>7} {ms(st['postprocess']['p50_ms']):>6} "
+              f"{level['cpu']['app_sec'] + level['cpu']['children_sec']:>7.2f} "
+              f"{level['cpu']['percent_of_core']:>6.0f} "
+              f"{level['cpu']['ms_per_mb'] if level['cpu']['ms_per_mb'] is not None else '-':>6}", file=out)
+        for error in level['errors']:
+            print(f"     ❌ {error}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de throughput dos downloads (offline)')
+    parser.add_argument('--mode', choices=('progressive', 'hls', 'audio'), default='progressive',
+                        help='Tipo de mídia: HTTP progressivo, HLS (fragmentos) ou áudio + pós-processamento')
+    parser.add_argument('--via', choices=('api', 'queue'), default='api',
+                        help='api: POST /api/download; queue: fila + despachante')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32,64',
+                        help='Níveis de concorrência separados por vírgula')
+    parser.add_argument('--rounds', type=int, default=2, help='Jobs por nível = concorrência x rounds')
+    parser.add_argument('--size-mb', type=float, default=8.0, help='Tamanho da mídia sintética')
+    parser.add_argument('--segment-sec', type=int, default=2, help='Duração dos segmentos HLS')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Atraso de primeiro byte por requisição no servidor local')
+    parser.add_argument('--host-limit', type=int, default=0,
+                        help='host_default_max_concurrent durante o teste (0 = sem limite)')
+    parser.add_argument('--audio-format', default='mp3', help='Formato pedido no modo áudio (m4a = cópia)')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Tempo máximo por job (s)')
+    parser.add_argument('--warmup', type=int, default=1, help='Jobs de aquecimento (fora da medição)')
+    parser.add_argument('--workdir', help='Diretório de trabalho (padrão: temporário, removido ao final)')
+    parser.add_argument('--json', dest='json_path', help='Grava os resultados neste arquivo JSON')
+    parser.add_argument('--verbose', action='store_true', help='Mantém os logs do app')
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    json_path = Path(args.json_path).resolve() if args.json_path else None
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix='vinc-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    # App isolado: config.json, downloads/ e bancos no diretório de trabalho
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    os.chdir(workdir)
+    (workdir / 'config.json').write_text(json.dumps({
+        'host_default_max_concurrent': args.host_limit,
+        'host_default_requests_per_minute': 0,
+        'bandwidth_limit_kbps': 0,
+        'prevent_sleep': False,
+        'generate_m3u': False,
+        'embed_subtitles': False,
+        'simultaneous_transfers': max(levels),
+    }, indent=2), encoding='utf-8')
+
+    # Jobs idênticos viram hardlinks com a deduplicação: desligada para medir só o download
+    (workdir / 'app_settings.json').write_text(json.dumps({
+        'Performance': {'DedupeDownloads': False}
+    }, indent=2), encoding='utf-8')
+
+    # Relatório na saída original; progresso do yt-dlp e prints do app só com --verbose
+    out = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    install_bench_extractor()
+    import web_downloader as web
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    toolchain = web.get_toolchain()
+    ffmpeg = toolchain.ffmpeg
+    if args.mode == 'audio' and not ffmpeg:
+        print("❌ Modo áudio requer ffmpeg (conversão no pool de pós-processamento)", file=out)
+        sys.exit(2)
+
+    media_root = workdir / 'media'
+    print(f"🎞️ Gerando mídia sintética ({args.size_mb:g} MB) em {media_root}...", file=out)
+    meta = generate_media(media_root, args.size_mb, args.segment_sec, ffmpeg,
+                          toolchain.pick_encoder(('libx264', 'mpeg4')) if ffmpeg else None)
+    payload = meta['sizes']['audio' if args.mode == 'audio' else args.mode]
+    server, base_url = start_media_server(media_root, args.latency_ms)
+    print(f"🌐 Servidor de mídia: {base_url} ({'codificada' if meta['encoded'] else 'aleatória'}, "
+          f"{payload / MB:.1f} MB por job)", file=out)
+
+    # Marcas de estágio no próprio download_status (mesma troca que run_production faz)
+    recorder = StageRecorder(web.download_status)
+    web.download_status = recorder
+    runner = BenchmarkRunner(web, recorder, base_url, args.mode, args.via, payload,
+                             args.audio_format, timeout=args.timeout)
+    results: List[Dict[str, Any]] = []
+    try:
+        if args.warmup:
+            runner.run_level(1, args.warmup)
+        for concurrency in levels:
+            print(f"⏱️ Concorrência {concurrency}...", file=out, flush=True)
+            results.append(runner.run_level(concurrency, concurrency * max(1, args.rounds)))
+    finally:
+        server.terminate()
+        server.join(timeout=5)
+
+    print(f"\n📊 {args.mode} via {args.via} | {os.cpu_count()} CPUs | "
+          f"estágios em ms (p50) | CPU = app + filhos (ffmpeg)\n", file=out)
+    _print_table(results, out)
+
+    if json_path:
+        json_path.write_text(json.dumps({
+            'mode': args.mode,
+            'via': args.via,
+            'size_mb': args.size_mb,
+            'payload_bytes': payload,
+            'encoded_media': meta['encoded'],
+            'latency_ms': args.latency_ms,
+            'host_limit': args.host_limit,
+            'cpus': os.cpu_count(),
+            'levels': results,
+        }, indent=2), encoding='utf-8')
+        print(f"\n💾 Resultados em {json_path}", file=out)
+
+    if not args.workdir:
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(workdir, ignore_errors=True)
+    # Threads do app (catálogo, despachante) são daemon; sai sem esperar por elas
+    logging.shutdown()
+    out.flush()
+    os._exit(0 if all(level['failed'] == 0 for level in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
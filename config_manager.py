@@ -0,0 +1,145 @@
+"""
+Gerenciador do config.json do servidor
+Carrega uma vez, serve snapshots imutáveis e revalida pelo mtime
+Escrita atômica (arquivo temporário + rename)
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# umask lida uma vez na importação (os.umask só consulta alterando, o que não é seguro entre threads)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def replacement_file_mode(path: Path) -> int:
+    """
+    Permissões para o arquivo que vai substituir path via os.replace
+
+    mkstemp cria com 0600; o substituto herda o modo do arquivo atual
+    ou, se ainda não existir, o padrão de um arquivo novo (0666 & ~umask).
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+class ConfigManager:
+    """
+    Cache do config.json compartilhado por todas as rotas
+
+    - get() devolve um snapshot somente leitura (sem abrir o arquivo)
+    - No máximo um stat() por REVALIDATE_INTERVAL_SEC para detectar edição externa
+    - update() mescla chaves e grava de forma atômica
+    """
+
+    REVALIDATE_INTERVAL_SEC = 1.0
+
+    def __init__(self, config_file: str = 'config.json'):
+        self.config_file = Path(config_file)
+        self._lock = threading.Lock()
+        self._snapshot: Mapping[str, Any] = MappingProxyType({})
+        self._exists = False
+        self._signature = None
+        self._checked_at = 0.0
+        self._reload()
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _reload(self):
+        """Relê o arquivo (chamado sob lock ou na inicialização)"""
+        signature = self._stat_signature()
+        data: Dict[str, Any] = {}
+        if signature is not None:
+            try:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f) or {}
+            except Exception as e:
+                logger.warning(f"⚠️ config.json inválido, usando vazio: {e}")
+                data = {}
+        self._snapshot = MappingProxyType(data)
+        self._exists = signature is not None
+        self._signature = signature
+        self._checked_at = time.monotonic()
+
+    def get(self) -> Mapping[str, Any]:
+        """Snapshot atual (somente leitura); use dict(...) para obter cópia editável"""
+        if time.monotonic() - self._checked_at >= self.REVALIDATE_INTERVAL_SEC:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.REVALIDATE_INTERVAL_SEC:
+                    if self._stat_signature() != self._signature:
+                        self._reload()
+                    else:
+                        self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def exists(self) -> bool:
+        """Se o config.json existe (atualizado junto com get())"""
+        self.get()
+        return self._exists
+
+    def update(self, changes: Dict[str, Any]) -> Mapping[str, Any]:
+        """
+        Mescla chaves no config.json e grava de forma atômica
+
+        Returns:
+            Novo snapshot
+        """
+        with self._lock:
+            if self._stat_signature() != self._signature:
+                self._reload()
+            data = dict(self._snapshot)
+            data.update(changes)
+            self._write_atomic(data)
+            self._snapshot = MappingProxyType(data)
+            self._exists = True
+            self._signature = self._stat_signature()
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _write_atomic(self, data: Dict[str, Any]):
+        """Grava em arquivo temporário no mesmo diretório e renomeia"""
+        directory = self.config_file.parent
+        fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=str(directory))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, replacement_file_mode(self.config_file))
+            os.replace(tmp_path, self.config_file)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+# Instância global (singleton)
+_config_instance: Optional[ConfigManager] = None
+_config_lock = threading.Lock()
+
+
+def get_config_manager() -> ConfigManager:
+    """Retorna instância global do gerenciador de config.json"""
+    global _config_instance
+    with _config_lock:
+        if _config_instance is None:
+            _config_instance = ConfigManager()
+    return _config_instance
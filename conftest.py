@@ -0,0 +1,6 @@
+"""
+Configuração do pytest
+test_xhamster.py é um script manual (consulta a rede na importação), não um teste
+"""
+
+collect_ignore = ['test_xhamster.py']
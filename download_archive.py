@@ -0,0 +1,275 @@
+"""
+Arquivo de Downloads (download archive) compartilhado
+SQLite indexado + Bloom filter em memória, usado por vídeos e Spotify
+Substitui o download_archive.txt lido inteiro por cada instância do yt-dlp
+"""
+
+import hashlib
+import logging
+import math
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# youtube.com/watch?v=ID, youtu.be/ID, youtube.com/shorts/ID
+_YOUTUBE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def archive_key_from_url(url: str) -> Optional[str]:
+    """
+    Calcula a chave do arquivo ("extractor id", formato do yt-dlp) sem extração
+
+    Só é possível para URLs cujo ID está na própria URL (YouTube); para as
+    demais retorna None e a busca é feita pela URL.
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except Exception:
+        return None
+    host = parsed.netloc.lower()
+    video_id = None
+    if host.endswith('youtu.be'):
+        video_id = parsed.path.strip('/').split('/')[0]
+    elif host.endswith('youtube.com'):
+        if parsed.path == '/watch':
+            video_id = (parse_qs(parsed.query).get('v') or [None])[0]
+        elif parsed.path.startswith('/shorts/'):
+            video_id = parsed.path.split('/')[2]
+    if video_id and _YOUTUBE_ID_RE.match(video_id):
+        return f'youtube {video_id}'
+    return None
+
+
+class BloomFilter:
+    """Bloom filter simples (bytearray + double hashing com blake2b)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class DownloadArchive:
+    """
+    Arquivo de downloads compartilhado entre threads e entre os fluxos de vídeo/Spotify
+
+    - Tabela SQLite indexada por chave ("youtube <id>", "spotify <id>") e por URL
+    - Bloom filter em memória responde "não baixado" sem tocar no banco
+    - Compatível com o parâmetro download_archive do yt-dlp via for_url()
+    - shared = True (vários workers): o Bloom de um processo não vê o que outro
+      gravou, então ausências são confirmadas no SQLite (busca indexada)
+    """
+
+    BLOOM_MIN_CAPACITY = 100_000
+
+    def __init__(self, db_path: str = 'downloads/download_archive.db',
+                 legacy_txt: Optional[str] = 'downloads/download_archive.txt'):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.shared = False
+        self._init_db()
+        if legacy_txt:
+            self._import_legacy_txt(Path(legacy_txt))
+        self._rebuild_bloom()
+        logger.info(f"🗃️ Arquivo de downloads: {self.db_path} ({self._bloom.count} itens)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Cria tabelas se não existirem"""
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive (
+                archive_key TEXT PRIMARY KEY,
+                url TEXT,
+                file_path TEXT,
+                platform TEXT,
+                added_at DATETIME NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_url ON archive(url)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive_meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _import_legacy_txt(self, txt_path: Path):
+        """Importa uma única vez o download_archive.txt antigo do yt-dlp"""
+        conn = self._connect()
+        done = conn.execute(
+            "SELECT 1 FROM archive_meta WHERE name = 'legacy_txt_imported'"
+        ).fetchone()
+        if done or not txt_path.exists():
+            conn.close()
+            return
+
+        with open(txt_path, 'r', encoding='utf-8', errors='ignore') as f:
+            keys = [(line.strip(),) for line in f if line.strip()]
+        conn.executemany(
+            "INSERT OR IGNORE INTO archive (archive_key, added_at) VALUES (?, datetime('now'))",
+            keys
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO archive_meta (name, value) VALUES ('legacy_txt_imported', datetime('now'))"
+        )
+        conn.commit()
+        conn.close()
+        logger.info(f"🔁 {len(keys)} entradas importadas de {txt_path}")
+
+    def _rebuild_bloom(self):
+        """(Re)constrói o Bloom filter com folga para o dobro dos itens atuais"""
+        conn = self._connect()
+        total = conn.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+        bloom = BloomFilter(max(self.BLOOM_MIN_CAPACITY, total * 2))
+        for row in conn.execute('SELECT archive_key, url FROM archive'):
+            bloom.add(row['archive_key'])
+            if row['url']:
+                bloom.add(row['url'])
+        conn.close()
+        self._bloom = bloom
+
+    def _may_contain(self, item: str) -> bool:
+        """False só se certamente ausente (Bloom deste processo, quando não compartilhado)"""
+        return self.shared or item in self._bloom
+
+    def __contains__(self, archive_key: str) -> bool:
+        if not self._may_contain(archive_key):
+            return False
+        conn = self._connect()
+        row = conn.execute('SELECT 1 FROM archive WHERE archive_key = ?', (archive_key,)).fetchone()
+        conn.close()
+        return row is not None
+
+    def add(self, archive_key: str, url: Optional[str] = None,
+            file_path: Optional[str] = None, platform: Optional[str] = None):
+        """Registra (ou completa) uma entrada do arquivo"""
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO archive (archive_key, url, file_path, platform, added_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(archive_key) DO UPDATE SET
+                url = COALESCE(excluded.url, url),
+                file_path = COALESCE(excluded.file_path, file_path),
+                platform = COALESCE(excluded.platform, platform)
+        ''', (archive_key, url, file_path, platform))
+        conn.commit()
+        conn.close()
+
+        with self._lock:
+            self._bloom.add(archive_key)
+            if url:
+                self._bloom.add(url)
+            if self._bloom.count > self._bloom.capacity:
+                self._rebuild_bloom()
+
+    def set_file(self, url: str, file_path: str):
+        """Associa o arquivo final às entradas registradas para a URL"""
+        conn = self._connect()
+        conn.execute('UPDATE archive SET file_path = ? WHERE url = ?', (file_path, url))
+        conn.commit()
+        conn.close()
+
+    def lookup(self, url: str = None, archive_key: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca entrada por chave (ou calculada a partir da URL) ou pela URL
+
+        Returns:
+            Dict com archive_key, url, file_path, platform, added_at ou None
+        """
+        archive_key = archive_key or (archive_key_from_url(url) if url else None)
+        candidates = [c for c in (archive_key, url) if c and self._may_contain(c)]
+        if not candidates:
+            return None
+
+        conn = self._connect()
+        row = None
+        if archive_key and archive_key in candidates:
+            row = conn.execute('SELECT * FROM archive WHERE archive_key = ?', (archive_key,)).fetchone()
+        if row is None and url and url in candidates:
+            row = conn.execute(
+                'SELECT * FROM archive WHERE url = ? ORDER BY added_at DESC LIMIT 1', (url,)
+            ).fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def lookup_existing_file(self, url: str = None, archive_key: str = None) -> Optional[Dict[str, Any]]:
+        """Como lookup(), mas só retorna se o arquivo registrado ainda existe"""
+        entry = self.lookup(url=url, archive_key=archive_key)
+        if entry and entry.get('file_path') and Path(entry['file_path']).is_file():
+            return entry
+        return None
+
+    def for_url(self, url: str, platform: Optional[str] = None) -> '_YtdlpArchiveView':
+        """Visão compatível com ydl_opts['download_archive'] que anota a URL de origem"""
+        return _YtdlpArchiveView(self, url, platform)
+
+    def count(self) -> int:
+        conn = self._connect()
+        total = conn.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+        conn.close()
+        return total
+
+
+class _YtdlpArchiveView:
+    """
+    Objeto tipo set aceito pelo yt-dlp em download_archive
+
+    O yt-dlp consulta "id in archive" e chama archive.add(id) ao concluir.
+    """
+
+    def __init__(self, archive: DownloadArchive, url: str, platform: Optional[str]):
+        self._archive = archive
+        self._url = url
+        self._platform = platform
+
+    def __contains__(self, archive_key: str) -> bool:
+        return archive_key in self._archive
+
+    def add(self, archive_key: str):
+        self._archive.add(archive_key, url=self._url, platform=self._platform)
+
+
+# Instância global (singleton)
+_archive_instance: Optional[DownloadArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_download_archive() -> DownloadArchive:
+    """Retorna instância global do arquivo de downloads"""
+    global _archive_instance
+    with _archive_lock:
+        if _archive_instance is None:
+            _archive_instance = DownloadArchive()
+    return _archive_instance
@@ -1,16 +1,25 @@
 """
 Sistema de Fila de Downloads
 Inspirado no 9xconvert - Gerenciamento completo de downloads
+Estado opcionalmente em backend compartilhado (vários workers)
+Pausa/cancelamento cooperativos: tokens verificados pelo hook de progresso
 """
 
+import logging
+import os
 import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict, List, Optional, Callable
 from dataclasses import dataclass, asdict
 from enum import Enum
 import uuid
 
+from state_backend import process_alive
+
+logger = logging.getLogger(__name__)
+
 class DownloadStatus(Enum):
     """Estados possíveis de um download"""
     WAITING = "waiting"
@@ -41,11 +50,36 @@ class DownloadTask:
     started_at: Optional[str] = None
     completed_at: Optional[str] = None
     output_path: Optional[str] = None
+    # Template de saída fixado no primeiro início: retomada reaproveita o .part
+    output_template: Optional[str] = None
+    # Execução em andamento ("pid:token"); a tarefa só é iniciada de novo quando ela termina
+    run_owner: Optional[str] = None
     
     def to_dict(self):
         """Converte para dicionário"""
         return asdict(self)
 
+
+class CancellationToken:
+    """
+    Sinal cooperativo de interrupção de uma tarefa
+    
+    O download verifica o token no hook de progresso e aborta no próximo bloco;
+    reason diz se foi pausa (mantém .part para retomar) ou cancelamento.
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:12]}"
+    
+    def interrupt(self, reason: str):
+        self.reason = reason
+        self._event.set()
+    
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
 class DownloadQueue:
     """Gerenciador de fila de downloads"""
     
@@ -54,8 +88,19 @@ class DownloadQueue:
         self.tasks: Dict[str, DownloadTask] = {}
         self.queue: List[str] = []  # IDs na ordem da fila
         self.active: List[str] = []  # IDs em download
-        self.lock = threading.Lock()
+        # Reentrante: operações em massa chamam as operações unitárias
+        self.lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_writable = True
         self.running = True
+        # Tokens das tarefas em execução neste processo
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._status_checked: Dict[str, float] = {}
+        self._wakeup = threading.Event()
+        self._dispatcher_pid: Optional[int] = None
+        # Backend compartilhado (state_backend); None = só memória do processo
+        self.backend = None
+        self._state_version = None
         
         # Callbacks
         self.on_start: Optional[Callable] = None
@@ -63,6 +108,155 @@ class DownloadQueue:
         self.on_complete: Optional[Callable] = None
         self.on_error: Optional[Callable] = None
         
+    def attach_backend(self, backend) -> None:
+        """
+        Passa a manter tarefas/fila no backend compartilhado
+        
+        Tarefas já existentes na memória são copiadas se o backend estiver vazio.
+        """
+        with self.lock:
+            self.backend = backend
+            with backend.transaction('state') as state:
+                if state.get('version') is None:
+                    self._dump_state(state)
+                else:
+                    self._load_state(state)
+    
+    def _load_state(self, state: Dict) -> None:
+        if state.get('version') == self._state_version:
+            return
+        self.tasks = {tid: DownloadTask(**data) for tid, data in state.get('tasks', {}).items()}
+        self.queue = list(state.get('queue', []))
+        self.active = list(state.get('active', []))
+        self._state_version = state.get('version')
+    
+    def _snapshot(self) -> Dict:
+        return {
+            'tasks': {tid: task.to_dict() for tid, task in self.tasks.items()},
+            'queue': list(self.queue),
+            'active': list(self.active),
+        }
+    
+    def _dump_state(self, state: Dict, snapshot: Optional[Dict] = None) -> None:
+        state.update(snapshot or self._snapshot())
+        state['version'] = (state.get('version') or 0) + 1
+        self._state_version = state['version']
+    
+    @contextmanager
+    def _locked(self, write: bool = True):
+        """
+        Lock do processo + sincronização com o backend (outros workers)
+        
+        - write=False (consultas): só recarrega o estado se outro worker o
+          alterou; sem transação de escrita
+        - write=True: transação exclusiva; o estado só é regravado (e a versão
+          incrementada) se algo mudou
+        
+        Chamadas aninhadas (ex.: pause_all -> pause_task) reaproveitam a
+        transação externa em vez de abrir outra.
+        """
+        with self.lock:
+            if self.backend is None or self._lock_depth:
+                if write and self._lock_depth and not self._lock_writable:
+                    raise RuntimeError('Escrita na fila dentro de uma consulta somente leitura')
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            self._lock_depth += 1
+            self._lock_writable = write
+            try:
+                if not write:
+                    self._load_state(self.backend.get('state') or {})
+                    yield
+                    return
+                with self.backend.transaction('state') as state:
+                    self._load_state(state)
+                    before = self._snapshot()
+                    yield
+                    after = self._snapshot()
+                    if after != before:
+                        self._dump_state(state, after)
+            finally:
+                self._lock_depth -= 1
+                self._lock_writable = True
+    
+    # Interrupção cooperativa
+    
+    def token_for(self, task_id: str) -> CancellationToken:
+        """Token da execução atual da tarefa (criado na primeira chamada)"""
+        with self.lock:
+            token = self._tokens.get(task_id)
+            if token is None:
+                token = self._tokens[task_id] = CancellationToken()
+            return token
+    
+    def release_token(self, task_id: str, token: CancellationToken):
+        """
+        Encerra a execução: descarta o token e libera a tarefa para uma nova execução
+        
+        Chamado quando a thread do download terminou de fato (inclusive a
+        gravação do status); só então uma retomada pode reabrir o .part.
+        """
+        with self._locked():
+            if self._tokens.get(task_id) is token:
+                del self._tokens[task_id]
+                self._status_checked.pop(task_id, None)
+            task = self.tasks.get(task_id)
+            if task is not None and task.run_owner == token.owner:
+                task.run_owner = None
+        self._wakeup.set()
+    
+    def is_current_run(self, task_id: str, token: Optional[CancellationToken]) -> bool:
+        """Se token ainda é o da execução atual da tarefa neste processo"""
+        with self.lock:
+            return token is not None and self._tokens.get(task_id) is token
+    
+    def _run_finished(self, task: DownloadTask) -> bool:
+        """Sem execução anterior viva (chamado sob lock)"""
+        if not task.run_owner:
+            return True
+        pid, _, _ = task.run_owner.partition(':')
+        if pid == str(os.getpid()):
+            token = self._tokens.get(task.id)
+            return token is None or token.owner != task.run_owner
+        # Worker que executava a tarefa morreu
+        return not process_alive(pid)
+    
+    def _signal(self, task_id: str, reason: str):
+        """Interrompe a execução local da tarefa, se houver (chamado sob lock)"""
+        token = self._tokens.get(task_id)
+        if token is not None:
+            token.interrupt(reason)
+    
+    def interruption(self, task_id: str, token: Optional[CancellationToken] = None,
+                     recheck_sec: float = 1.0) -> Optional[str]:
+        """
+        Motivo da interrupção pedida ('paused'/'canceled') ou None
+        
+        Barato para o hook de progresso: lê o token da execução; com backend
+        compartilhado, consulta o estado no máximo a cada recheck_sec
+        (a pausa pode ter sido pedida em outro worker).
+        """
+        token = token or self._tokens.get(task_id)
+        if token is not None and token.is_set():
+            return token.reason
+        if self.backend is None:
+            return None
+        now = time.monotonic()
+        if now - self._status_checked.get(task_id, 0) < recheck_sec:
+            return None
+        self._status_checked[task_id] = now
+        task = self.get_task(task_id)
+        reason = task.status if task else DownloadStatus.CANCELED.value
+        if reason in (DownloadStatus.PAUSED.value, DownloadStatus.CANCELED.value):
+            if token is not None:
+                token.interrupt(reason)
+            return reason
+        return None
+    
     def add(self, url: str, title: str, platform: str, 
             quality: str = "best", format: str = "mp4",
             thumbnail: Optional[str] = None) -> str:
@@ -84,21 +278,25 @@ class DownloadQueue:
             thumbnail=thumbnail
         )
         
-        with self.lock:
+        with self._locked():
             self.tasks[task_id] = task
             self.queue.append(task_id)
+        self._wakeup.set()
         
         return task_id
     
     def get_task(self, task_id: str) -> Optional[DownloadTask]:
         """Obtém tarefa pelo ID"""
+        if self.backend is not None:
+            with self._locked(write=False):
+                return self.tasks.get(task_id)
         return self.tasks.get(task_id)
     
     def update_progress(self, task_id: str, progress: float, 
                        speed: str = "", eta: str = "",
                        downloaded_size: str = ""):
         """Atualiza progresso de uma tarefa"""
-        with self.lock:
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
                 task.progress = progress
@@ -114,7 +312,7 @@ class DownloadQueue:
     
     def start_task(self, task_id: str):
         """Marca tarefa como iniciada"""
-        with self.lock:
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
                 task.status = DownloadStatus.DOWNLOADING.value
@@ -130,7 +328,7 @@ class DownloadQueue:
     
     def complete_task(self, task_id: str, output_path: str):
         """Marca tarefa como completada"""
-        with self.lock:
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
                 task.status = DownloadStatus.COMPLETED.value
@@ -140,13 +338,14 @@ class DownloadQueue:
                 
                 if task_id in self.active:
                     self.active.remove(task_id)
+                self._wakeup.set()
                 
                 if self.on_complete:
                     self.on_complete(task)
     
     def fail_task(self, task_id: str, error: str):
         """Marca tarefa como falha"""
-        with self.lock:
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
                 task.status = DownloadStatus.FAILED.value
@@ -154,49 +353,68 @@ class DownloadQueue:
                 
                 if task_id in self.active:
                     self.active.remove(task_id)
+                self._wakeup.set()
                 
                 if self.on_error:
                     self.on_error(task)
     
     def pause_task(self, task_id: str):
-        """Pausa uma tarefa"""
-        with self.lock:
+        """
+        Pausa uma tarefa
+        
+        O slot é liberado na hora; o download em execução para no próximo
+        bloco e mantém o .part para a retomada.
+        """
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
-                if task.status == DownloadStatus.DOWNLOADING.value:
+                if task.status in (DownloadStatus.DOWNLOADING.value, DownloadStatus.WAITING.value):
                     task.status = DownloadStatus.PAUSED.value
+                    task.speed = "0 KB/s"
                     
                     if task_id in self.active:
                         self.active.remove(task_id)
-                    if task_id not in self.queue:
-                        self.queue.insert(0, task_id)  # Volta para início da fila
+                    if task_id in self.queue:
+                        self.queue.remove(task_id)
+                    self._signal(task_id, DownloadStatus.PAUSED.value)
+        self._wakeup.set()
     
     def resume_task(self, task_id: str):
-        """Resume uma tarefa pausada"""
-        with self.lock:
+        """
+        Resume uma tarefa pausada (volta ao início da fila; o .part é continuado)
+        
+        Se a execução pausada ainda está encerrando, o despachante só a inicia
+        de novo depois que ela terminar (ver claim_next_task).
+        """
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
                 if task.status == DownloadStatus.PAUSED.value:
                     task.status = DownloadStatus.WAITING.value
                     
                     if task_id not in self.queue:
-                        self.queue.append(task_id)
+                        self.queue.insert(0, task_id)
+        self._wakeup.set()
     
     def cancel_task(self, task_id: str):
-        """Cancela uma tarefa"""
-        with self.lock:
+        """Cancela uma tarefa (o download em execução para e remove os arquivos parciais)"""
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
+                if task.status == DownloadStatus.COMPLETED.value:
+                    return
                 task.status = DownloadStatus.CANCELED.value
                 
                 if task_id in self.queue:
                     self.queue.remove(task_id)
                 if task_id in self.active:
                     self.active.remove(task_id)
+                self._signal(task_id, DownloadStatus.CANCELED.value)
+        self._wakeup.set()
     
     def retry_task(self, task_id: str):
         """Tenta novamente uma tarefa falha"""
-        with self.lock:
+        with self._locked():
             if task_id in self.tasks:
                 task = self.tasks[task_id]
                 if task.status in [DownloadStatus.FAILED.value, DownloadStatus.CANCELED.value]:
@@ -208,28 +426,30 @@ class DownloadQueue:
                     
                     if task_id not in self.queue:
                         self.queue.append(task_id)
+        self._wakeup.set()
     
     def remove_task(self, task_id: str):
         """Remove completamente uma tarefa"""
-        with self.lock:
+        with self._locked():
             if task_id in self.tasks:
                 if task_id in self.queue:
                     self.queue.remove(task_id)
                 if task_id in self.active:
                     self.active.remove(task_id)
+                self._signal(task_id, DownloadStatus.CANCELED.value)
                 del self.tasks[task_id]
     
     # Operações em massa
     
     def pause_all(self):
-        """Pausa todos os downloads ativos"""
-        with self.lock:
-            for task_id in list(self.active):
+        """Pausa todos os downloads ativos e os que aguardam na fila"""
+        with self._locked():
+            for task_id in list(self.active) + list(self.queue):
                 self.pause_task(task_id)
     
     def resume_all(self):
         """Resume todos os downloads pausados"""
-        with self.lock:
+        with self._locked():
             paused_tasks = [
                 task_id for task_id, task in self.tasks.items()
                 if task.status == DownloadStatus.PAUSED.value
@@ -239,14 +459,14 @@ class DownloadQueue:
     
     def cancel_all(self):
         """Cancela todos os downloads"""
-        with self.lock:
+        with self._locked():
             all_task_ids = list(self.queue) + list(self.active)
             for task_id in all_task_ids:
                 self.cancel_task(task_id)
     
     def retry_all(self):
         """Tenta novamente todos os downloads falhados"""
-        with self.lock:
+        with self._locked():
             failed_tasks = [
                 task_id for task_id, task in self.tasks.items()
                 if task.status == DownloadStatus.FAILED.value
@@ -256,7 +476,7 @@ class DownloadQueue:
     
     def clear_completed(self):
         """Remove todos os downloads completados"""
-        with self.lock:
+        with self._locked():
             completed_tasks = [
                 task_id for task_id, task in self.tasks.items()
                 if task.status == DownloadStatus.COMPLETED.value
@@ -266,7 +486,7 @@ class DownloadQueue:
     
     def clear_all(self):
         """Limpa toda a fila (exceto downloads ativos)"""
-        with self.lock:
+        with self._locked():
             # Remove apenas tarefas não ativas
             inactive_tasks = [
                 task_id for task_id, task in self.tasks.items()
@@ -279,7 +499,7 @@ class DownloadQueue:
     
     def get_all_tasks(self) -> Dict[str, List[DownloadTask]]:
         """Retorna todas as tarefas organizadas por status"""
-        with self.lock:
+        with self._locked(write=False):
             result = {
                 'queue': [],
                 'active': [],
@@ -304,7 +524,7 @@ class DownloadQueue:
     
     def get_statistics(self) -> Dict:
         """Retorna estatísticas da fila"""
-        with self.lock:
+        with self._locked(write=False):
             stats = {
                 'total': len(self.tasks),
                 'waiting': 0,
@@ -338,11 +558,83 @@ class DownloadQueue:
         return len(self.active) < self.max_parallel
     
     def get_next_task(self) -> Optional[str]:
-        """Retorna próxima tarefa da fila (se houver slot disponível)"""
-        with self.lock:
-            if self.queue and self.can_start_download():
-                return self.queue[0]
+        """
+        Retorna próxima tarefa da fila (se houver slot disponível)
+        
+        Tarefas cuja execução anterior ainda não terminou (pausa seguida de
+        retomada) são puladas até a thread antiga encerrar.
+        """
+        with self._locked(write=False):
+            if not self.can_start_download():
+                return None
+            for task_id in self.queue:
+                if self._run_finished(self.tasks[task_id]):
+                    return task_id
             return None
+    
+    def claim_next_task(self) -> Optional[DownloadTask]:
+        """
+        Retira a próxima tarefa da fila e a marca como em download (atômico entre workers)
+        
+        Cria um token novo para esta execução: uma execução anterior ainda
+        encerrando (pausa seguida de retomada) continua vendo o seu.
+        """
+        with self._locked():
+            task_id = self.get_next_task()
+            if task_id is None:
+                return None
+            self.start_task(task_id)
+            token = self._tokens[task_id] = CancellationToken()
+            self.tasks[task_id].run_owner = token.owner
+            return self.tasks[task_id]
+    
+    # Execução
+    
+    def start_dispatcher(self, runner: Callable[[DownloadTask, CancellationToken], None],
+                         poll_sec: float = 2.0):
+        """
+        Inicia (uma vez por processo) a thread que executa a fila
+        
+        runner(task, token) roda numa thread própria por tarefa; deve chamar
+        complete_task/fail_task e verificar o token. Slots liberados (conclusão, pausa,
+        cancelamento) acordam o despachante imediatamente.
+        """
+        with self.lock:
+            if self._dispatcher_pid == os.getpid():
+                return
+            self._dispatcher_pid = os.getpid()
+        
+        def _run(task: DownloadTask, token: CancellationToken):
+            try:
+                runner(task, token)
+            except Exception as e:
+                logger.error(f"❌ Tarefa {task.id} falhou: {e}")
+                self.fail_task(task.id, str(e))
+            finally:
+                self.release_token(task.id, token)
+                self._wakeup.set()
+        
+        def _loop():
+            while self.running:
+                self._wakeup.wait(poll_sec)
+                self._wakeup.clear()
+                try:
+                    while True:
+                        task = self.claim_next_task()
+                        if task is None:
+                            break
+                        threading.Thread(target=_run, args=(task, self._tokens[task.id]),
+                                         name=f'queue-{task.id[:8]}', daemon=True).start()
+                except Exception as e:
+                    logger.warning(f"⚠️ Despachante da fila: {e}")
+        
+        threading.Thread(target=_loop, name='queue-dispatcher', daemon=True).start()
+    
+    def set_output_template(self, task_id: str, template: str):
+        """Fixa o template de saída da tarefa (retomada usa o mesmo arquivo)"""
+        with self._locked():
+            if task_id in self.tasks:
+                self.tasks[task_id].output_template = template
 
 
 # Instância global
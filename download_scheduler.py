@@ -0,0 +1,555 @@
+"""
+Agendador de Downloads
+Limite global de banda (token bucket) compartilhado por todos os downloads
+Sub-limites por plataforma e perfis por horário do dia
+Cortesia por host: downloads simultâneos e requisições/min por plataforma
+Estado opcionalmente em backend compartilhado (vários workers)
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Deque, Dict, Any, Optional, List
+
+from state_backend import process_alive
+
+logger = logging.getLogger(__name__)
+
+
+def _monotonic_clock() -> float:
+    return time.monotonic()
+
+
+def _wall_clock() -> float:
+    """Relógio comum a todos os processos (buckets e backoff no estado compartilhado)"""
+    return time.time()
+
+
+class TokenBucket:
+    """
+    Token bucket com débito: reserve(n) sempre concede e devolve quanto esperar
+
+    Permite blocos grandes (o yt-dlp lê até alguns MB por vez) sem travar:
+    o chamador dorme o tempo necessário para pagar o débito.
+    """
+
+    def __init__(self, rate_bps: float = 0, burst_sec: float = 1.0, full: bool = False,
+                 clock: Optional[Callable[[], float]] = None):
+        self.burst_sec = burst_sec
+        self._clock = clock or _monotonic_clock
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.tokens = 0.0
+        self._last = self._clock()
+        self.set_rate(rate_bps)
+        if full:
+            self.tokens = self.rate * self.burst_sec
+
+    @classmethod
+    def from_state(cls, state: Optional[Dict[str, float]], rate_bps: float, burst_sec: float = 1.0,
+                   full: bool = False, clock: Optional[Callable[[], float]] = None) -> 'TokenBucket':
+        """Recria o bucket a partir de to_state() (ou novo, se state vazio) com a taxa vigente"""
+        if not state:
+            return cls(rate_bps, burst_sec, full=full, clock=clock)
+        bucket = cls(burst_sec=burst_sec, clock=clock)
+        bucket.rate, bucket.tokens, bucket._last = state['rate'], state['tokens'], state['last']
+        bucket.set_rate(rate_bps)
+        return bucket
+
+    def to_state(self) -> Dict[str, float]:
+        """Saldo serializável (JSON) para guardar no backend compartilhado"""
+        with self._lock:
+            return {'rate': self.rate, 'tokens': self.tokens, 'last': self._last}
+
+    def set_rate(self, rate_bps: float):
+        with self._lock:
+            self._refill()
+            self.rate = max(0.0, float(rate_bps or 0))
+            self.tokens = min(self.tokens, self.rate * self.burst_sec) if self.rate else 0.0
+
+    def _refill(self):
+        now = self._clock()
+        if self.rate:
+            # max(0, ...): o relógio de parede pode voltar (ajuste de NTP)
+            elapsed = max(0.0, now - self._last)
+            self.tokens = min(self.rate * self.burst_sec, self.tokens + elapsed * self.rate)
+        self._last = now
+
+    def reserve(self, nbytes: int) -> float:
+        """Consome nbytes; retorna segundos de espera (0 se ilimitado ou com saldo)"""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self.tokens -= nbytes
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+def _parse_hhmm(value: str) -> int:
+    hours, minutes = str(value).split(':', 1)
+    return int(hours) * 60 + int(minutes)
+
+
+class DownloadScheduler:
+    """
+    Limites de banda compartilhados por todos os downloads do processo
+
+    - Global: um bucket para a soma de todas as transferências
+    - Por plataforma: bucket adicional opcional (ex.: YouTube 5 MB/s)
+    - Banda não usada por uma transferência fica disponível para as demais,
+      pois todas consomem do mesmo bucket
+    - Perfis por horário: bandwidth_schedule sobrepõe o limite global
+    - Cortesia por host: cada plataforma tem um número máximo de transferências
+      simultâneas e de requisições por minuto; quem espera um host ocupado não
+      bloqueia os demais, então downloads de hosts diferentes se intercalam
+    - Após um 429 (Too Many Requests) o host fica com 1 slot por host_backoff_sec
+    - Com attach_backend(), buckets, vagas por host e backoff ficam no estado
+      compartilhado: vários workers respeitam os mesmos limites
+
+    Configuração (config.json, via config_provider):
+        bandwidth_limit_kbps: int (0 = ilimitado)
+        bandwidth_platform_limits_kbps: {"YouTube": 4000, ...}
+        bandwidth_schedule: [{"start": "08:00", "end": "18:00", "limit_kbps": 2000}, ...]
+        host_max_concurrent: {"YouTube": 3, ...} (0 = ilimitado)
+        host_default_max_concurrent: int (padrão 4)
+        host_requests_per_minute: {"YouTube": 60, ...} (0 = ilimitado)
+        host_default_requests_per_minute: int (padrão 0)
+        host_backoff_sec: int (padrão 120)
+    """
+
+    REFRESH_INTERVAL_SEC = 30.0
+    DEFAULT_HOST_MAX_CONCURRENT = 4
+    DEFAULT_HOST_BACKOFF_SEC = 120.0
+    # Rajada de requisições permitida antes do espaçamento (em requisições)
+    HOST_REQUEST_BURST = 3
+    # Reavaliação periódica de quem espera (limites podem mudar via refresh)
+    HOST_WAIT_POLL_SEC = 5.0
+    # Com estado compartilhado, vagas liberadas por outro processo só são vistas consultando
+    HOST_SHARED_POLL_SEC = 0.25
+
+    def __init__(self, config_provider: Optional[Callable[[], Dict[str, Any]]] = None):
+        self._config_provider = config_provider or (lambda: {})
+        self._lock = threading.Lock()
+        self._global = TokenBucket()
+        self._platforms: Dict[str, TokenBucket] = {}
+        self._platform_limits: Dict[str, float] = {}
+        self._global_limit = 0.0
+        self._active: Dict[str, int] = {}
+        self._refreshed_at = 0.0
+        # Cortesia por host (plataforma de detect_platform)
+        self._host_cond = threading.Condition(self._lock)
+        self._host_waiting: Dict[str, Deque[object]] = {}
+        self._host_limits: Dict[str, int] = {}
+        self._host_default_limit = self.DEFAULT_HOST_MAX_CONCURRENT
+        self._host_rpm: Dict[str, float] = {}
+        self._host_default_rpm = 0.0
+        self._host_backoff_sec = self.DEFAULT_HOST_BACKOFF_SEC
+        self._host_backoff_until: Dict[str, float] = {}
+        self._request_buckets: Dict[str, TokenBucket] = {}
+        # Backend compartilhado (state_backend); None = só memória do processo
+        self.backend = None
+
+    def attach_backend(self, backend, reset: bool = False) -> None:
+        """
+        Passa a manter buckets, vagas por host e backoff no backend compartilhado
+
+        Cada débito/vaga é uma transação curta no backend (BEGIN IMMEDIATE no
+        SQLite); o relógio passa a ser o de parede, comum a todos os processos.
+        reset=True (início do servidor, antes dos workers) descarta vagas de uma
+        execução anterior: após reiniciar, o pid de quem as tinha pode ter sido reutilizado.
+        """
+        if reset:
+            with backend.transaction('hosts') as hosts:
+                for host in hosts.values():
+                    host['active'], host['waiting'] = [], []
+        with self._lock:
+            self.backend = backend
+
+    def _now(self) -> float:
+        return _wall_clock() if self.backend is not None else time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Configuração
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _scheduled_limit(schedule: List[Dict[str, Any]], default_kbps: float,
+                         now: Optional[datetime] = None) -> float:
+        """Limite (kbps) do perfil de horário vigente; intervalos podem cruzar a meia-noite"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for entry in schedule or []:
+            try:
+                start, end = _parse_hhmm(entry['start']), _parse_hhmm(entry['end'])
+            except (KeyError, ValueError):
+                continue
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return float(entry.get('limit_kbps') or 0)
+        return float(default_kbps or 0)
+
+    def refresh(self, force: bool = False):
+        """Relê a configuração (no máximo a cada REFRESH_INTERVAL_SEC)"""
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.REFRESH_INTERVAL_SEC:
+            return
+        config = self._config_provider() or {}
+        with self._lock:
+            self._refreshed_at = now
+            global_kbps = self._scheduled_limit(
+                config.get('bandwidth_schedule') or [],
+                config.get('bandwidth_limit_kbps', 0)
+            )
+            self._global_limit = global_kbps * 1024
+            self._global.set_rate(self._global_limit)
+            self._platform_limits = {
+                name: float(kbps or 0) * 1024
+                for name, kbps in (config.get('bandwidth_platform_limits_kbps') or {}).items()
+            }
+            for name, bucket in self._platforms.items():
+                bucket.set_rate(self._platform_limits.get(name, 0))
+
+            self._host_limits = {
+                name: max(0, int(limit or 0))
+                for name, limit in (config.get('host_max_concurrent') or {}).items()
+            }
+            self._host_default_limit = max(0, int(config.get(
+                'host_default_max_concurrent', self.DEFAULT_HOST_MAX_CONCURRENT) or 0))
+            self._host_rpm = {
+                name: max(0.0, float(rpm or 0))
+                for name, rpm in (config.get('host_requests_per_minute') or {}).items()
+            }
+            self._host_default_rpm = max(0.0, float(config.get('host_default_requests_per_minute', 0) or 0))
+            self._host_backoff_sec = float(config.get('host_backoff_sec', self.DEFAULT_HOST_BACKOFF_SEC) or 0)
+            for name, bucket in self._request_buckets.items():
+                bucket.set_rate(self._host_rpm.get(name, self._host_default_rpm) / 60)
+            # Limites podem ter aumentado: reavalia quem espera
+            self._host_cond.notify_all()
+
+    def _platform_bucket(self, platform: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._platforms.get(platform)
+            if bucket is None:
+                bucket = TokenBucket(self._platform_limits.get(platform, 0))
+                self._platforms[platform] = bucket
+            return bucket
+
+    # ------------------------------------------------------------------
+    # Cortesia por host
+    # ------------------------------------------------------------------
+
+    def _host_capacity(self, platform: str, backoff_until: Optional[float] = None) -> int:
+        """Slots simultâneos do host (0 = ilimitado; 1 durante backoff; chamado sob lock)"""
+        if backoff_until is None:
+            backoff_until = self._host_backoff_until.get(platform, 0)
+        if backoff_until > self._now():
+            return 1
+        return self._host_limits.get(platform, self._host_default_limit)
+
+    def _host_ready(self, platform: str, ticket: object) -> bool:
+        """Primeiro da fila do host e com slot livre (chamado sob lock)"""
+        capacity = self._host_capacity(platform)
+        has_room = not capacity or self._active.get(platform, 0) < capacity
+        return has_room and self._host_waiting[platform][0] is ticket
+
+    def _acquire_host(self, platform: str, on_wait: Optional[Callable[[], None]] = None) -> object:
+        """
+        Bloqueia até haver slot no host (ordem de chegada por host)
+
+        on_wait é chamado uma vez, fora do lock, se for preciso esperar
+        (ex.: marcar o download como 'queued'). Retorna o ticket da vaga,
+        usado em _release_host().
+        """
+        self.refresh()
+        if self.backend is not None:
+            return self._acquire_shared_host(platform, on_wait)
+        ticket = object()
+        with self._host_cond:
+            queue = self._host_waiting.setdefault(platform, deque())
+            queue.append(ticket)
+            ready = self._host_ready(platform, ticket)
+        try:
+            if not ready:
+                if on_wait:
+                    on_wait()
+                logger.info(f"⏳ Aguardando slot de {platform}")
+            with self._host_cond:
+                while not self._host_ready(platform, ticket):
+                    self._host_cond.wait(self.HOST_WAIT_POLL_SEC)
+                self._active[platform] = self._active.get(platform, 0) + 1
+        finally:
+            with self._host_cond:
+                queue.remove(ticket)
+                if not queue:
+                    self._host_waiting.pop(platform, None)
+                # O próximo da fila pode estar pronto agora
+                self._host_cond.notify_all()
+        return ticket
+
+    def _release_host(self, platform: str, ticket: object):
+        if self.backend is not None:
+            with self.backend.transaction('hosts') as hosts:
+                host = hosts.get(platform)
+                if host and ticket in host['active']:
+                    host['active'].remove(ticket)
+            with self._host_cond:
+                self._host_cond.notify_all()
+            return
+        with self._host_cond:
+            self._active[platform] -= 1
+            if not self._active[platform]:
+                del self._active[platform]
+            self._host_cond.notify_all()
+
+    def _reap_hosts(self, hosts: Dict[str, Any]):
+        """Descarta vagas e lugares na fila de processos que morreram (dentro da transação)"""
+        alive: Dict[str, bool] = {}
+        now = self._now()
+        for platform, host in list(hosts.items()):
+            for field in ('active', 'waiting'):
+                kept = []
+                for ticket in host.get(field, []):
+                    pid = ticket.partition(':')[0]
+                    if pid not in alive:
+                        alive[pid] = process_alive(pid)
+                    if alive[pid]:
+                        kept.append(ticket)
+                host[field] = kept
+            if not host['active'] and not host['waiting'] and host.get('backoff_until', 0) <= now:
+                del hosts[platform]
+
+    def _claim_shared_slot(self, platform: str, ticket: str) -> bool:
+        """Entra na fila compartilhada do host e ocupa a vaga se for a vez (uma transação)"""
+        with self.backend.transaction('hosts') as hosts:
+            self._reap_hosts(hosts)
+            host = hosts.setdefault(platform, {'active': [], 'waiting': []})
+            if ticket not in host['waiting']:
+                host['waiting'].append(ticket)
+            with self._lock:
+                capacity = self._host_capacity(platform, host.get('backoff_until', 0))
+            if host['waiting'][0] != ticket or (capacity and len(host['active']) >= capacity):
+                return False
+            host['waiting'].pop(0)
+            host['active'].append(ticket)
+            return True
+
+    def _acquire_shared_host(self, platform: str, on_wait: Optional[Callable[[], None]] = None) -> str:
+        """Como _acquire_host(), com fila e vagas no backend (ordem de chegada entre processos)"""
+        ticket = f"{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        acquired = False
+        try:
+            acquired = self._claim_shared_slot(platform, ticket)
+            if not acquired:
+                if on_wait:
+                    on_wait()
+                logger.info(f"⏳ Aguardando slot de {platform}")
+            while not acquired:
+                # Liberações deste processo acordam na hora; as de outros, na próxima consulta
+                with self._host_cond:
+                    self._host_cond.wait(self.HOST_SHARED_POLL_SEC)
+                acquired = self._claim_shared_slot(platform, ticket)
+        finally:
+            if not acquired:
+                with self.backend.transaction('hosts') as hosts:
+                    host = hosts.get(platform)
+                    if host and ticket in host['waiting']:
+                        host['waiting'].remove(ticket)
+        return ticket
+
+    def _host_table(self) -> Dict[str, Dict[str, Any]]:
+        """Transferências ativas, fila e fim do backoff por host"""
+        if self.backend is not None:
+            hosts = self.backend.get('hosts') or {}
+            return {
+                platform: {
+                    'active': len(host.get('active', [])),
+                    'waiting': len(host.get('waiting', [])),
+                    'backoff_until': host.get('backoff_until', 0)
+                }
+                for platform, host in hosts.items()
+            }
+        with self._lock:
+            return {
+                platform: {
+                    'active': self._active.get(platform, 0),
+                    'waiting': len(self._host_waiting.get(platform, ())),
+                    'backoff_until': self._host_backoff_until.get(platform, 0)
+                }
+                for platform in set(self._active) | set(self._host_waiting) | set(self._host_backoff_until)
+            }
+
+    def _reserve_shared(self, key: str, rates: Dict[str, float], nbytes: int,
+                        burst_sec: float = 1.0, full: bool = False) -> float:
+        """
+        Debita nbytes dos buckets (nome -> taxa) guardados no backend, numa transação
+
+        Buckets ilimitados não tocam o backend. Retorna a maior espera.
+        """
+        limited = {name: rate for name, rate in rates.items() if rate}
+        if not limited:
+            return 0.0
+        delay = 0.0
+        with self.backend.transaction(key) as buckets:
+            for name, rate in limited.items():
+                bucket = TokenBucket.from_state(buckets.get(name), rate, burst_sec, full=full, clock=_wall_clock)
+                delay = max(delay, bucket.reserve(nbytes))
+                buckets[name] = bucket.to_state()
+        return delay
+
+    def pace_request(self, platform: str):
+        """
+        Espaça requisições ao host conforme host_requests_per_minute
+
+        Chamado antes de cada extração/busca (ex.: ytsearch do Spotify avançado).
+        """
+        self.refresh()
+        rate = self._host_rpm.get(platform, self._host_default_rpm) / 60
+        burst_sec = self.HOST_REQUEST_BURST / rate if rate else 1.0
+        if self.backend is not None:
+            delay = self._reserve_shared('requests', {platform: rate}, 1, burst_sec=burst_sec, full=True)
+        else:
+            with self._lock:
+                bucket = self._request_buckets.get(platform)
+                if bucket is None:
+                    bucket = TokenBucket(rate, burst_sec=burst_sec, full=True)
+                    self._request_buckets[platform] = bucket
+            delay = bucket.reserve(1)
+        if delay > 0:
+            time.sleep(delay)
+
+    def report_error(self, platform: str, error) -> bool:
+        """
+        Registra falha de um download; em 429 o host entra em backoff
+
+        Returns:
+            True se o erro foi identificado como limitação de taxa
+        """
+        message = str(error)
+        if '429' not in message and 'too many requests' not in message.lower():
+            return False
+        self.refresh()
+        backoff_until = self._now() + self._host_backoff_sec
+        if self.backend is not None:
+            with self.backend.transaction('hosts') as hosts:
+                hosts.setdefault(platform, {'active': [], 'waiting': []})['backoff_until'] = backoff_until
+        else:
+            with self._host_cond:
+                self._host_backoff_until[platform] = backoff_until
+        logger.warning(f"🐢 {platform} respondeu 429: 1 download por vez nos próximos "
+                       f"{self._host_backoff_sec:.0f}s")
+        return True
+
+    # ------------------------------------------------------------------
+    # Transferências
+    # ------------------------------------------------------------------
+
+    def throttle(self, platform: str, nbytes: int):
+        """Debita nbytes dos buckets global e da plataforma e dorme se necessário"""
+        if nbytes <= 0:
+            return
+        self.refresh()
+        if self.backend is not None:
+            delay = self._reserve_shared('bandwidth', {
+                'global': self._global_limit,
+                f'platform:{platform}': self._platform_limits.get(platform, 0)
+            }, nbytes)
+        else:
+            delay = max(self._global.reserve(nbytes), self._platform_bucket(platform).reserve(nbytes))
+        if delay > 0:
+            time.sleep(delay)
+
+    def make_progress_hook(self, platform: str) -> Callable[[Dict[str, Any]], None]:
+        """
+        Hook de progresso do yt-dlp que aplica o limite
+
+        O hook roda na thread do download a cada bloco lido; dormir aqui
+        atrasa a próxima leitura, o que limita a taxa real da conexão.
+        O primeiro relatório de cada arquivo só serve de base (yt-dlp soma o
+        tamanho já retomado em downloaded_bytes).
+        """
+        last_bytes: Dict[str, int] = {}
+
+        def _hook(d):
+            key = d.get('filename') or ''
+            if d.get('status') == 'downloading':
+                downloaded = d.get('downloaded_bytes') or 0
+                if key not in last_bytes:
+                    # Retomada de .part: downloaded_bytes já inclui o que está no
+                    # disco; só o que veio da rede nesta execução é cobrado
+                    last_bytes[key] = d.get('resume_len') or downloaded
+                delta = max(0, downloaded - last_bytes[key])
+                last_bytes[key] = downloaded
+                self.throttle(platform, delta)
+            elif d.get('status') in ('finished', 'error'):
+                last_bytes.pop(key, None)
+
+        return _hook
+
+    @contextmanager
+    def transfer(self, platform: str, on_wait: Optional[Callable[[], None]] = None):
+        """
+        Transferência ativa no host: espera slot e ritmo de requisições, depois
+        entrega o hook de banda (também usado no cálculo da fatia de subprocessos)
+        """
+        ticket = self._acquire_host(platform, on_wait=on_wait)
+        try:
+            self.pace_request(platform)
+            yield self.make_progress_hook(platform)
+        finally:
+            self._release_host(platform, ticket)
+
+    def subprocess_rate_limit(self, platform: str) -> int:
+        """
+        Limite (bytes/s) para processos externos que não passam pelo hook (ex.: spotdl)
+
+        Fatia justa do limite global entre as transferências ativas, respeitando
+        o sub-limite da plataforma. 0 = ilimitado.
+        """
+        self.refresh()
+        active = sum(host['active'] for host in self._host_table().values()) + 1
+        with self._lock:
+            share = self._global_limit / active if self._global_limit else 0
+            platform_limit = self._platform_limits.get(platform, 0)
+        limits = [limit for limit in (share, platform_limit) if limit]
+        return int(min(limits)) if limits else 0
+
+    def get_status(self) -> Dict[str, Any]:
+        """Limites vigentes e transferências ativas por plataforma"""
+        self.refresh()
+        table = self._host_table()
+        with self._lock:
+            now = self._now()
+            hosts = {}
+            for platform, host in table.items():
+                hosts[platform] = {
+                    'active': host['active'],
+                    'waiting': host['waiting'],
+                    'max_concurrent': self._host_capacity(platform, host['backoff_until']),
+                    'requests_per_minute': self._host_rpm.get(platform, self._host_default_rpm),
+                    'backoff_remaining_sec': max(0.0, host['backoff_until'] - now)
+                }
+            return {
+                'global_limit_kbps': self._global_limit / 1024,
+                'platform_limits_kbps': {k: v / 1024 for k, v in self._platform_limits.items()},
+                'active_transfers': {p: host['active'] for p, host in table.items() if host['active']},
+                'hosts': hosts
+            }
+
+
+# Instância global (singleton)
+_scheduler_instance: Optional[DownloadScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_download_scheduler(**kwargs) -> DownloadScheduler:
+    """Retorna instância global do agendador (kwargs só valem na primeira chamada)"""
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            _scheduler_instance = DownloadScheduler(**kwargs)
+    return _scheduler_instance
@@ -0,0 +1,593 @@
+"""
+Catálogo de Arquivos Baixados
+SQLite com tamanho/mtime/inode/hash de cada arquivo em downloads/
+Listagem paginada sem varrer o disco; reconciliação periódica em segundo plano
+Deduplicação em segundo plano: mesmo conteúdo vira hardlink
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple, List
+
+logger = logging.getLogger(__name__)
+
+# Ordenações aceitas por list_files() -> coluna indexada
+_SORT_COLUMNS = {'modified': 'mtime', 'name': 'name', 'size': 'size'}
+
+
+def _totals_add(ref: str) -> str:
+    return f'''
+            INSERT INTO catalog_totals (platform, media_type, files, bytes)
+            VALUES (COALESCE({ref}.platform, ''), COALESCE({ref}.media_type, ''), 1, {ref}.size)
+            ON CONFLICT(platform, media_type) DO UPDATE SET
+                files = files + 1,
+                bytes = bytes + excluded.bytes;'''
+
+
+def _totals_remove(ref: str) -> str:
+    return f'''
+            UPDATE catalog_totals SET files = files - 1, bytes = bytes - {ref}.size
+            WHERE platform = COALESCE({ref}.platform, '') AND media_type = COALESCE({ref}.media_type, '');'''
+
+
+# Totais por (plataforma, tipo) mantidos pelo próprio SQLite a cada escrita no catálogo
+_TOTALS_TRIGGERS = {
+    'trg_totals_insert': f'''
+        AFTER INSERT ON catalog_files BEGIN
+            {_totals_add('NEW')}
+        END''',
+    'trg_totals_delete': f'''
+        AFTER DELETE ON catalog_files BEGIN
+            {_totals_remove('OLD')}
+        END''',
+    'trg_totals_update': f'''
+        AFTER UPDATE OF size, platform, media_type ON catalog_files BEGIN
+            {_totals_remove('OLD')}
+            {_totals_add('NEW')}
+        END''',
+}
+
+# Pastas de primeiro nível que não seguem o layout <tipo>/<plataforma>
+_TOP_LEVEL_PLATFORMS = {'spotify': ('audio', 'Spotify')}
+
+
+def classify_path(rel_path: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Deduz (media_type, platform) do caminho relativo à pasta de downloads
+
+    downloads/audio/YouTube/... -> ('audio', 'YouTube')
+    downloads/spotify/...       -> ('audio', 'Spotify')
+    """
+    parts = Path(rel_path).parts
+    if not parts:
+        return None, None
+    if parts[0] in _TOP_LEVEL_PLATFORMS:
+        return _TOP_LEVEL_PLATFORMS[parts[0]]
+    if parts[0] in ('audio', 'video') and len(parts) > 2:
+        return parts[0], parts[1]
+    return None, None
+
+
+class FileCatalog:
+    """
+    Catálogo persistente dos arquivos baixados
+
+    - record_file() é chamado ao concluir cada download
+    - Dedupe: pré-filtro por tamanho, hash em blocos só quando há colisão,
+      duplicatas no mesmo disco são trocadas por hardlink para o original
+    - Vários workers: reconciliação periódica e backfill de dedupe rodam em um
+      só por vez (reserva em catalog_meta)
+    """
+
+    HASH_CHUNK_BYTES = 1024 * 1024
+    # Reserva da rodada inicial: workers que sobem juntos não repetem a varredura
+    STARTUP_LEASE_SEC = 60
+    # Arquivos internos (bancos, índices) não entram no catálogo
+    IGNORED_SUFFIXES = ('.db', '.db-wal', '.db-shm', '.db-journal', '.part', '.ytdl', '.dedupe-tmp')
+    IGNORED_NAMES = ('.seq', '.artists_index.json', 'download_archive.txt')
+
+    def __init__(self, root: str = 'downloads', db_path: Optional[str] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path) if db_path else self.root / 'file_catalog.db'
+        self._dedupe_queue: 'queue.Queue[str]' = queue.Queue()
+        self._dedupe_thread: Optional[threading.Thread] = None
+        self._dedupe_lock = threading.Lock()
+        self._reconcile_thread: Optional[threading.Thread] = None
+        self._reconcile_wakeup = threading.Event()
+        self._reconcile_lock = threading.Lock()
+        self._init_db()
+        logger.info(f"🗂️ Catálogo de arquivos: {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Cria tabelas se não existirem"""
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_files (
+                path TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                dev INTEGER,
+                inode INTEGER,
+                digest TEXT,
+                digest_mtime REAL,
+                platform TEXT,
+                media_type TEXT,
+                added_at DATETIME NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_size ON catalog_files(size)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_mtime ON catalog_files(mtime)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_name ON catalog_files(name)')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_catalog_platform
+            ON catalog_files(platform, media_type, mtime)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_catalog_digest
+            ON catalog_files(digest) WHERE digest IS NOT NULL
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.executemany(
+            'INSERT OR IGNORE INTO catalog_meta (name, value) VALUES (?, 0)',
+            [('dedupe_linked_files',), ('dedupe_reclaimed_bytes',)]
+        )
+
+        # Totais incrementais para /api/disk-space (sem varrer o disco)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_totals (
+                platform TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                files INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (platform, media_type)
+            ) WITHOUT ROWID
+        ''')
+        for trigger_name, body in _TOTALS_TRIGGERS.items():
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}')
+        counted = conn.execute('SELECT COALESCE(SUM(files), 0) FROM catalog_totals').fetchone()[0]
+        cataloged = conn.execute('SELECT COUNT(*) FROM catalog_files').fetchone()[0]
+        if counted != cataloged:
+            # Banco anterior aos totais: calcula uma vez de forma exata
+            self._recompute_totals(conn)
+        conn.commit()
+        conn.close()
+
+    def _recompute_totals(self, conn: sqlite3.Connection):
+        """Recalcula catalog_totals a partir de catalog_files"""
+        conn.execute('DELETE FROM catalog_totals')
+        conn.execute('''
+            INSERT INTO catalog_totals (platform, media_type, files, bytes)
+            SELECT COALESCE(platform, ''), COALESCE(media_type, ''), COUNT(*), SUM(size)
+            FROM catalog_files
+            GROUP BY COALESCE(platform, ''), COALESCE(media_type, '')
+        ''')
+
+    def _relative(self, path) -> Optional[str]:
+        """Caminho relativo à raiz (com '/'), ou None se estiver fora dela"""
+        try:
+            rel = Path(os.path.abspath(path)).relative_to(os.path.abspath(self.root))
+        except ValueError:
+            return None
+        return rel.as_posix()
+
+    def _is_ignored(self, name: str) -> bool:
+        return name in self.IGNORED_NAMES or name.endswith(self.IGNORED_SUFFIXES)
+
+    def record_file(self, path, platform: Optional[str] = None,
+                    media_type: Optional[str] = None, dedupe: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Registra (ou atualiza) um arquivo concluído no catálogo
+
+        Args:
+            path: Caminho do arquivo (absoluto ou relativo ao cwd)
+            platform / media_type: Se omitidos, deduzidos do caminho
+            dedupe: Enfileira o arquivo para deduplicação em segundo plano
+
+        Returns:
+            Dict com a entrada gravada ou None se o arquivo não existe/está fora da raiz
+        """
+        rel = self._relative(path)
+        if rel is None or self._is_ignored(Path(rel).name):
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        guessed_type, guessed_platform = classify_path(rel)
+        entry = {
+            'path': rel,
+            'name': Path(rel).name,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'dev': st.st_dev,
+            'inode': st.st_ino,
+            'platform': platform or guessed_platform,
+            'media_type': media_type or guessed_type,
+        }
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO catalog_files (path, name, size, mtime, dev, inode, platform, media_type, added_at)
+            VALUES (:path, :name, :size, :mtime, :dev, :inode, :platform, :media_type, datetime('now'))
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size,
+                mtime = excluded.mtime,
+                dev = excluded.dev,
+                inode = excluded.inode,
+                platform = COALESCE(excluded.platform, platform),
+                media_type = COALESCE(excluded.media_type, media_type)
+        ''', entry)
+        conn.commit()
+        conn.close()
+
+        if dedupe and self._dedupe_thread is not None:
+            self._dedupe_queue.put(rel)
+        return entry
+
+    def forget_file(self, path):
+        """Remove um arquivo do catálogo (ex.: apagado pelo usuário)"""
+        rel = self._relative(path) or Path(path).as_posix()
+        conn = self._connect()
+        conn.execute('DELETE FROM catalog_files WHERE path = ?', (rel,))
+        conn.commit()
+        conn.close()
+
+    # ------------------------------------------------------------------
+    # Listagem e reconciliação
+    # ------------------------------------------------------------------
+
+    def list_files(self, page: int = 1, page_size: int = 100, sort: str = 'modified',
+                   order: str = 'desc', platform: Optional[str] = None,
+                   media_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Página de arquivos do catálogo (consulta indexada, sem tocar no disco)
+
+        Args:
+            page: Página (1-based)
+            page_size: Itens por página
+            sort: 'modified', 'name' ou 'size'
+            order: 'asc' ou 'desc'
+            platform / media_type: Filtros opcionais
+
+        Returns:
+            Dict com files, total, page, page_size
+        """
+        column = _SORT_COLUMNS.get(sort, 'mtime')
+        direction = 'ASC' if str(order).lower() == 'asc' else 'DESC'
+        page = max(1, int(page))
+        page_size = max(1, int(page_size))
+
+        where = []
+        params: List[Any] = []
+        if platform:
+            where.append('platform = ?')
+            params.append(platform)
+        if media_type:
+            where.append('media_type = ?')
+            params.append(media_type)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM catalog_files {where_sql}', params).fetchone()[0]
+        rows = conn.execute(f'''
+            SELECT path, name, size, mtime, platform, media_type FROM catalog_files
+            {where_sql}
+            ORDER BY {column} {direction}, path {direction}
+            LIMIT ? OFFSET ?
+        ''', params + [page_size, (page - 1) * page_size]).fetchall()
+        conn.close()
+
+        return {
+            'files': [dict(row) for row in rows],
+            'total': total,
+            'page': page,
+            'page_size': page_size
+        }
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Sincroniza o catálogo com o disco (arquivos copiados/apagados fora do app)
+
+        Um único stat por arquivo; só grava linhas novas, alteradas ou removidas.
+        """
+        with self._reconcile_lock:
+            conn = self._connect()
+            known = {
+                row['path']: (row['size'], row['mtime'])
+                for row in conn.execute('SELECT path, size, mtime FROM catalog_files')
+            }
+
+            upserts = []
+            seen = set()
+            root_abs = os.path.abspath(self.root)
+            for dirpath, dirnames, filenames in os.walk(root_abs):
+                for name in filenames:
+                    if self._is_ignored(name):
+                        continue
+                    full = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    rel = Path(os.path.relpath(full, root_abs)).as_posix()
+                    seen.add(rel)
+                    if known.get(rel) == (st.st_size, st.st_mtime):
+                        continue
+                    media_type, platform = classify_path(rel)
+                    upserts.append((rel, name, st.st_size, st.st_mtime, st.st_dev, st.st_ino,
+                                    platform, media_type))
+
+            removed = [(path,) for path in known if path not in seen]
+            conn.executemany('''
+                INSERT INTO catalog_files (path, name, size, mtime, dev, inode, platform, media_type, added_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size,
+                    mtime = excluded.mtime,
+                    dev = excluded.dev,
+                    inode = excluded.inode
+            ''', upserts)
+            conn.executemany('DELETE FROM catalog_files WHERE path = ?', removed)
+            conn.commit()
+            conn.close()
+
+        if self._dedupe_thread is not None:
+            for row in upserts:
+                self._dedupe_queue.put(row[0])
+        if upserts or removed:
+            logger.info(f"🗂️ Catálogo reconciliado: {len(upserts)} novos/alterados, {len(removed)} removidos")
+        return {'scanned': len(seen), 'updated': len(upserts), 'removed': len(removed)}
+
+    def _claim_run(self, name: str, hold_sec: float) -> bool:
+        """
+        Reserva uma rodada de tarefa periódica entre processos (catalog_meta)
+
+        Quem consegue a reserva executa; os demais pulam até ela vencer.
+        """
+        now = int(time.time())
+        conn = self._connect()
+        conn.execute('INSERT OR IGNORE INTO catalog_meta (name, value) VALUES (?, 0)', (name,))
+        claimed = conn.execute(
+            'UPDATE catalog_meta SET value = ? WHERE name = ? AND value <= ?',
+            (now + int(hold_sec), name, now)
+        ).rowcount
+        conn.commit()
+        conn.close()
+        return bool(claimed)
+
+    def start_reconcile(self, interval_sec: int = 600):
+        """
+        Inicia thread daemon que executa reconcile() já e depois periodicamente
+
+        Entre workers, cada rodada roda em um só; request_reconcile() sempre executa.
+        """
+        if self._reconcile_thread and self._reconcile_thread.is_alive():
+            return
+
+        def _loop():
+            hold_sec = self.STARTUP_LEASE_SEC
+            requested = False
+            while True:
+                try:
+                    if requested or self._claim_run('reconcile_due', hold_sec):
+                        self.reconcile()
+                except Exception as e:
+                    logger.warning(f"⚠️ Falha ao reconciliar catálogo: {e}")
+                hold_sec = interval_sec
+                requested = self._reconcile_wakeup.wait(timeout=interval_sec)
+                self._reconcile_wakeup.clear()
+
+        self._reconcile_thread = threading.Thread(target=_loop, name='file-catalog-reconcile', daemon=True)
+        self._reconcile_thread.start()
+
+    def request_reconcile(self):
+        """Antecipa a próxima reconciliação (ex.: após abrir/alterar a pasta)"""
+        self._reconcile_wakeup.set()
+
+    # ------------------------------------------------------------------
+    # Deduplicação
+    # ------------------------------------------------------------------
+
+    def _hash_file(self, full_path: Path) -> str:
+        """Hash blake2b lido em blocos (memória constante)"""
+        h = hashlib.blake2b(digest_size=32)
+        with open(full_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_BYTES), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _digest_for(self, conn: sqlite3.Connection, row: sqlite3.Row) -> Optional[str]:
+        """Digest do arquivo; recalcula só se o arquivo mudou desde o último hash"""
+        full_path = self.root / row['path']
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            conn.execute('DELETE FROM catalog_files WHERE path = ?', (row['path'],))
+            return None
+        if row['digest'] and row['digest_mtime'] == st.st_mtime and row['size'] == st.st_size:
+            return row['digest']
+
+        digest = self._hash_file(full_path)
+        conn.execute('''
+            UPDATE catalog_files
+            SET digest = ?, digest_mtime = ?, size = ?, mtime = ?, dev = ?, inode = ?
+            WHERE path = ?
+        ''', (digest, st.st_mtime, st.st_size, st.st_mtime, st.st_dev, st.st_ino, row['path']))
+        return digest
+
+    def _link_duplicate(self, keeper: sqlite3.Row, dup: sqlite3.Row) -> bool:
+        """Troca dup por hardlink para keeper (atômico via os.replace)"""
+        keeper_path = self.root / keeper['path']
+        dup_path = self.root / dup['path']
+        tmp_path = dup_path.with_name(dup_path.name + '.dedupe-tmp')
+        try:
+            os.link(keeper_path, tmp_path)
+            os.replace(tmp_path, dup_path)
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ Hardlink falhou para {dup['path']}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
+
+    def dedupe_file(self, rel_path: str) -> int:
+        """
+        Deduplica um arquivo contra o catálogo
+
+        Returns:
+            Bytes recuperados (0 se não havia duplicata)
+        """
+        with self._dedupe_lock:
+            conn = self._connect()
+            row = conn.execute('SELECT * FROM catalog_files WHERE path = ?', (rel_path,)).fetchone()
+            if row is None or row['size'] == 0:
+                conn.close()
+                return 0
+
+            # Pré-filtro por tamanho: só calcula hash se há outro arquivo do mesmo tamanho
+            # no mesmo disco, catalogado antes deste e que ainda não é o mesmo inode
+            # (um arquivo só vira link de um mais antigo: sem cadeias entre duplicatas)
+            candidates = conn.execute('''
+                SELECT * FROM catalog_files
+                WHERE size = ? AND dev = ? AND inode != ? AND (added_at, path) < (?, ?)
+                ORDER BY added_at, path
+            ''', (row['size'], row['dev'], row['inode'], row['added_at'], rel_path)).fetchall()
+            if not candidates:
+                conn.close()
+                return 0
+
+            digest = self._digest_for(conn, row)
+            reclaimed = 0
+            for other in candidates:
+                if digest is None or self._digest_for(conn, other) != digest:
+                    continue
+                # Mantém o arquivo mais antigo; o recém-chegado vira hardlink
+                if self._link_duplicate(other, row):
+                    st = os.stat(self.root / rel_path)
+                    # Outro worker já ligou este arquivo (mesmo inode): não conta duas vezes
+                    if not conn.execute('''
+                        UPDATE catalog_files SET inode = ?, mtime = ?, digest_mtime = ?
+                        WHERE path = ? AND inode != ?
+                    ''', (st.st_ino, st.st_mtime, st.st_mtime, rel_path, st.st_ino)).rowcount:
+                        break
+                    reclaimed = row['size']
+                    conn.execute(
+                        "UPDATE catalog_meta SET value = value + 1 WHERE name = 'dedupe_linked_files'"
+                    )
+                    conn.execute(
+                        "UPDATE catalog_meta SET value = value + ? WHERE name = 'dedupe_reclaimed_bytes'",
+                        (reclaimed,)
+                    )
+                    logger.info(f"🔗 Duplicata {rel_path} → {other['path']} ({reclaimed} bytes)")
+                break
+            conn.commit()
+            conn.close()
+            return reclaimed
+
+    def dedupe_all(self) -> Dict[str, int]:
+        """Passada completa: só arquivos cujo tamanho aparece mais de uma vez"""
+        conn = self._connect()
+        paths = [r['path'] for r in conn.execute('''
+            SELECT path FROM catalog_files
+            WHERE size > 0 AND size IN (
+                SELECT size FROM catalog_files GROUP BY size HAVING COUNT(*) > 1
+            )
+            ORDER BY added_at DESC, path
+        ''')]
+        conn.close()
+        linked = 0
+        reclaimed = 0
+        for rel in paths:
+            freed = self.dedupe_file(rel)
+            if freed:
+                linked += 1
+                reclaimed += freed
+        return {'checked': len(paths), 'linked': linked, 'reclaimed_bytes': reclaimed}
+
+    def _dedupe_loop(self):
+        while True:
+            rel = self._dedupe_queue.get()
+            try:
+                self.dedupe_file(rel)
+            except Exception as e:
+                logger.error(f"❌ Erro na deduplicação de {rel}: {e}")
+            finally:
+                self._dedupe_queue.task_done()
+
+    def start_dedupe(self, backfill: bool = True):
+        """Inicia a thread de deduplicação (idempotente)"""
+        if self._dedupe_thread and self._dedupe_thread.is_alive():
+            return
+        self._dedupe_thread = threading.Thread(target=self._dedupe_loop, name='file-dedupe', daemon=True)
+        self._dedupe_thread.start()
+        if backfill and self._claim_run('dedupe_backfill_due', self.STARTUP_LEASE_SEC):
+            threading.Thread(target=self.dedupe_all, name='file-dedupe-backfill', daemon=True).start()
+
+    def get_totals(self) -> Dict[str, Any]:
+        """
+        Bytes/arquivos baixados, com quebra por plataforma e por tipo
+
+        Lê apenas a tabela de totais (uma linha por plataforma/tipo).
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT platform, media_type, files, bytes FROM catalog_totals WHERE files > 0'
+        ).fetchall()
+        conn.close()
+
+        totals = {'files': 0, 'bytes': 0, 'by_platform': {}, 'by_media_type': {}}
+        for row in rows:
+            totals['files'] += row['files']
+            totals['bytes'] += row['bytes']
+            for group, key in (('by_platform', row['platform'] or 'other'),
+                               ('by_media_type', row['media_type'] or 'other')):
+                bucket = totals[group].setdefault(key, {'files': 0, 'bytes': 0})
+                bucket['files'] += row['files']
+                bucket['bytes'] += row['bytes']
+        return totals
+
+    def get_dedupe_stats(self) -> Dict[str, int]:
+        """Arquivos trocados por hardlink e bytes recuperados (acumulado)"""
+        conn = self._connect()
+        meta = dict(conn.execute('SELECT name, value FROM catalog_meta').fetchall())
+        conn.close()
+        return {
+            'linked_files': meta.get('dedupe_linked_files', 0),
+            'reclaimed_bytes': meta.get('dedupe_reclaimed_bytes', 0),
+            'pending': self._dedupe_queue.qsize()
+        }
+
+
+# Instância global (singleton)
+_catalog_instance: Optional[FileCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_file_catalog(**kwargs) -> FileCatalog:
+    """Retorna instância global do catálogo (kwargs só valem na primeira chamada)"""
+    global _catalog_instance
+    with _catalog_lock:
+        if _catalog_instance is None:
+            _catalog_instance = FileCatalog(**kwargs)
+    return _catalog_instance
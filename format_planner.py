@@ -0,0 +1,170 @@
+"""
+Planejador de Formatos
+Escolhe streams cujo codec já serve para a saída pedida
+Resultado: cópia de stream (remux) em vez de reencode sempre que possível
+Escada de qualidade da UI (8K ... 240p) convertida em ordenação precisa do yt-dlp
+"""
+
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# Formato de saída -> prefixos de acodec (yt-dlp) que podem ser copiados sem reencode
+AUDIO_CODEC_FAMILIES = {
+    'mp3': ('mp3',),
+    'm4a': ('mp4a', 'aac'),
+    'aac': ('mp4a', 'aac'),
+    'opus': ('opus',),
+    'vorbis': ('vorbis',),
+    'flac': ('flac',),
+}
+
+# Filtro de acodec do seletor yt-dlp por formato de saída
+_AUDIO_SELECTORS = {
+    'mp3': 'ba[acodec^=mp3]',
+    'm4a': 'ba[acodec^=mp4a]',
+    'aac': 'ba[acodec^=mp4a]',
+    'opus': 'ba[acodec=opus]',
+    'vorbis': 'ba[acodec=vorbis]',
+    'flac': 'ba[acodec=flac]',
+}
+
+# Contêiner de vídeo -> ordenação de extensões (vídeo:áudio) que unem por cópia
+_CONTAINER_SORT = {
+    'mp4': 'ext:mp4:m4a',
+    'webm': 'ext:webm:webm',
+    'mkv': None,
+}
+
+DEFAULT_VIDEO_CONTAINER = 'mp4'
+
+# Escada de qualidade (mesma de get_video_info): rótulo -> (altura, fps máximo)
+QUALITY_LADDER = {
+    '8K': (4320, None),
+    '4K': (2160, None),
+    '2K': (1440, None),
+    '1080p60': (1080, 60),
+    '1080p': (1080, 30),
+    '720p60': (720, 60),
+    '720p': (720, 30),
+    '480p': (480, None),
+    '360p': (360, None),
+    '240p': (240, None),
+}
+QUALITY_ORDER = {'8K': 8, '4K': 7, '2K': 6, '1080p60': 5, '1080p': 4, '720p60': 3, '720p': 2,
+                 '480p': 1, '360p': 0, '240p': -1}
+
+_HEIGHT_QUALITY = re.compile(r'^(\d{3,4})p(\d{2,3})?$')
+_FORMAT_ID = re.compile(r'^[\w.-]+$')
+
+
+def quality_label(height: int, fps: Optional[float] = None) -> str:
+    """Rótulo da escada para um formato (altura/fps)"""
+    fps = fps or 30
+    if height >= 4320:
+        return '8K'
+    if height >= 2160:
+        return '4K'
+    if height >= 1440:
+        return '2K'
+    if height >= 1080:
+        return '1080p' if fps <= 30 else '1080p60'
+    if height >= 720:
+        return '720p' if fps <= 30 else '720p60'
+    if height >= 480:
+        return '480p'
+    if height >= 360:
+        return '360p'
+    return '240p'
+
+
+def parse_quality(quality: Optional[str]) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """
+    Interpreta o parâmetro quality da API
+
+    Aceita rótulos da escada ('1080p60', '4K'), alturas ('2160p') ou um format_id
+    vindo de get_video_info.
+
+    Returns:
+        (altura máxima, fps máximo, format_id); tudo None = melhor disponível
+    """
+    value = str(quality or '').strip()
+    if not value or value.lower() in ('best', 'auto'):
+        return None, None, None
+    if value in QUALITY_LADDER:
+        height, fps = QUALITY_LADDER[value]
+        return height, fps, None
+    match = _HEIGHT_QUALITY.match(value.lower())
+    if match:
+        height = int(match.group(1))
+        fps = int(match.group(2)) if match.group(2) else (30 if height in (720, 1080) else None)
+        return height, fps, None
+    if _FORMAT_ID.match(value):
+        return None, None, value
+    return None, None, None
+
+
+def audio_codec_family(acodec: Optional[str]) -> Optional[str]:
+    """Formato de saída equivalente ao acodec do stream (None se não houver)"""
+    codec = (acodec or '').split('.')[0].lower()
+    for audio_format, prefixes in AUDIO_CODEC_FAMILIES.items():
+        if audio_format != 'aac' and codec.startswith(prefixes):
+            return audio_format
+    return None
+
+
+def codec_matches(audio_format: str, acodec: Optional[str]) -> bool:
+    """Se o stream pode ir para audio_format só com cópia"""
+    codec = (acodec or '').split('.')[0].lower()
+    return bool(codec) and codec.startswith(AUDIO_CODEC_FAMILIES.get(audio_format, ()))
+
+
+def plan_audio(audio_format: str = 'mp3') -> Dict[str, Any]:
+    """
+    Opções do yt-dlp para um download de áudio
+
+    Prefere o stream cujo codec já é o da saída (m4a/opus/...); sem ele,
+    o melhor áudio disponível (convertido depois no pool de pós-processamento).
+    """
+    selector = _AUDIO_SELECTORS.get(audio_format)
+    return {'format': f"{selector}/bestaudio/best" if selector else 'bestaudio/best'}
+
+
+def resolve_audio_format(requested: str, acodec: Optional[str], keep_native: bool = False) -> str:
+    """
+    Formato final do áudio
+
+    Com keep_native, um stream com perdas já comprimido (AAC/Opus/...) é mantido
+    no seu formato (cópia) em vez de ser reencodado para o formato pedido.
+    Formatos sem perdas pedidos (flac/wav) são sempre respeitados.
+    """
+    if keep_native and requested not in ('flac', 'wav'):
+        native = audio_codec_family(acodec)
+        if native and native != 'flac':
+            return native
+    return requested
+
+
+def plan_video(video_codec: str = 'auto', container: str = DEFAULT_VIDEO_CONTAINER,
+               quality: Optional[str] = 'best') -> Dict[str, Any]:
+    """
+    Opções do yt-dlp para um download de vídeo
+
+    - Vídeo e áudio separados (melhor qualidade) com preferência, na mesma
+      resolução/fps, pelo par que cabe no contêiner sem reencode (mp4: avc1+m4a)
+    - quality limita a resolução: 'res:720' escolhe a maior altura <= 720
+      (ou a menor acima, se o vídeo não tiver nenhuma); nada além do pedido é baixado
+    - fps: 1080p/720p preferem <= 30 fps; as variantes 60 aceitam 60
+    - format_id (de get_video_info) é usado exatamente, com o plano como fallback
+    - merge_output_format com fallback para mkv: a união é sempre cópia de stream
+    """
+    height, fps, format_id = parse_quality(quality)
+    video = 'bv*' if video_codec in (None, '', 'auto') else f"bv*[vcodec*={video_codec}]"
+    selector = f"{video}+ba/b" if video == 'bv*' else f"{video}+ba/{video}/b"
+    opts: Dict[str, Any] = {'format': f"{format_id}/{selector}" if format_id else selector}
+    sort_fields = [f'res:{height}' if height else 'res', f'fps:{fps}' if fps else 'fps']
+    sort_key = _CONTAINER_SORT.get(container)
+    if sort_key:
+        sort_fields.append(sort_key)
+    opts['format_sort'] = sort_fields
+    opts['merge_output_format'] = f"{container}/mkv" if container != 'mkv' else 'mkv'
+    return opts
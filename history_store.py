@@ -0,0 +1,237 @@
+"""
+Histórico de Downloads em SQLite
+Tabela append-only indexada por data/plataforma/status
+Agregados mantidos por triggers: /api/statistics não varre o histórico
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+# Campos com coluna própria; o restante do registro vai em extra (JSON)
+_RECORD_COLUMNS = ('url', 'title', 'platform', 'status', 'size')
+
+_TOTALS_TRIGGERS = {
+    'trg_history_insert': '''
+        AFTER INSERT ON download_history BEGIN
+            INSERT INTO history_totals (platform, status, records, bytes)
+            VALUES (NEW.platform, NEW.status, 1, NEW.size)
+            ON CONFLICT(platform, status) DO UPDATE SET
+                records = records + 1,
+                bytes = bytes + excluded.bytes;
+        END''',
+    'trg_history_delete': '''
+        AFTER DELETE ON download_history BEGIN
+            UPDATE history_totals SET records = records - 1, bytes = bytes - OLD.size
+            WHERE platform = OLD.platform AND status = OLD.status;
+        END''',
+}
+
+
+class DownloadHistoryStore:
+    """
+    Histórico de downloads sem limite fixo de registros
+
+    - add() só insere (append-only); retenção por janela de tempo via cleanup()
+    - history_totals (plataforma, status) mantida por triggers
+    """
+
+    PRUNE_INTERVAL_SEC = 3600
+    # Status de resultado; outros (ex.: 'queued' de versões antigas) não contam nas estatísticas
+    OUTCOME_STATUSES = ('completed', 'failed')
+
+    def __init__(self, db_path: str = 'downloads/history.db', retention_days: Optional[int] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self._last_prune = 0.0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Cria tabelas, índices e triggers se não existirem"""
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS download_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                url TEXT,
+                title TEXT,
+                platform TEXT NOT NULL DEFAULT 'Unknown',
+                status TEXT NOT NULL DEFAULT '',
+                size INTEGER NOT NULL DEFAULT 0,
+                extra TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_history_created ON download_history(created_at)')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_history_platform ON download_history(platform, created_at)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_history_status ON download_history(status, created_at)'
+        )
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS history_totals (
+                platform TEXT NOT NULL,
+                status TEXT NOT NULL,
+                records INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (platform, status)
+            ) WITHOUT ROWID
+        ''')
+        for trigger_name, body in _TOTALS_TRIGGERS.items():
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _row_values(record: Dict[str, Any]) -> tuple:
+        """Converte um registro (formato do settings) em valores da tabela"""
+        timestamp = record.get('timestamp')
+        try:
+            created_at = datetime.fromisoformat(timestamp).timestamp() if timestamp else time.time()
+        except (TypeError, ValueError):
+            created_at = time.time()
+        size = record.get('size', record.get('file_size', 0)) or 0
+        extra = {k: v for k, v in record.items()
+                 if k not in _RECORD_COLUMNS and k not in ('timestamp', 'file_size')}
+        return (
+            created_at,
+            record.get('url'),
+            record.get('title'),
+            record.get('platform') or 'Unknown',
+            record.get('status') or '',
+            int(size),
+            json.dumps(extra, ensure_ascii=False) if extra else None
+        )
+
+    def add(self, record: Dict[str, Any]) -> int:
+        """Acrescenta um registro; retorna o id"""
+        conn = self._connect()
+        cursor = conn.execute('''
+            INSERT INTO download_history (created_at, url, title, platform, status, size, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', self._row_values(record))
+        conn.commit()
+        conn.close()
+
+        if self.retention_days and time.time() - self._last_prune >= self.PRUNE_INTERVAL_SEC:
+            self.cleanup(self.retention_days)
+        return cursor.lastrowid
+
+    def import_records(self, records: List[Dict[str, Any]]) -> int:
+        """Importa registros legados (lista do app_settings.json, mais recente primeiro)"""
+        conn = self._connect()
+        conn.executemany('''
+            INSERT INTO download_history (created_at, url, title, platform, status, size, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [self._row_values(r) for r in reversed(records)])
+        conn.commit()
+        conn.close()
+        logger.info(f"🔁 {len(records)} registros de histórico importados para {self.db_path}")
+        return len(records)
+
+    def cleanup(self, max_days: int) -> int:
+        """Remove registros mais antigos que max_days; retorna quantos"""
+        cutoff = time.time() - max_days * 24 * 3600
+        conn = self._connect()
+        removed = conn.execute('DELETE FROM download_history WHERE created_at < ?', (cutoff,)).rowcount
+        conn.commit()
+        conn.close()
+        self._last_prune = time.time()
+        if removed:
+            logger.info(f"🧹 {removed} registros de histórico removidos (>{max_days} dias)")
+        return removed
+
+    def recent(self, limit: int = 100, offset: int = 0, platform: Optional[str] = None,
+               status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Registros mais recentes primeiro, no formato do settings (timestamp ISO)"""
+        where = []
+        params: List[Any] = []
+        if platform:
+            where.append('platform = ?')
+            params.append(platform)
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+
+        conn = self._connect()
+        rows = conn.execute(f'''
+            SELECT * FROM download_history {where_sql}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ? OFFSET ?
+        ''', params + [limit, offset]).fetchall()
+        conn.close()
+
+        records = []
+        for row in rows:
+            record = json.loads(row['extra']) if row['extra'] else {}
+            record.update({
+                'url': row['url'],
+                'title': row['title'],
+                'platform': row['platform'],
+                'status': row['status'],
+                'size': row['size'],
+                'timestamp': datetime.fromtimestamp(row['created_at']).isoformat()
+            })
+            records.append(record)
+        return records
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Agregados (mesmo formato de SettingsManager.get_statistics) lidos de history_totals
+
+        Cada download conta uma vez, pelo resultado (concluído ou falho).
+        """
+        conn = self._connect()
+        placeholders = ','.join('?' * len(self.OUTCOME_STATUSES))
+        rows = conn.execute(
+            f'SELECT platform, status, records, bytes FROM history_totals '
+            f'WHERE records > 0 AND status IN ({placeholders})',
+            self.OUTCOME_STATUSES
+        ).fetchall()
+        conn.close()
+
+        total_downloads = sum(r['records'] for r in rows)
+        successful = sum(r['records'] for r in rows if r['status'] == 'completed')
+        failed = sum(r['records'] for r in rows if r['status'] == 'failed')
+        total_size = sum(r['bytes'] for r in rows if r['status'] == 'completed')
+        platforms: Dict[str, int] = {}
+        for r in rows:
+            platforms[r['platform']] = platforms.get(r['platform'], 0) + r['records']
+
+        return {
+            "total_downloads": total_downloads,
+            "successful": successful,
+            "failed": failed,
+            "success_rate": (successful / total_downloads * 100) if total_downloads > 0 else 0,
+            "total_size_mb": total_size / (1024 * 1024),
+            "platforms": platforms,
+        }
+
+
+# Instância global (singleton)
+_history_instance: Optional[DownloadHistoryStore] = None
+_history_lock = threading.Lock()
+
+
+def get_history_store(**kwargs) -> DownloadHistoryStore:
+    """Retorna instância global do histórico (kwargs só valem na primeira chamada)"""
+    global _history_instance
+    with _history_lock:
+        if _history_instance is None:
+            _history_instance = DownloadHistoryStore(**kwargs)
+    return _history_instance
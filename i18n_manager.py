@@ -1,11 +1,30 @@
 """
 Sistema de Internacionalização (i18n)
 Inspirado no Windows App Certification Kit
+Catálogos carregados uma vez e achatados (chave com pontos); idioma por requisição
 """
 
+import hashlib
 import json
+import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_LANGUAGE = 'en-us'
+
+
+def _flatten(tree: Dict[str, Any], prefix: str = '') -> Dict[str, str]:
+    """{'a': {'b': 'x'}} -> {'a.b': 'x'}"""
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + '.'))
+        else:
+            flat[path] = str(value)
+    return flat
 
 class I18nManager:
     """Gerenciador de internacionalização"""
@@ -27,72 +46,125 @@ class I18nManager:
         self.i18n_dir = Path(__file__).parent / 'i18n'
         self.default_language = default_language
         self.current_language = default_language
-        self.strings: Dict[str, Any] = {}
-        self.load_language(self.current_language)
+        # Por idioma: árvore original, versão achatada e corpo JSON + ETag prontos
+        self.catalogs: Dict[str, Dict[str, Any]] = {}
+        self.flat: Dict[str, Dict[str, str]] = {}
+        self._payloads: Dict[str, Tuple[bytes, str]] = {}
+        self._missing_logged = set()
+        for code in self.SUPPORTED_LANGUAGES:
+            self.load_language(code)
+        if self.current_language not in self.catalogs:
+            self.current_language = FALLBACK_LANGUAGE
+    
+    @property
+    def strings(self) -> Dict[str, Any]:
+        """Árvore de strings do idioma padrão do processo"""
+        return self.catalogs.get(self.current_language, {})
     
     def load_language(self, language_code: str) -> bool:
-        """Carrega arquivos de strings para o idioma especificado"""
+        """Carrega (ou recarrega) o catálogo de um idioma"""
         lang_file = self.i18n_dir / language_code / 'strings.json'
-        
         if not lang_file.exists():
-            print(f"⚠️  Arquivo de idioma não encontrado: {lang_file}")
-            # Fallback para inglês
-            lang_file = self.i18n_dir / 'en-us' / 'strings.json'
-            if not lang_file.exists():
-                print(f"❌ Arquivo de fallback também não encontrado!")
-                return False
+            return False
         
         try:
             with open(lang_file, 'r', encoding='utf-8') as f:
-                self.strings = json.load(f)
-            self.current_language = language_code
-            print(f"✓ Idioma carregado: {self.SUPPORTED_LANGUAGES.get(language_code, language_code)}")
-            return True
+                tree = json.load(f)
         except Exception as e:
-            print(f"❌ Erro ao carregar idioma: {e}")
+            print(f"❌ Erro ao carregar idioma {language_code}: {e}")
             return False
-    
-    def get(self, key_path: str, default: str = '') -> str:
+        
+        self.catalogs[language_code] = tree
+        self.flat[language_code] = _flatten(tree)
+        body = json.dumps(
+            {'success': True, 'language': language_code, 'strings': tree},
+            ensure_ascii=False
+        ).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        self._payloads[language_code] = (body, etag)
+        print(f"✓ Idioma carregado: {self.SUPPORTED_LANGUAGES.get(language_code, language_code)}")
+        return True
+    
+    def get(self, key_path: str, default: str = '', language: Optional[str] = None) -> str:
         """
         Obtém string traduzida usando notação de ponto
         Exemplo: get('download.title') -> 'Baixar Mídia'
+        
+        language: idioma da requisição; se omitido usa o padrão do processo
         """
-        keys = key_path.split('.')
-        value = self.strings
+        catalog = self.flat.get(language or self.current_language)
+        if catalog is not None and key_path in catalog:
+            return catalog[key_path]
+        fallback = self.flat.get(FALLBACK_LANGUAGE, {})
+        if key_path in fallback:
+            return fallback[key_path]
         
-        try:
-            for key in keys:
-                value = value[key]
-            return str(value)
-        except (KeyError, TypeError):
-            print(f"⚠️  Chave não encontrada: {key_path}")
-            return default or key_path
-    
-    def get_all(self, section: str) -> Dict[str, Any]:
+        if key_path not in self._missing_logged:
+            self._missing_logged.add(key_path)
+            logger.debug(f"Chave de tradução não encontrada: {key_path}")
+        return default or key_path
+    
+    def get_all(self, section: str, language: Optional[str] = None) -> Dict[str, Any]:
         """Obtém todas as strings de uma seção"""
-        return self.strings.get(section, {})
+        return self.catalogs.get(language or self.current_language, {}).get(section, {})
     
     def get_available_languages(self) -> Dict[str, str]:
         """Retorna lista de idiomas disponíveis"""
-        available = {}
-        for code, name in self.SUPPORTED_LANGUAGES.items():
-            lang_file = self.i18n_dir / code / 'strings.json'
-            if lang_file.exists():
-                available[code] = name
-        return available
+        return {code: name for code, name in self.SUPPORTED_LANGUAGES.items() if code in self.catalogs}
+    
+    def resolve_language(self, requested: Optional[str] = None,
+                         accept_language: Optional[str] = None) -> str:
+        """
+        Escolhe o idioma de uma requisição
+        
+        Args:
+            requested: Escolha explícita (query string/cookie), ex. 'en-US'
+            accept_language: Cabeçalho Accept-Language
+        """
+        candidates = []
+        if requested:
+            candidates.append((requested, 2.0))
+        for part in (accept_language or '').split(','):
+            piece = part.strip()
+            if not piece:
+                continue
+            code, _, params = piece.partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            candidates.append((code, quality))
+        
+        for code, _ in sorted(candidates, key=lambda c: -c[1]):
+            code = code.strip().lower().replace('_', '-')
+            if code in self.catalogs:
+                return code
+            # 'pt' -> primeiro catálogo 'pt-*'
+            prefix = code.split('-')[0] + '-'
+            for available in self.catalogs:
+                if available.startswith(prefix):
+                    return available
+        return self.current_language
+    
+    def get_payload(self, language: str) -> Tuple[bytes, str]:
+        """Corpo JSON pré-serializado de /api/i18n/strings e seu ETag"""
+        return self._payloads.get(language) or self._payloads[self.current_language]
     
     def switch_language(self, language_code: str) -> bool:
-        """Troca o idioma atual"""
-        if language_code in self.SUPPORTED_LANGUAGES:
-            return self.load_language(language_code)
+        """Troca o idioma padrão do processo (servidor web usa idioma por requisição)"""
+        if language_code in self.catalogs:
+            self.current_language = language_code
+            return True
         return False
     
-    def format(self, key_path: str, **kwargs) -> str:
+    def format(self, key_path: str, language: Optional[str] = None, **kwargs) -> str:
         """
         Obtém string traduzida com substituição de variáveis
         Exemplo: format('errors.downloadFailed', filename='video.mp4')
         """
-        template = self.get(key_path)
+        template = self.get(key_path, language=language)
         try:
             return template.format(**kwargs)
         except KeyError as e:
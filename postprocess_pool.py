@@ -0,0 +1,279 @@
+"""
+Pool de Pós-processamento (conversões de áudio com ffmpeg)
+Estágio separado do download: o slot de rede é liberado assim que os bytes chegam
+Um ffmpeg por núcleo de CPU, com prioridade reduzida (nice / BELOW_NORMAL)
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from format_planner import codec_matches
+from toolchain import get_toolchain
+
+logger = logging.getLogger(__name__)
+
+# Formato pedido -> (encoders ffmpeg em ordem de preferência, extensão, com perdas)
+AUDIO_TARGETS = {
+    'mp3': (('libmp3lame', 'libshine'), 'mp3', True),
+    'm4a': (('libfdk_aac', 'aac'), 'm4a', True),
+    'aac': (('libfdk_aac', 'aac'), 'm4a', True),
+    'opus': (('libopus', 'opus'), 'opus', True),
+    'vorbis': (('libvorbis', 'vorbis'), 'ogg', True),
+    'flac': (('flac',), 'flac', False),
+    'wav': (('pcm_s16le',), 'wav', False),
+}
+
+# Custo inicial de reencode (segundos de CPU por segundo de mídia); refinado
+# com as conversões medidas e usado para estimar a CPU poupada pelas cópias
+DEFAULT_CPU_PER_MEDIA_SEC = {
+    'mp3': 0.02,
+    'm4a': 0.015,
+    'aac': 0.015,
+    'opus': 0.015,
+    'vorbis': 0.02,
+    'flac': 0.01,
+    'wav': 0.002,
+}
+
+
+def _run_measured(cmd: List[str], creationflags: int = 0):
+    """
+    Executa o comando e mede a CPU (usuário + sistema) gasta pelo processo
+
+    Returns:
+        (returncode, stderr, cpu_sec); sem os.wait4 (Windows) usa o tempo de parede
+    """
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, creationflags=creationflags)
+    stderr = proc.stderr.read().decode('utf-8', errors='replace')
+    proc.stderr.close()
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc.returncode, stderr, usage.ru_utime + usage.ru_stime
+    proc.wait()
+    return proc.returncode, stderr, time.monotonic() - started
+
+
+def tags_from_info(info: Dict[str, Any]) -> Dict[str, str]:
+    """Metadados do yt-dlp no formato de tags do ffmpeg (equivalente ao FFmpegMetadata)"""
+    artist = info.get('artist') or info.get('creator') or info.get('uploader') or info.get('channel')
+    if isinstance(artist, list):
+        artist = ', '.join(str(a) for a in artist)
+    upload_date = str(info.get('release_date') or info.get('upload_date') or '')
+    tags = {
+        'title': info.get('track') or info.get('title'),
+        'artist': artist,
+        'album': info.get('album'),
+        'album_artist': info.get('album_artist'),
+        'genre': info.get('genre'),
+        'track': info.get('track_number'),
+        'date': upload_date[:4] if len(upload_date) >= 4 else None,
+        'comment': info.get('webpage_url'),
+    }
+    return {key: str(value) for key, value in tags.items() if value}
+
+
+class PostProcessPool:
+    """
+    Fila de conversões independente das transferências
+
+    - Workers = núcleos de CPU; cada um executa um processo ffmpeg por vez
+    - ffmpeg roda com prioridade reduzida: não disputa CPU com o servidor
+    - convert_audio() bloqueia só a thread do download, que já liberou o slot do host
+    """
+
+    def __init__(self, workers: Optional[int] = None, niceness: int = 10):
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.niceness = max(0, int(niceness or 0))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='postprocess')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._copied = 0
+        self._transcoded = 0
+        self._cpu_sec = 0.0
+        self._cpu_saved_sec = 0.0
+        self._cpu_rate: Dict[str, float] = dict(DEFAULT_CPU_PER_MEDIA_SEC)
+        logger.info(f"🛠️ Pool de pós-processamento: {self.workers} workers (nice {self.niceness})")
+
+    def _priority_args(self) -> Dict[str, Any]:
+        """Prefixo de comando e flags de criação para rodar com prioridade reduzida"""
+        if not self.niceness:
+            return {'prefix': [], 'creationflags': 0}
+        if sys.platform == 'win32':
+            return {'prefix': [], 'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+        nice = shutil.which('nice')
+        return {'prefix': [nice, '-n', str(self.niceness)] if nice else [], 'creationflags': 0}
+
+    def _build_command(self, ffmpeg: str, src: Path, dst: Path, audio_format: str,
+                       bitrate: Optional[str], tags: Dict[str, str], copy: bool) -> List[str]:
+        encoders, _, lossy = AUDIO_TARGETS[audio_format]
+        cmd = [ffmpeg, '-y', '-loglevel', 'error', '-i', str(src), '-vn']
+        if copy:
+            cmd += ['-c:a', 'copy']
+        else:
+            # Capacidades em cache: escolhe o melhor encoder sem sondar de novo
+            encoder = get_toolchain().pick_encoder(encoders)
+            if not encoder:
+                raise RuntimeError(f"ffmpeg sem encoder para {audio_format} ({', '.join(encoders)})")
+            cmd += ['-c:a', encoder]
+            if encoder in ('opus', 'vorbis'):
+                # Encoders nativos ainda marcados como experimentais no ffmpeg
+                cmd += ['-strict', 'experimental']
+            if lossy and bitrate:
+                cmd += ['-b:a', f"{int(bitrate)}k"]
+        for key, value in tags.items():
+            cmd += ['-metadata', f"{key}={value}"]
+        return cmd + [str(dst)]
+
+    def _convert(self, src: str, audio_format: str, bitrate: Optional[str],
+                 tags: Dict[str, str], source_codec: Optional[str],
+                 duration: Optional[float]) -> Dict[str, Any]:
+        """Executa a conversão (thread do pool); retorna caminho final e custo"""
+        with self._lock:
+            self._running += 1
+        try:
+            ffmpeg = get_toolchain().ffmpeg
+            if not ffmpeg:
+                raise RuntimeError('FFmpeg não encontrado para converter o áudio')
+            src_path = Path(src)
+            _, ext, _ = AUDIO_TARGETS[audio_format]
+            dst_path = src_path.with_suffix(f'.{ext}')
+            copy = codec_matches(audio_format, source_codec)
+            tmp_path = src_path.with_name(f"{src_path.stem}.temp.{ext}")
+
+            priority = self._priority_args()
+            cmd = priority['prefix'] + self._build_command(
+                ffmpeg, src_path, tmp_path, audio_format, bitrate, tags, copy
+            )
+            returncode, stderr, cpu_sec = _run_measured(cmd, priority['creationflags'])
+            if returncode != 0:
+                try:
+                    tmp_path.unlink()
+                except OSError:
+                    pass
+                raise RuntimeError(f"ffmpeg falhou na conversão: {stderr.strip()[:300]}")
+
+            os.replace(tmp_path, dst_path)
+            if dst_path != src_path:
+                try:
+                    src_path.unlink()
+                except OSError:
+                    pass
+            return self._account(audio_format, copy, cpu_sec, duration, str(dst_path))
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _account(self, audio_format: str, copied: bool, cpu_sec: float,
+                 duration: Optional[float], path: str) -> Dict[str, Any]:
+        """Atualiza totais; estima a CPU poupada por cópias a partir dos reencodes medidos"""
+        saved = 0.0
+        with self._lock:
+            self._cpu_sec += cpu_sec
+            if copied:
+                self._copied += 1
+                if duration:
+                    saved = max(0.0, self._cpu_rate.get(audio_format, 0.02) * duration - cpu_sec)
+                    self._cpu_saved_sec += saved
+            else:
+                self._transcoded += 1
+                if duration:
+                    # Média móvel exponencial do custo real deste encoder
+                    rate = cpu_sec / duration
+                    previous = self._cpu_rate.get(audio_format, rate)
+                    self._cpu_rate[audio_format] = 0.8 * previous + 0.2 * rate
+        if copied:
+            logger.info(f"⚡ Cópia de stream ({audio_format}): {cpu_sec:.2f}s de CPU, ~{saved:.1f}s poupados")
+        return {
+            'path': path,
+            'format': audio_format,
+            'stream_copy': copied,
+            'cpu_sec': round(cpu_sec, 3),
+            'cpu_saved_sec': round(saved, 3)
+        }
+
+    def submit_audio(self, src: str, audio_format: str = 'mp3', bitrate: Optional[str] = '320',
+                     tags: Optional[Dict[str, str]] = None, source_codec: Optional[str] = None,
+                     duration: Optional[float] = None) -> Future:
+        """
+        Enfileira a extração/conversão de áudio
+
+        Args:
+            src: Arquivo baixado (qualquer contêiner com áudio)
+            audio_format: mp3, m4a, aac, opus, vorbis, flac ou wav
+            bitrate: kbps para formatos com perdas
+            tags: Metadados a gravar (ver tags_from_info)
+            source_codec: acodec do yt-dlp; se já for o formato pedido, só copia
+            duration: Duração em segundos (estimativa de CPU poupada)
+
+        Returns:
+            Future que resolve para {'path', 'format', 'stream_copy', 'cpu_sec', 'cpu_saved_sec'}
+        """
+        audio_format = audio_format if audio_format in AUDIO_TARGETS else 'mp3'
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(self._convert, src, audio_format, bitrate, tags or {},
+                                       source_codec, duration)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def convert_audio(self, src: str, audio_format: str = 'mp3', bitrate: Optional[str] = '320',
+                      tags: Optional[Dict[str, str]] = None, source_codec: Optional[str] = None,
+                      duration: Optional[float] = None) -> Dict[str, Any]:
+        """submit_audio() e aguarda o resultado"""
+        return self.submit_audio(src, audio_format, bitrate, tags, source_codec, duration).result()
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Conversões na fila/em andamento e totais desde o início"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'niceness': self.niceness,
+                'queued': self._pending - self._running,
+                'running': self._running,
+                'completed': self._completed,
+                'failed': self._failed,
+                'stream_copies': self._copied,
+                'transcodes': self._transcoded,
+                'cpu_sec': round(self._cpu_sec, 1),
+                'cpu_saved_sec': round(self._cpu_saved_sec, 1)
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Encerra o pool (por padrão aguarda as conversões em andamento)"""
+        self._executor.shutdown(wait=wait)
+
+
+# Instância global (singleton)
+_pool_instance: Optional[PostProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_postprocess_pool(**kwargs) -> PostProcessPool:
+    """Retorna instância global do pool (kwargs só valem na primeira chamada)"""
+    global _pool_instance
+    with _pool_lock:
+        if _pool_instance is None:
+            _pool_instance = PostProcessPool(**kwargs)
+    return _pool_instance
@@ -0,0 +1,211 @@
+"""
+Alocador de Numeração (sequência de arquivos e índice de artistas)
+Substitui os arquivos .seq e .artists_index.json por SQLite + memória
+Seguro entre threads e workers: downloads simultâneos na mesma pasta recebem números distintos
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SequenceAllocator:
+    """
+    Alocação O(1) de números de sequência por pasta e de números de artista por plataforma
+
+    - Cada alocação é uma transação curta (BEGIN IMMEDIATE) no SQLite: threads
+      e workers diferentes nunca recebem o mesmo número
+    - Números de artista já atribuídos não mudam: ficam em cache na memória
+    - Arquivos legados (.seq / .artists_index.json) são importados na primeira vez
+    - Conexão reaberta após fork (conexões SQLite não atravessam processos)
+    """
+
+    def __init__(self, db_path: str = 'downloads/sequences.db'):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._artists: Dict[Tuple[str, str], int] = {}
+        with self._lock:
+            self._init_db()
+            self._load()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexão do processo atual (chamado sob lock)"""
+        if self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(str(self.db_path), timeout=30,
+                                         check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transação exclusiva entre processos (chamado sob lock)"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _init_db(self):
+        """Cria tabelas se não existirem"""
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS folder_sequences (
+                folder TEXT PRIMARY KEY,
+                last_value INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS artist_scopes (
+                scope TEXT PRIMARY KEY,
+                next_number INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS artist_numbers (
+                scope TEXT NOT NULL,
+                artist_key TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                PRIMARY KEY (scope, artist_key)
+            ) WITHOUT ROWID
+        ''')
+
+    def _load(self):
+        """Carrega os números de artista já atribuídos (imutáveis) para memória"""
+        conn = self._connection()
+        self._artists = {
+            (scope, key): number
+            for scope, key, number in conn.execute('SELECT scope, artist_key, number FROM artist_numbers')
+        }
+        folders = conn.execute('SELECT COUNT(*) FROM folder_sequences').fetchone()[0]
+        logger.info(f"🔢 Alocador: {folders} pastas, {len(self._artists)} artistas")
+
+    @staticmethod
+    def _key(folder) -> str:
+        return os.path.abspath(str(folder))
+
+    def next_sequence(self, folder) -> int:
+        """
+        Próximo número de sequência da pasta (1, 2, 3...)
+
+        Na primeira vez para a pasta, continua a partir de um .seq legado se existir.
+        """
+        key = self._key(folder)
+        with self._lock, self._transaction() as conn:
+            row = conn.execute('SELECT last_value FROM folder_sequences WHERE folder = ?', (key,)).fetchone()
+            value = (row[0] if row else self._read_legacy_seq(Path(folder))) + 1
+            conn.execute('''
+                INSERT INTO folder_sequences (folder, last_value) VALUES (?, ?)
+                ON CONFLICT(folder) DO UPDATE SET last_value = excluded.last_value
+            ''', (key, value))
+        return value
+
+    def artist_number(self, scope, artist_name: str) -> int:
+        """
+        Número estável do artista dentro do escopo (pasta da plataforma)
+
+        Artista novo recebe o próximo número livre; o mesmo artista (sem
+        diferenciar maiúsculas) sempre recebe o mesmo número.
+        """
+        scope_key = self._key(scope)
+        artist_key = artist_name.lower()
+        with self._lock:
+            number = self._artists.get((scope_key, artist_key))
+            if number is not None:
+                return number
+
+            with self._transaction() as conn:
+                # Outro worker pode ter atribuído desde a carga
+                row = conn.execute(
+                    'SELECT number FROM artist_numbers WHERE scope = ? AND artist_key = ?',
+                    (scope_key, artist_key)
+                ).fetchone()
+                if row is not None:
+                    number = row[0]
+                else:
+                    scope_row = conn.execute(
+                        'SELECT next_number FROM artist_scopes WHERE scope = ?', (scope_key,)
+                    ).fetchone()
+                    if scope_row is None:
+                        next_number = self._import_legacy_artists(conn, Path(scope), scope_key)
+                        number = self._artists.get((scope_key, artist_key), next_number)
+                    else:
+                        number = scope_row[0]
+                    if (scope_key, artist_key) not in self._artists:
+                        conn.execute(
+                            'INSERT INTO artist_numbers (scope, artist_key, number) VALUES (?, ?, ?)',
+                            (scope_key, artist_key, number)
+                        )
+                        conn.execute('''
+                            INSERT INTO artist_scopes (scope, next_number) VALUES (?, ?)
+                            ON CONFLICT(scope) DO UPDATE SET next_number = excluded.next_number
+                        ''', (scope_key, number + 1))
+            self._artists[(scope_key, artist_key)] = number
+        return number
+
+    @staticmethod
+    def _read_legacy_seq(folder: Path) -> int:
+        """Último valor de um .seq legado (0 se ausente/inválido)"""
+        try:
+            with open(folder / '.seq', 'r', encoding='utf-8') as f:
+                return int((f.read() or '0').strip())
+        except (OSError, ValueError):
+            return 0
+
+    def _import_legacy_artists(self, conn: sqlite3.Connection, scope: Path, scope_key: str) -> int:
+        """
+        Importa .artists_index.json legado do escopo (dentro da transação)
+
+        Returns:
+            Próximo número livre do escopo
+        """
+        next_number = 1
+        index_file = scope / '.artists_index.json'
+        if index_file.exists():
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f) or {}
+                mapping = {str(k): int(v) for k, v in (legacy.get('map') or {}).items()}
+                next_number = max([int(legacy.get('next', 1))] + [n + 1 for n in mapping.values()])
+                conn.executemany(
+                    'INSERT OR IGNORE INTO artist_numbers (scope, artist_key, number) VALUES (?, ?, ?)',
+                    [(scope_key, k, n) for k, n in mapping.items()]
+                )
+                for k, n in mapping.items():
+                    self._artists[(scope_key, k)] = n
+                logger.info(f"🔁 {len(mapping)} artistas importados de {index_file}")
+            except Exception as e:
+                logger.warning(f"⚠️ Índice de artistas legado ilegível ({index_file}): {e}")
+        conn.execute(
+            'INSERT OR REPLACE INTO artist_scopes (scope, next_number) VALUES (?, ?)',
+            (scope_key, next_number)
+        )
+        return next_number
+
+
+# Instância global (singleton)
+_allocator_instance: Optional[SequenceAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_sequence_allocator() -> SequenceAllocator:
+    """Retorna instância global do alocador"""
+    global _allocator_instance
+    with _allocator_lock:
+        if _allocator_instance is None:
+            _allocator_instance = SequenceAllocator()
+    return _allocator_instance
@@ -1,20 +1,46 @@
 """
 Settings Manager - Inspirado em Windows Master Store
 Gerencia configurações persistentes da aplicação
+Escrita atômica; modo write-behind agrupa várias alterações em um único save
 """
+import atexit
 import json
 import os
+import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+from config_manager import replacement_file_mode
+
 class SettingsManager:
     """Gerenciador de configurações da aplicação"""
     
-    def __init__(self, settings_file: str = "app_settings.json"):
+    def __init__(self, settings_file: str = "app_settings.json", debounce_sec: Optional[float] = None,
+                 history_store=None):
+        """
+        Args:
+            settings_file: Arquivo JSON de configurações
+            debounce_sec: Se definido, set()/update() agendam um único save após
+                esse atraso (write-behind); None grava imediatamente
+            history_store: DownloadHistoryStore (SQLite); se definido, o histórico
+                sai do JSON e deixa de ter limite de registros
+        """
         self.settings_file = Path(settings_file)
         self.settings: Dict[str, Any] = {}
+        self.debounce_sec = debounce_sec
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self.history_store = history_store
         self.load()
+        if history_store is not None:
+            self._migrate_history()
+        if debounce_sec:
+            # Garante que alterações pendentes não se percam ao encerrar
+            atexit.register(self.flush)
     
     def load(self) -> None:
         """Carrega configurações do arquivo JSON"""
@@ -59,7 +85,9 @@ class SettingsManager:
             "Performance": {
                 "UseHardwareAcceleration": True,
                 "MaxCacheSize": 1024,
-                "AutoCleanCache": True
+                "MemoryCacheSize": 64,
+                "AutoCleanCache": True,
+                "DedupeDownloads": True
             },
             "Privacy": {
                 "SaveHistory": True,
@@ -69,13 +97,54 @@ class SettingsManager:
         self.save()
     
     def save(self) -> None:
-        """Salva configurações no arquivo JSON"""
-        try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=2, ensure_ascii=False)
-            print(f"✓ Configurações salvas em {self.settings_file}")
-        except Exception as e:
-            print(f"✗ Erro ao salvar configurações: {e}")
+        """Salva configurações no arquivo JSON (temporário + rename, atômico)"""
+        with self._save_lock:
+            with self._lock:
+                payload = json.dumps(self.settings, indent=2, ensure_ascii=False)
+                self._dirty = False
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix='.settings-', suffix='.tmp', dir=str(self.settings_file.parent)
+                )
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.chmod(tmp_path, replacement_file_mode(self.settings_file))
+                os.replace(tmp_path, self.settings_file)
+                print(f"✓ Configurações salvas em {self.settings_file}")
+            except Exception as e:
+                print(f"✗ Erro ao salvar configurações: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+    
+    def _request_save(self) -> None:
+        """Salva já ou agenda um save único (write-behind) que agrupa as alterações"""
+        if not self.debounce_sec:
+            self.save()
+            return
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.debounce_sec, self._debounced_save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+    
+    def _debounced_save(self) -> None:
+        with self._lock:
+            self._save_timer = None
+            if not self._dirty:
+                return
+        self.save()
+    
+    def flush(self) -> None:
+        """Grava imediatamente alterações pendentes (ex.: no encerramento)"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            dirty = self._dirty
+        if dirty:
+            self.save()
     
     def get(self, key_path: str, default: Any = None) -> Any:
         """
@@ -98,6 +167,13 @@ class SettingsManager:
         Define valor usando caminho separado por ponto
         Exemplo: set("Settings.Theme", "dark")
         """
+        with self._lock:
+            self._assign(key_path, value)
+        
+        if auto_save:
+            self._request_save()
+    
+    def _assign(self, key_path: str, value: Any) -> None:
         keys = key_path.split('.')
         current = self.settings
         
@@ -109,8 +185,28 @@ class SettingsManager:
         
         # Definir o valor final
         current[keys[-1]] = value
+    
+    def update(self, values: Dict[str, Any], auto_save: bool = True) -> None:
+        """
+        Define várias chaves de uma vez com um único save
+        Exemplo: update({"Settings.Theme": "dark", "Settings.MaxRetries": 5})
+        """
+        with self._lock:
+            for key_path, value in values.items():
+                self._assign(key_path, value)
         
         if auto_save:
+            self._request_save()
+    
+    def _migrate_history(self) -> None:
+        """Move registros do JSON para o histórico SQLite (uma vez)"""
+        self.history_store.retention_days = self.get("DownloadHistory.MaxHistoryDays", 30)
+        records = self.get("DownloadHistory.Records", [])
+        if records:
+            self.history_store.import_records(records)
+            # Gravação imediata (sem debounce): encerrar logo após a importação
+            # não pode deixar os registros no JSON para serem importados de novo
+            self.set("DownloadHistory.Records", [], auto_save=False)
             self.save()
     
     def add_to_history(self, record: Dict[str, Any]) -> None:
@@ -118,6 +214,12 @@ class SettingsManager:
         if not self.get("Privacy.SaveHistory", True):
             return
         
+        if self.history_store is not None:
+            record = dict(record)
+            record["timestamp"] = datetime.now().isoformat()
+            self.history_store.add(record)
+            return
+        
         history = self.get("DownloadHistory.Records", [])
         record["timestamp"] = datetime.now().isoformat()
         history.insert(0, record)  # Adiciona no início
@@ -153,6 +255,11 @@ class SettingsManager:
         Retorna quantidade de registros removidos
         """
         max_days = self.get("DownloadHistory.MaxHistoryDays", 30)
+        if self.history_store is not None:
+            removed_count = self.history_store.cleanup(max_days)
+            self.set("DownloadHistory.LastCleanup", datetime.now().isoformat())
+            return removed_count
+        
         history = self.get("DownloadHistory.Records", [])
         cutoff_date = datetime.now().timestamp() - (max_days * 24 * 3600)
         
@@ -165,14 +272,24 @@ class SettingsManager:
         removed_count = original_count - len(history)
         
         if removed_count > 0:
-            self.set("DownloadHistory.Records", history)
-            self.set("DownloadHistory.LastCleanup", datetime.now().isoformat())
+            self.update({
+                "DownloadHistory.Records": history,
+                "DownloadHistory.LastCleanup": datetime.now().isoformat()
+            })
         
         return removed_count
     
     def get_statistics(self) -> Dict[str, Any]:
         """Retorna estatísticas de uso"""
-        history = self.get("DownloadHistory.Records", [])
+        if self.history_store is not None:
+            return {
+                **self.history_store.get_statistics(),
+                "recent_urls_count": len(self.get("QuickAccess.RecentUrls", [])),
+            }
+        
+        # Só resultados: registros 'queued' de versões antigas duplicariam downloads
+        history = [r for r in self.get("DownloadHistory.Records", [])
+                   if r.get("status") in ("completed", "failed")]
         
         total_downloads = len(history)
         successful = sum(1 for r in history if r.get("status") == "completed")
@@ -215,7 +332,8 @@ class SettingsManager:
             
             # Validação básica
             if "Settings" in imported:
-                self.settings = imported
+                with self._lock:
+                    self.settings = imported
                 self.save()
                 return True
             else:
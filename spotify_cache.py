@@ -5,21 +5,304 @@ Inspirado no SpotiFlyer (sqlite-jdbc-3.34.0.jar)
 """
 
 import sqlite3
+import bisect
 import json
 import logging
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 
 logger = logging.getLogger(__name__)
 
+# IDs do Spotify são base62 com 22 caracteres
+_SPOTIFY_ID_RE = re.compile(r'^[A-Za-z0-9]{22}$')
+# https://open.spotify.com/[intl-xx/]track/<id>?si=...  ou  spotify:track:<id>
+_SPOTIFY_URL_RE = re.compile(
+    r'(?:open\.spotify\.com/(?:intl-[a-z]{2}(?:-[a-z]{2})?/)?|spotify:)'
+    r'(track|album|playlist|artist)[/:]([A-Za-z0-9]+)',
+    re.IGNORECASE
+)
+
+
+def parse_spotify_url(value: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Extrai (tipo, id) de uma URL, URI ou ID do Spotify
+
+    Aceita:
+        https://open.spotify.com/track/<id>?si=...
+        https://open.spotify.com/intl-pt/playlist/<id>
+        spotify:album:<id>
+        <id> (22 caracteres base62, tipo desconhecido)
+
+    Returns:
+        Tupla (tipo, id); (None, None) se não reconhecido
+    """
+    if not value:
+        return None, None
+    value = value.strip()
+    match = _SPOTIFY_URL_RE.search(value)
+    if match:
+        return match.group(1).lower(), match.group(2)
+    if _SPOTIFY_ID_RE.match(value):
+        return None, value
+    return None, None
+
+
+def normalize_spotify_id(value: str) -> Optional[str]:
+    """Retorna a chave canônica (ID do Spotify) para URL/URI/ID, ou None"""
+    return parse_spotify_url(value)[1]
+
+
+# Campos de cada track da playlist guardados em colunas próprias em playlist_tracks
+_PLAYLIST_ENTRY_FIELDS = ('url', 'title', 'artist', 'duration')
+
+
+def _playlist_entry_keys(tracks: List[Dict[str, Any]]) -> List[str]:
+    """
+    Chave estável de cada posição da playlist: ID da track (ou "artista - título")
+    
+    Repetições da mesma track recebem sufixo "#n" para continuarem distintas.
+    """
+    keys = []
+    seen: Dict[str, int] = {}
+    for entry in tracks:
+        key = normalize_spotify_id(entry.get('url') or entry.get('id') or '')
+        if not key:
+            key = f"{entry.get('artist', '')} - {entry.get('title', '')}".lower()
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        keys.append(key if count == 0 else f"{key}#{count}")
+    return keys
+
+
+# Contadores materializados em cache_stats (mantidos pelos triggers abaixo)
+_STAT_NAMES = (
+    'tracks_total', 'tracks_successful', 'tracks_failed', 'score_sum', 'score_count',
+    'size_bytes', 'artists_total', 'playlists_total', 'playlist_tracks_total'
+)
+
+
+def _track_stat_delta(row: str, sign: str) -> str:
+    """UPDATE que soma (sign='+') ou subtrai (sign='-') a linha NEW/OLD dos contadores"""
+    return f'''
+        UPDATE cache_stats SET value = value {sign} CASE name
+            WHEN 'tracks_total' THEN 1
+            WHEN 'tracks_successful' THEN ({row}.success = 1)
+            WHEN 'tracks_failed' THEN ({row}.success = 0)
+            WHEN 'score_sum' THEN COALESCE({row}.score, 0)
+            WHEN 'score_count' THEN ({row}.score IS NOT NULL)
+            WHEN 'size_bytes' THEN COALESCE({row}.file_size_bytes, 0)
+            ELSE 0 END
+        WHERE name IN ('tracks_total', 'tracks_successful', 'tracks_failed',
+                       'score_sum', 'score_count', 'size_bytes');
+    '''
+
+
+def _artist_add(row: str) -> str:
+    return f'''
+        UPDATE cache_stats SET value = value + 1 WHERE name = 'artists_total'
+            AND NOT EXISTS (SELECT 1 FROM track_artists WHERE artist = {row}.artist);
+        INSERT INTO track_artists (artist, tracks) VALUES ({row}.artist, 1)
+            ON CONFLICT(artist) DO UPDATE SET tracks = tracks + 1;
+    '''
+
+
+def _artist_remove(row: str) -> str:
+    return f'''
+        UPDATE track_artists SET tracks = tracks - 1 WHERE artist = {row}.artist;
+        UPDATE cache_stats SET value = value - 1 WHERE name = 'artists_total'
+            AND EXISTS (SELECT 1 FROM track_artists WHERE artist = {row}.artist AND tracks <= 0);
+        DELETE FROM track_artists WHERE artist = {row}.artist AND tracks <= 0;
+    '''
+
+
+_STATS_TRIGGERS = {
+    'trg_stats_track_insert': f'''
+        AFTER INSERT ON cached_tracks BEGIN
+            {_track_stat_delta('NEW', '+')}
+            {_artist_add('NEW')}
+        END''',
+    'trg_stats_track_delete': f'''
+        AFTER DELETE ON cached_tracks BEGIN
+            {_track_stat_delta('OLD', '-')}
+            {_artist_remove('OLD')}
+        END''',
+    'trg_stats_track_update': f'''
+        AFTER UPDATE OF success, score, file_size_bytes, artist ON cached_tracks BEGIN
+            {_track_stat_delta('OLD', '-')}
+            {_track_stat_delta('NEW', '+')}
+            {_artist_remove('OLD')}
+            {_artist_add('NEW')}
+        END''',
+    'trg_stats_playlist_insert': '''
+        AFTER INSERT ON cached_playlists BEGIN
+            UPDATE cache_stats SET value = value + 1 WHERE name = 'playlists_total';
+            UPDATE cache_stats SET value = value + COALESCE(NEW.total_tracks, 0)
+                WHERE name = 'playlist_tracks_total';
+        END''',
+    'trg_stats_playlist_delete': '''
+        AFTER DELETE ON cached_playlists BEGIN
+            UPDATE cache_stats SET value = value - 1 WHERE name = 'playlists_total';
+            UPDATE cache_stats SET value = value - COALESCE(OLD.total_tracks, 0)
+                WHERE name = 'playlist_tracks_total';
+        END''',
+    'trg_stats_playlist_update': '''
+        AFTER UPDATE OF total_tracks ON cached_playlists BEGIN
+            UPDATE cache_stats
+                SET value = value - COALESCE(OLD.total_tracks, 0) + COALESCE(NEW.total_tracks, 0)
+                WHERE name = 'playlist_tracks_total';
+        END''',
+}
+
+
+def _longest_increasing_run(values: List[float]) -> set:
+    """Índices de uma maior subsequência crescente de values (O(n log n))"""
+    tails: List[float] = []
+    tail_idx: List[int] = []
+    parent = [-1] * len(values)
+    for i, value in enumerate(values):
+        j = bisect.bisect_left(tails, value)
+        if j == len(tails):
+            tails.append(value)
+            tail_idx.append(i)
+        else:
+            tails[j] = value
+            tail_idx[j] = i
+        parent[i] = tail_idx[j - 1] if j > 0 else -1
+    kept = set()
+    i = tail_idx[-1] if tail_idx else -1
+    while i != -1:
+        kept.add(i)
+        i = parent[i]
+    return kept
+
+
+def _estimate_size(row: Dict[str, Any]) -> int:
+    """Tamanho aproximado (bytes) de um registro mantido em memória"""
+    return sys.getsizeof(row) + sum(
+        sys.getsizeof(k) + sys.getsizeof(v) for k, v in row.items()
+    )
+
+
+class _LRUCache:
+    """
+    Cache LRU em memória, limitado por número de entradas e/ou bytes
+    
+    Thread-safe; guarda (registro, epoch do timestamp, tamanho estimado).
+    """
+    
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: 'OrderedDict[str, Tuple[Dict[str, Any], float, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.max_bytes > 0
+    
+    def get(self, key: str, min_epoch: float) -> Optional[Dict[str, Any]]:
+        """Retorna cópia do registro se presente e mais novo que min_epoch"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= min_epoch:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(item[0])
+    
+    def put(self, key: str, row: Dict[str, Any], epoch: float):
+        size = _estimate_size(row)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self._data[key] = (dict(row), epoch, size)
+            self._bytes += size
+            while self._data and (
+                (self.max_entries and len(self._data) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+    
+    def invalidate(self, key: str):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._data),
+                'size_mb': self._bytes / (1024 * 1024),
+                'max_entries': self.max_entries,
+                'max_size_mb': self.max_bytes / (1024 * 1024),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0
+            }
+
 
 class SpotifyCacheManager:
     """Gerencia cache SQLite de metadata do Spotify e mapeamentos YouTube"""
     
-    def __init__(self, db_path: str = 'downloads/spotify_cache.db'):
+    # Acessos servidos pela memória são gravados em last_accessed em lote
+    TOUCH_FLUSH_BATCH = 100
+    # Backoff exponencial do cache negativo: 1h, 2h, 4h... até 7 dias
+    NEGATIVE_BACKOFF_BASE_SEC = 3600
+    NEGATIVE_BACKOFF_MAX_SEC = 7 * 24 * 3600
+    # Manutenção em segundo plano: lotes pequenos para não segurar o lock do banco
+    EVICT_BATCH_ROWS = 500
+    VACUUM_STEP_PAGES = 256
+    VACUUM_STEP_PAUSE_SEC = 0.05
+    
+    def __init__(
+        self,
+        db_path: str = 'downloads/spotify_cache.db',
+        memory_cache_entries: int = 0,
+        memory_cache_bytes: int = 0
+    ):
+        """
+        Args:
+            db_path: Caminho do banco SQLite
+            memory_cache_entries: Máximo de tracks no LRU em memória (0 = sem limite por entradas)
+            memory_cache_bytes: Máximo de bytes no LRU em memória (0 = sem limite por bytes)
+        
+        O LRU em memória só é ativado se algum dos limites for > 0.
+        """
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._memory = _LRUCache(max_entries=memory_cache_entries, max_bytes=memory_cache_bytes)
+        self._pending_touches: set = set()
+        self._touch_lock = threading.Lock()
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._maintenance_wakeup = threading.Event()
+        self._maintenance_lock = threading.Lock()
+        self.negative_hits = 0
         self._init_db()
         logger.info(f"📦 Cache SQLite inicializado: {self.db_path}")
     
@@ -27,11 +310,24 @@ class SpotifyCacheManager:
         """Cria tabelas se não existirem"""
         conn = sqlite3.connect(str(self.db_path))
         
-        # Tabela de tracks individuais
+        # auto_vacuum=INCREMENTAL permite devolver páginas livres aos poucos
+        # (PRAGMA incremental_vacuum) em vez de reescrever o banco com VACUUM
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            if conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]:
+                # Conversão única de bancos criados antes do modo incremental
+                conn.execute('VACUUM')
+        
+        # Bancos antigos usavam spotify_url como chave primária
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(cached_tracks)')}
+        if columns and 'track_id' not in columns:
+            conn.execute('ALTER TABLE cached_tracks RENAME TO cached_tracks_legacy')
+        
+        # Tabela de tracks individuais (chave canônica: ID da track no Spotify)
         conn.execute('''
             CREATE TABLE IF NOT EXISTS cached_tracks (
-                spotify_url TEXT PRIMARY KEY,
-                spotify_id TEXT,
+                track_id TEXT PRIMARY KEY,
+                spotify_url TEXT,
                 title TEXT NOT NULL,
                 artist TEXT NOT NULL,
                 album TEXT,
@@ -44,11 +340,25 @@ class SpotifyCacheManager:
                 timestamp DATETIME NOT NULL,
                 last_accessed DATETIME,
                 success BOOLEAN NOT NULL,
-                error_message TEXT
-            )
+                error_message TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_retry_at DATETIME
+            ) WITHOUT ROWID
         ''')
         
+        # Cache negativo: tentativas e próximo retry de tracks sem match
+        track_columns = {row[1] for row in conn.execute('PRAGMA table_info(cached_tracks)')}
+        if 'attempts' not in track_columns:
+            conn.execute('ALTER TABLE cached_tracks ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+            conn.execute('UPDATE cached_tracks SET attempts = 1 WHERE success = 0')
+        if 'next_retry_at' not in track_columns:
+            conn.execute('ALTER TABLE cached_tracks ADD COLUMN next_retry_at DATETIME')
+        
+        if columns and 'track_id' not in columns:
+            self._migrate_legacy_tracks(conn)
+        
         # Tabela de playlists completas
+        # metadata guarda o JSON bruto opcional: 'json', 'zlib' (comprimido) ou 'none'
         conn.execute('''
             CREATE TABLE IF NOT EXISTS cached_playlists (
                 playlist_id TEXT PRIMARY KEY,
@@ -58,41 +368,167 @@ class SpotifyCacheManager:
                 total_tracks INTEGER,
                 metadata TEXT NOT NULL,
                 timestamp DATETIME NOT NULL,
-                last_accessed DATETIME
+                last_accessed DATETIME,
+                snapshot_id TEXT,
+                metadata_format TEXT NOT NULL DEFAULT 'json'
             )
         ''')
+        playlist_columns = {row[1] for row in conn.execute('PRAGMA table_info(cached_playlists)')}
+        if 'snapshot_id' not in playlist_columns:
+            conn.execute('ALTER TABLE cached_playlists ADD COLUMN snapshot_id TEXT')
+        if 'metadata_format' not in playlist_columns:
+            conn.execute("ALTER TABLE cached_playlists ADD COLUMN metadata_format TEXT NOT NULL DEFAULT 'json'")
+        
+        # Membros de cada playlist (uma linha por posição)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS playlist_tracks (
+                playlist_id TEXT NOT NULL,
+                entry_key TEXT NOT NULL,
+                position REAL NOT NULL,
+                track_url TEXT,
+                title TEXT,
+                artist TEXT,
+                duration INTEGER,
+                extra TEXT,
+                PRIMARY KEY (playlist_id, entry_key)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_playlist_position ON playlist_tracks(playlist_id, position)')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_playlist_tracks_cleanup
+            AFTER DELETE ON cached_playlists
+            BEGIN
+                DELETE FROM playlist_tracks WHERE playlist_id = OLD.playlist_id;
+            END
+        ''')
+        self._migrate_legacy_playlists(conn)
+        
+        # Estatísticas materializadas: leitura O(1) em vez de agregar a tabela toda
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS track_artists (
+                artist TEXT PRIMARY KEY,
+                tracks INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        for trigger_name, body in _STATS_TRIGGERS.items():
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}')
+        stored_stats = conn.execute('SELECT COUNT(*) FROM cache_stats').fetchone()[0]
+        if stored_stats != len(_STAT_NAMES):
+            # Banco novo ou anterior aos contadores: calcula uma vez de forma exata
+            self._recompute_stats(conn)
         
         # Índices para performance
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_spotify_id ON cached_tracks(spotify_id)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON cached_tracks(timestamp)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_success ON cached_tracks(success)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_youtube_id ON cached_tracks(youtube_video_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_last_accessed ON cached_tracks(last_accessed)')
+        # Linhas antigas sem last_accessed: a evicção ordena só pela coluna indexada
+        conn.execute('UPDATE cached_tracks SET last_accessed = timestamp WHERE last_accessed IS NULL')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_next_retry ON cached_tracks(next_retry_at) WHERE success = 0'
+        )
         
         conn.commit()
         conn.close()
         logger.info("✅ Schema SQLite criado com sucesso")
     
+    def _migrate_legacy_tracks(self, conn: sqlite3.Connection):
+        """Copia tracks do schema antigo (chave = URL) para o schema por track_id"""
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            'SELECT * FROM cached_tracks_legacy ORDER BY datetime(timestamp)'
+        ).fetchall()
+        conn.row_factory = None
+        
+        migrated = 0
+        for row in rows:
+            # Entradas antigas podiam estar sob a URL da playlist; o spotify_id
+            # só é confiável quando a URL é de uma track
+            kind, url_id = parse_spotify_url(row['spotify_url'])
+            if kind == 'track':
+                track_id = url_id
+            else:
+                track_id = (
+                    normalize_spotify_id(row['spotify_id'] or '')
+                    or row['spotify_id']
+                    or row['spotify_url']
+                )
+                if kind in ('playlist', 'album') and track_id == url_id:
+                    # Chave pertence à coleção, não à track: não há como recuperar
+                    continue
+            
+            # Ordenado por timestamp: a entrada mais recente prevalece
+            conn.execute('''
+                INSERT OR REPLACE INTO cached_tracks
+                (track_id, spotify_url, title, artist, album, duration_sec,
+                 youtube_video_id, youtube_url, score, download_path, file_size_bytes,
+                 timestamp, last_accessed, success, error_message)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                track_id, row['spotify_url'], row['title'], row['artist'], row['album'],
+                row['duration_sec'], row['youtube_video_id'], row['youtube_url'],
+                row['score'], row['download_path'], row['file_size_bytes'],
+                row['timestamp'], row['last_accessed'] or row['timestamp'], row['success'], row['error_message']
+            ))
+            migrated += 1
+        
+        conn.execute('DROP TABLE cached_tracks_legacy')
+        logger.info(f"🔁 Cache migrado para chave por track_id: {migrated}/{len(rows)} tracks")
+    
+    def _migrate_legacy_playlists(self, conn: sqlite3.Connection):
+        """Popula playlist_tracks a partir do JSON de playlists antigas"""
+        rows = conn.execute('''
+            SELECT playlist_id, metadata FROM cached_playlists p
+            WHERE metadata_format = 'json' AND total_tracks > 0
+            AND NOT EXISTS (SELECT 1 FROM playlist_tracks t WHERE t.playlist_id = p.playlist_id)
+        ''').fetchall()
+        for playlist_id, metadata in rows:
+            try:
+                tracks = json.loads(metadata)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(tracks, list):
+                self._insert_playlist_entries(conn, playlist_id, tracks, _playlist_entry_keys(tracks),
+                                              {i: float(i) for i in range(len(tracks))})
+        if rows:
+            logger.info(f"🔁 {len(rows)} playlists migradas para playlist_tracks")
+    
     def get_cached_track(self, spotify_url: str, max_age_days: int = 30) -> Optional[Dict[str, Any]]:
         """
         Retorna cache de uma track se existir e não estiver expirado
         
         Args:
-            spotify_url: URL completa ou ID do Spotify
+            spotify_url: URL, URI (spotify:track:...) ou ID do Spotify
             max_age_days: Idade máxima do cache em dias (default: 30)
         
         Returns:
             Dict com dados do cache ou None se não encontrado/expirado
         """
+        track_id = normalize_spotify_id(spotify_url) or spotify_url
+        
+        if self._memory.enabled:
+            min_epoch = (datetime.utcnow() - timedelta(days=max_age_days)).timestamp()
+            result = self._memory.get(track_id, min_epoch)
+            if result is not None:
+                self._touch(track_id)
+                return result
+        
         conn = sqlite3.connect(str(self.db_path))
         conn.row_factory = sqlite3.Row
         
-        # Busca por URL ou ID
+        # Busca direta pela chave primária
         cursor = conn.execute('''
             SELECT * FROM cached_tracks
-            WHERE (spotify_url = ? OR spotify_id = ?)
+            WHERE track_id = ?
             AND datetime(timestamp) > datetime('now', ?)
             AND success = 1
-        ''', (spotify_url, spotify_url, f'-{max_age_days} days'))
+        ''', (track_id, f'-{max_age_days} days'))
         
         row = cursor.fetchone()
         
@@ -101,13 +537,15 @@ class SpotifyCacheManager:
             conn.execute('''
                 UPDATE cached_tracks
                 SET last_accessed = datetime('now')
-                WHERE spotify_url = ?
-            ''', (row['spotify_url'],))
+                WHERE track_id = ?
+            ''', (track_id,))
             conn.commit()
             
             result = dict(row)
-            logger.info(f"✅ Cache hit: {result['artist']} - {result['title']} (score: {result['score']:.1f})")
+            logger.info(f"✅ Cache hit: {result['artist']} - {result['title']} (score: {result['score'] or 0:.1f})")
             conn.close()
+            if self._memory.enabled:
+                self._memory.put(track_id, result, self._parse_db_time(result['timestamp']))
             return result
         
         conn.close()
@@ -133,8 +571,8 @@ class SpotifyCacheManager:
         Salva resultado de download no cache
         
         Args:
-            spotify_url: URL completa do Spotify
-            spotify_id: ID da track (extraído da URL)
+            spotify_url: URL completa da track no Spotify
+            spotify_id: ID da track (chave canônica; extraído da URL se vazio)
             title: Nome da música
             artist: Nome do artista
             duration_sec: Duração em segundos
@@ -146,8 +584,22 @@ class SpotifyCacheManager:
             success: True se download bem-sucedido
             error_message: Mensagem de erro (se falhou)
             album: Nome do álbum
+        
+        Falhas consecutivas incrementam attempts e adiam o próximo retry com
+        backoff exponencial (ver get_negative_entry); um sucesso zera o contador.
         """
+        track_id = (
+            normalize_spotify_id(spotify_id or '')
+            or normalize_spotify_id(spotify_url or '')
+            or spotify_id
+            or spotify_url
+        )
+        
+        # Write-through: a próxima leitura recarrega a versão do banco
+        self._memory.invalidate(track_id)
+        
         conn = sqlite3.connect(str(self.db_path))
+        self._flush_touches(conn)
         
         # Calcula tamanho do arquivo se não fornecido
         if download_path and file_size_bytes is None:
@@ -155,16 +607,48 @@ class SpotifyCacheManager:
             if path.exists():
                 file_size_bytes = path.stat().st_size
         
+        attempts, retry_modifier = 0, None
+        if not success:
+            previous = conn.execute(
+                'SELECT success, attempts FROM cached_tracks WHERE track_id = ?', (track_id,)
+            ).fetchone()
+            attempts = (previous[1] if previous and not previous[0] else 0) + 1
+            delay = min(
+                self.NEGATIVE_BACKOFF_BASE_SEC * 2 ** (attempts - 1),
+                self.NEGATIVE_BACKOFF_MAX_SEC
+            )
+            retry_modifier = f'+{delay} seconds'
+        
+        # UPSERT (e não INSERT OR REPLACE) para que os triggers de estatística
+        # vejam a substituição como UPDATE
         conn.execute('''
-            INSERT OR REPLACE INTO cached_tracks
-            (spotify_url, spotify_id, title, artist, album, duration_sec,
+            INSERT INTO cached_tracks
+            (track_id, spotify_url, title, artist, album, duration_sec,
              youtube_video_id, youtube_url, score, download_path, file_size_bytes,
-             timestamp, last_accessed, success, error_message)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), ?, ?)
+             timestamp, last_accessed, success, error_message, attempts, next_retry_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), ?, ?, ?,
+                    CASE WHEN ? IS NULL THEN NULL ELSE datetime('now', ?) END)
+            ON CONFLICT(track_id) DO UPDATE SET
+                spotify_url = excluded.spotify_url,
+                title = excluded.title,
+                artist = excluded.artist,
+                album = excluded.album,
+                duration_sec = excluded.duration_sec,
+                youtube_video_id = excluded.youtube_video_id,
+                youtube_url = excluded.youtube_url,
+                score = excluded.score,
+                download_path = excluded.download_path,
+                file_size_bytes = excluded.file_size_bytes,
+                timestamp = excluded.timestamp,
+                last_accessed = excluded.last_accessed,
+                success = excluded.success,
+                error_message = excluded.error_message,
+                attempts = excluded.attempts,
+                next_retry_at = excluded.next_retry_at
         ''', (
-            spotify_url, spotify_id, title, artist, album, duration_sec,
+            track_id, spotify_url, title, artist, album, duration_sec,
             youtube_video_id, youtube_url, score, download_path, file_size_bytes,
-            success, error_message
+            success, error_message, attempts, retry_modifier, retry_modifier
         ))
         
         conn.commit()
@@ -173,15 +657,80 @@ class SpotifyCacheManager:
         if success:
             logger.info(f"💾 Cache salvo: {artist} - {title} → {youtube_video_id or 'FAILED'}")
         else:
-            logger.warning(f"💾 Cache salvo (falha): {artist} - {title} → {error_message}")
+            logger.warning(
+                f"💾 Cache salvo (falha #{attempts}, retry em {retry_modifier[1:]}): "
+                f"{artist} - {title} → {error_message}"
+            )
+    
+    def get_negative_entry(self, spotify_url: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna a falha cacheada de uma track se ela ainda estiver em backoff
+        
+        Args:
+            spotify_url: URL, URI ou ID do Spotify
+        
+        Returns:
+            Dict com attempts, next_retry_at e error_message, ou None se não há
+            falha registrada ou se o backoff já expirou (pode tentar de novo)
+        """
+        track_id = normalize_spotify_id(spotify_url) or spotify_url
+        conn = sqlite3.connect(str(self.db_path))
+        conn.row_factory = sqlite3.Row
+        row = conn.execute('''
+            SELECT track_id, artist, title, attempts, next_retry_at, error_message
+            FROM cached_tracks
+            WHERE track_id = ? AND success = 0 AND next_retry_at > datetime('now')
+        ''', (track_id,)).fetchone()
+        conn.close()
+        
+        if row:
+            self.negative_hits += 1
+            return dict(row)
+        return None
+    
+    @staticmethod
+    def _parse_db_time(value: Optional[str]) -> float:
+        """Converte datetime('now') do SQLite (UTC) em epoch comparável a utcnow()"""
+        try:
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+        except (TypeError, ValueError):
+            return 0.0
     
-    def get_cached_playlist(self, playlist_id: str, max_age_days: int = 7) -> Optional[Dict[str, Any]]:
+    def _touch(self, track_id: str):
+        """Registra acesso servido pela memória; grava em lote no banco"""
+        with self._touch_lock:
+            self._pending_touches.add(track_id)
+            if len(self._pending_touches) < self.TOUCH_FLUSH_BATCH:
+                return
+        conn = sqlite3.connect(str(self.db_path))
+        self._flush_touches(conn)
+        conn.commit()
+        conn.close()
+    
+    def _flush_touches(self, conn: sqlite3.Connection):
+        """Atualiza last_accessed das tracks lidas da memória (sem commit)"""
+        with self._touch_lock:
+            touched = list(self._pending_touches)
+            self._pending_touches.clear()
+        if touched:
+            conn.executemany(
+                "UPDATE cached_tracks SET last_accessed = datetime('now') WHERE track_id = ?",
+                [(track_id,) for track_id in touched]
+            )
+    
+    def get_cached_playlist(
+        self,
+        playlist_id: str,
+        max_age_days: int = 7,
+        include_raw: bool = False
+    ) -> Optional[Dict[str, Any]]:
         """
         Retorna metadata de playlist cacheada
         
         Args:
             playlist_id: ID da playlist do Spotify
             max_age_days: Idade máxima do cache (default: 7 dias, playlists mudam)
+            include_raw: Também decodifica o JSON bruto (se foi guardado) em 'raw'
         
         Returns:
             Dict com metadata da playlist ou None
@@ -207,7 +756,11 @@ class SpotifyCacheManager:
             conn.commit()
             
             result = dict(row)
-            result['metadata'] = json.loads(result['metadata'])
+            raw_format = result.pop('metadata_format')
+            raw = result.pop('metadata')
+            result['metadata'] = self._load_playlist_entries(conn, playlist_id)
+            if include_raw:
+                result['raw'] = self._decode_raw(raw, raw_format)
             logger.info(f"✅ Playlist cache hit: {result['name']} ({result['total_tracks']} tracks)")
             conn.close()
             return result
@@ -215,6 +768,28 @@ class SpotifyCacheManager:
         conn.close()
         return None
     
+    def diff_playlist(
+        self,
+        playlist_id: str,
+        tracks: List[Dict[str, Any]],
+        snapshot_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Compara uma lista nova de tracks com a versão cacheada (sem gravar)
+        
+        Args:
+            playlist_id: ID da playlist
+            tracks: Lista atual de dicts de track (url/title/artist/duration)
+            snapshot_id: snapshot_id do Spotify; se igual ao cacheado, nada mudou
+        
+        Returns:
+            Dict com 'unchanged', 'added' (dicts), 'removed' (chaves), 'moved' e 'total'
+        """
+        conn = sqlite3.connect(str(self.db_path))
+        diff = self._diff_playlist(conn, playlist_id, tracks, snapshot_id)
+        conn.close()
+        return self._diff_summary(diff, tracks)
+    
     def cache_playlist(
         self,
         playlist_id: str,
@@ -222,10 +797,17 @@ class SpotifyCacheManager:
         name: str,
         total_tracks: int,
         metadata: List[Dict[str, Any]],
-        owner: Optional[str] = None
-    ):
+        owner: Optional[str] = None,
+        snapshot_id: Optional[str] = None,
+        store_raw: bool = False,
+        compress_raw: bool = True
+    ) -> Dict[str, Any]:
         """
-        Salva metadata de playlist no cache
+        Salva metadata de playlist no cache (sincronização incremental)
+        
+        Só as tracks adicionadas, removidas ou que mudaram de posição são
+        gravadas em playlist_tracks; com snapshot_id igual ao cacheado,
+        só a linha da playlist (nome, total, timestamp) é atualizada.
         
         Args:
             playlist_id: ID da playlist
@@ -234,53 +816,228 @@ class SpotifyCacheManager:
             total_tracks: Número total de músicas
             metadata: Lista de dicts com info de cada track
             owner: Dono da playlist
+            snapshot_id: snapshot_id do Spotify (versão da playlist)
+            store_raw: Também guarda o JSON completo da lista
+            compress_raw: Comprime o JSON guardado com zlib
+        
+        Returns:
+            Resumo do diff (mesmo formato de diff_playlist)
         """
         conn = sqlite3.connect(str(self.db_path))
+        diff = self._diff_playlist(conn, playlist_id, metadata, snapshot_id)
         
-        conn.execute('''
-            INSERT OR REPLACE INTO cached_playlists
-            (playlist_id, playlist_url, name, owner, total_tracks, metadata,
-             timestamp, last_accessed)
-            VALUES (?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))
-        ''', (
-            playlist_id, playlist_url, name, owner, total_tracks,
-            json.dumps(metadata, ensure_ascii=False)
-        ))
+        if diff['unchanged']:
+            # Tracks iguais, mas nome/total/dono podem ter mudado; renova o TTL
+            conn.execute('''
+                UPDATE cached_playlists
+                SET playlist_url = ?, name = ?, owner = COALESCE(?, owner), total_tracks = ?,
+                    timestamp = datetime('now'), last_accessed = datetime('now'),
+                    snapshot_id = COALESCE(?, snapshot_id)
+                WHERE playlist_id = ?
+            ''', (playlist_url, name, owner, total_tracks, snapshot_id, playlist_id))
+        else:
+            keys, positions = diff['keys'], diff['positions']
+            conn.executemany(
+                'DELETE FROM playlist_tracks WHERE playlist_id = ? AND entry_key = ?',
+                [(playlist_id, key) for key in diff['removed']]
+            )
+            conn.executemany(
+                'UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND entry_key = ?',
+                [(positions[i], playlist_id, keys[i]) for i in diff['moved']]
+            )
+            self._insert_playlist_entries(conn, playlist_id, metadata, keys,
+                                          {i: positions[i] for i in diff['added']})
+            
+            if store_raw:
+                raw = json.dumps(metadata, ensure_ascii=False)
+                raw_format = 'json'
+                if compress_raw:
+                    raw = zlib.compress(raw.encode('utf-8'))
+                    raw_format = 'zlib'
+            else:
+                raw, raw_format = '', 'none'
+            
+            conn.execute('''
+                INSERT INTO cached_playlists
+                (playlist_id, playlist_url, name, owner, total_tracks, metadata,
+                 timestamp, last_accessed, snapshot_id, metadata_format)
+                VALUES (?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), ?, ?)
+                ON CONFLICT(playlist_id) DO UPDATE SET
+                    playlist_url = excluded.playlist_url,
+                    name = excluded.name,
+                    owner = excluded.owner,
+                    total_tracks = excluded.total_tracks,
+                    metadata = excluded.metadata,
+                    timestamp = excluded.timestamp,
+                    last_accessed = excluded.last_accessed,
+                    snapshot_id = excluded.snapshot_id,
+                    metadata_format = excluded.metadata_format
+            ''', (
+                playlist_id, playlist_url, name, owner, total_tracks, raw,
+                snapshot_id, raw_format
+            ))
         
         conn.commit()
         conn.close()
-        logger.info(f"💾 Playlist cacheada: {name} ({total_tracks} tracks)")
+        
+        summary = self._diff_summary(diff, metadata)
+        logger.info(
+            f"💾 Playlist cacheada: {name} ({total_tracks} tracks; "
+            f"+{len(summary['added'])} -{len(summary['removed'])} ~{summary['moved']})"
+        )
+        return summary
     
-    def get_cache_stats(self) -> Dict[str, Any]:
-        """Retorna estatísticas do cache"""
-        conn = sqlite3.connect(str(self.db_path))
+    def _diff_playlist(
+        self,
+        conn: sqlite3.Connection,
+        playlist_id: str,
+        tracks: List[Dict[str, Any]],
+        snapshot_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Diff interno: índices adicionados/movidos e chaves removidas"""
+        row = conn.execute(
+            'SELECT snapshot_id FROM cached_playlists WHERE playlist_id = ?',
+            (playlist_id,)
+        ).fetchone()
+        if row and snapshot_id and row[0] == snapshot_id:
+            return {'unchanged': True, 'keys': [], 'positions': {},
+                    'added': [], 'removed': [], 'moved': []}
         
-        # Stats de tracks
-        conn.row_factory = sqlite3.Row
-        cursor = conn.execute('''
-            SELECT
-                COUNT(*) as total_tracks,
-                SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_tracks,
-                SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as failed_tracks,
-                AVG(score) as avg_score,
-                SUM(file_size_bytes) as total_size_bytes,
-                COUNT(DISTINCT artist) as unique_artists
-            FROM cached_tracks
-        ''')
+        # Só chaves e posições são lidas; nada de JSON da playlist inteira
+        stored = dict(conn.execute(
+            'SELECT entry_key, position FROM playlist_tracks WHERE playlist_id = ?',
+            (playlist_id,)
+        ).fetchall())
+        keys = _playlist_entry_keys(tracks)
         
-        row = cursor.fetchone()
-        track_stats = dict(row) if row else {}
+        # Tracks que mantêm a ordem relativa (maior subsequência crescente de
+        # posições) ficam onde estão; as demais recebem posições nos intervalos
+        kept_indexes = [i for i, key in enumerate(keys) if key in stored]
+        anchored = {
+            kept_indexes[j]
+            for j in _longest_increasing_run([stored[keys[i]] for i in kept_indexes])
+        }
+        positions = self._fill_positions(keys, stored, anchored)
+        if positions is None:
+            # Sem espaço entre posições vizinhas: renumera a playlist inteira
+            positions = {i: float(i) for i in range(len(keys))}
         
-        # Stats de playlists
-        cursor = conn.execute('''
-            SELECT
-                COUNT(*) as total_playlists,
-                SUM(total_tracks) as total_playlist_tracks
-            FROM cached_playlists
-        ''')
+        added = [i for i in positions if keys[i] not in stored]
+        moved = [i for i in positions if keys[i] in stored]
+        removed = list(set(stored) - set(keys))
         
-        row = cursor.fetchone()
-        playlist_stats = dict(row) if row else {}
+        return {
+            'unchanged': row is not None and not (added or moved or removed),
+            'keys': keys,
+            'positions': positions,
+            'added': added,
+            'removed': removed,
+            'moved': moved
+        }
+    
+    @staticmethod
+    def _fill_positions(
+        keys: List[str],
+        stored: Dict[str, float],
+        anchored: set
+    ) -> Optional[Dict[int, float]]:
+        """Posições para as entradas não ancoradas, entre as âncoras vizinhas"""
+        positions: Dict[int, float] = {}
+        gap: List[int] = []
+        lower: Optional[float] = None
+        for i in list(range(len(keys))) + [None]:
+            if i is not None and i not in anchored:
+                gap.append(i)
+                continue
+            upper = stored[keys[i]] if i is not None else None
+            if gap:
+                if lower is None:
+                    lower = (upper if upper is not None else 0.0) - len(gap) - 1
+                high = upper if upper is not None else lower + len(gap) + 1
+                step = (high - lower) / (len(gap) + 1)
+                if step <= 1e-9:
+                    return None
+                for n, index in enumerate(gap, 1):
+                    positions[index] = lower + step * n
+                gap = []
+            lower = upper
+        return positions
+    
+    @staticmethod
+    def _diff_summary(diff: Dict[str, Any], tracks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            'unchanged': diff['unchanged'],
+            'added': [tracks[i] for i in diff['added']],
+            'removed': diff['removed'],
+            'moved': len(diff['moved']),
+            'total': len(tracks)
+        }
+    
+    @staticmethod
+    def _insert_playlist_entries(
+        conn: sqlite3.Connection,
+        playlist_id: str,
+        tracks: List[Dict[str, Any]],
+        keys: List[str],
+        positions: Dict[int, float]
+    ):
+        rows = []
+        for index, position in positions.items():
+            entry = tracks[index]
+            extra = {k: v for k, v in entry.items() if k not in _PLAYLIST_ENTRY_FIELDS}
+            rows.append((
+                playlist_id, keys[index], position,
+                entry.get('url'), entry.get('title'), entry.get('artist'), entry.get('duration'),
+                json.dumps(extra, ensure_ascii=False) if extra else None
+            ))
+        conn.executemany('''
+            INSERT OR REPLACE INTO playlist_tracks
+            (playlist_id, entry_key, position, track_url, title, artist, duration, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    
+    @staticmethod
+    def _load_playlist_entries(conn: sqlite3.Connection, playlist_id: str) -> List[Dict[str, Any]]:
+        entries = []
+        for url, title, artist, duration, extra in conn.execute('''
+            SELECT track_url, title, artist, duration, extra FROM playlist_tracks
+            WHERE playlist_id = ?
+            ORDER BY position
+        ''', (playlist_id,)):
+            entry = {'url': url, 'title': title, 'artist': artist, 'duration': duration}
+            entry = {k: v for k, v in entry.items() if v is not None}
+            if extra:
+                entry.update(json.loads(extra))
+            entries.append(entry)
+        return entries
+    
+    @staticmethod
+    def _decode_raw(raw: Any, raw_format: str) -> Optional[Any]:
+        if raw_format == 'zlib':
+            return json.loads(zlib.decompress(raw).decode('utf-8'))
+        if raw_format == 'json' and raw:
+            return json.loads(raw)
+        return None
+    
+    def get_cache_stats(self, exact: bool = False) -> Dict[str, Any]:
+        """
+        Retorna estatísticas do cache
+        
+        Lê os contadores materializados (O(1)); com exact=True eles são
+        recalculados a partir das tabelas antes da leitura.
+        """
+        conn = sqlite3.connect(str(self.db_path))
+        if exact:
+            self._recompute_stats(conn)
+            conn.commit()
+        
+        counters = dict(conn.execute('SELECT name, value FROM cache_stats').fetchall())
+        stat = lambda name: counters.get(name) or 0
+        
+        # Faixa do índice parcial idx_next_retry: só falhas ainda em backoff
+        backing_off = conn.execute(
+            "SELECT COUNT(*) FROM cached_tracks WHERE success = 0 AND next_retry_at > datetime('now')"
+        ).fetchone()[0]
         
         # Tamanho do banco
         db_size_bytes = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
@@ -291,54 +1048,248 @@ class SpotifyCacheManager:
             'cache_db_path': str(self.db_path),
             'cache_db_size_mb': db_size_bytes / (1024 * 1024),
             'tracks': {
-                'total': track_stats['total_tracks'] or 0,
-                'successful': track_stats['successful_tracks'] or 0,
-                'failed': track_stats['failed_tracks'] or 0,
-                'avg_score': track_stats['avg_score'] or 0,
-                'total_size_mb': (track_stats['total_size_bytes'] or 0) / (1024 * 1024),
-                'unique_artists': track_stats['unique_artists'] or 0
+                'total': int(stat('tracks_total')),
+                'successful': int(stat('tracks_successful')),
+                'failed': int(stat('tracks_failed')),
+                'avg_score': stat('score_sum') / stat('score_count') if stat('score_count') else 0,
+                'total_size_mb': stat('size_bytes') / (1024 * 1024),
+                'unique_artists': int(stat('artists_total'))
             },
             'playlists': {
-                'total': playlist_stats['total_playlists'] or 0,
-                'total_tracks': playlist_stats['total_playlist_tracks'] or 0
-            }
+                'total': int(stat('playlists_total')),
+                'total_tracks': int(stat('playlist_tracks_total'))
+            },
+            'negative': {
+                'total': int(stat('tracks_failed')),
+                'backing_off': backing_off,
+                'retry_ready': max(0, int(stat('tracks_failed')) - backing_off),
+                'searches_skipped': self.negative_hits
+            },
+            'memory': self._memory.stats()
         }
     
+    def _recompute_stats(self, conn: sqlite3.Connection):
+        """Recalcula os contadores materializados de forma exata (varre as tabelas)"""
+        tracks = conn.execute('''
+            SELECT
+                COUNT(*),
+                SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END),
+                SUM(score),
+                COUNT(score),
+                SUM(file_size_bytes)
+            FROM cached_tracks
+        ''').fetchone()
+        playlists = conn.execute(
+            'SELECT COUNT(*), SUM(total_tracks) FROM cached_playlists'
+        ).fetchone()
+        
+        conn.execute('DELETE FROM track_artists')
+        conn.execute('''
+            INSERT INTO track_artists (artist, tracks)
+            SELECT artist, COUNT(*) FROM cached_tracks GROUP BY artist
+        ''')
+        artists = conn.execute('SELECT COUNT(*) FROM track_artists').fetchone()[0]
+        
+        values = dict(zip(_STAT_NAMES, (*tracks, artists, *playlists)))
+        conn.executemany(
+            'INSERT OR REPLACE INTO cache_stats (name, value) VALUES (?, ?)',
+            [(name, values[name] or 0) for name in _STAT_NAMES]
+        )
+    
     def clean_old_cache(self, days: int = 90):
-        """Remove entradas antigas do cache"""
+        """
+        Remove entradas antigas do cache
+        
+        Não compacta o banco: as páginas liberadas são devolvidas aos poucos
+        por reclaim_space() (chamado pela manutenção em segundo plano).
+        """
         conn = sqlite3.connect(str(self.db_path))
+        self._flush_touches(conn)
         
+        # timestamp é gravado no formato de datetime('now'): comparação direta usa o índice
         cursor = conn.execute('''
             DELETE FROM cached_tracks
-            WHERE datetime(timestamp) < datetime('now', ?)
+            WHERE timestamp < datetime('now', ?)
         ''', (f'-{days} days',))
         
         tracks_deleted = cursor.rowcount
         
         cursor = conn.execute('''
             DELETE FROM cached_playlists
-            WHERE datetime(timestamp) < datetime('now', ?)
+            WHERE timestamp < datetime('now', ?)
         ''', (f'-{days} days',))
         
         playlists_deleted = cursor.rowcount
         
-        conn.execute('VACUUM')  # Compacta o banco
         conn.commit()
         conn.close()
+        if tracks_deleted:
+            self._memory.clear()
         
         logger.info(f"🧹 Cache limpo: {tracks_deleted} tracks, {playlists_deleted} playlists removidas")
         return {'tracks_deleted': tracks_deleted, 'playlists_deleted': playlists_deleted}
+    
+    def evict_to_budget(self, max_bytes: int = 0, max_rows: int = 0) -> Dict[str, int]:
+        """
+        Remove as tracks menos acessadas (last_accessed) até caber no orçamento
+        
+        Args:
+            max_bytes: Tamanho máximo das páginas em uso no banco (0 = sem limite)
+            max_rows: Número máximo de tracks (0 = sem limite)
+        
+        Returns:
+            Dict com tracks removidas
+        """
+        conn = sqlite3.connect(str(self.db_path))
+        self._flush_touches(conn)
+        conn.commit()
+        
+        total_rows = int(conn.execute(
+            "SELECT value FROM cache_stats WHERE name = 'tracks_total'"
+        ).fetchone()[0])
+        excess = 0
+        if max_rows and total_rows > max_rows:
+            excess = total_rows - max_rows
+        if max_bytes and total_rows:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            used_bytes = (page_count - free_pages) * page_size
+            if used_bytes > max_bytes:
+                # Estimativa pelo tamanho médio de uma linha (calculada uma vez)
+                bytes_per_row = max(1, used_bytes // total_rows)
+                excess = max(excess, -(-(used_bytes - max_bytes) // bytes_per_row))
+        
+        evicted = 0
+        while evicted < excess:
+            # Lotes pequenos: cada transação segura o lock de escrita por pouco tempo
+            batch = min(excess - evicted, self.EVICT_BATCH_ROWS)
+            track_ids = [row[0] for row in conn.execute('''
+                SELECT track_id FROM cached_tracks
+                ORDER BY last_accessed
+                LIMIT ?
+            ''', (batch,))]
+            if not track_ids:
+                break
+            conn.executemany(
+                'DELETE FROM cached_tracks WHERE track_id = ?',
+                [(track_id,) for track_id in track_ids]
+            )
+            conn.commit()
+            
+            for track_id in track_ids:
+                self._memory.invalidate(track_id)
+            evicted += len(track_ids)
+        
+        conn.close()
+        
+        if evicted:
+            logger.info(f"🧹 Cache acima do orçamento: {evicted} tracks menos acessadas removidas")
+        return {'tracks_evicted': evicted}
+    
+    def reclaim_space(self, max_steps: int = 0) -> Dict[str, int]:
+        """
+        Devolve páginas livres ao sistema em passos pequenos (PRAGMA incremental_vacuum)
+        
+        Cada passo libera no máximo VACUUM_STEP_PAGES páginas, com uma pausa curta
+        entre passos para não bloquear leitores e escritores.
+        
+        Args:
+            max_steps: Limite de passos (0 = até não restarem páginas livres)
+        
+        Returns:
+            Dict com páginas liberadas
+        """
+        reclaimed = 0
+        steps = 0
+        while not max_steps or steps < max_steps:
+            conn = sqlite3.connect(str(self.db_path))
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free_pages:
+                conn.close()
+                break
+            step = min(free_pages, self.VACUUM_STEP_PAGES)
+            # executescript roda o PRAGMA até o fim (execute() avança só uma página)
+            conn.executescript(f'PRAGMA incremental_vacuum({step});')
+            conn.close()
+            reclaimed += step
+            steps += 1
+            time.sleep(self.VACUUM_STEP_PAUSE_SEC)
+        
+        if reclaimed:
+            logger.info(f"🗜️ Cache compactado: {reclaimed} páginas devolvidas")
+        return {'pages_reclaimed': reclaimed}
+    
+    def run_maintenance(
+        self,
+        max_bytes: int = 0,
+        max_rows: int = 0,
+        max_age_days: int = 90
+    ) -> Dict[str, int]:
+        """Limpeza por idade, despejo por orçamento e compactação incremental"""
+        with self._maintenance_lock:
+            result = {}
+            if max_age_days:
+                result.update(self.clean_old_cache(days=max_age_days))
+            if max_bytes or max_rows:
+                result.update(self.evict_to_budget(max_bytes=max_bytes, max_rows=max_rows))
+            result.update(self.reclaim_space())
+            return result
+    
+    def start_maintenance(
+        self,
+        interval_sec: int = 3600,
+        max_bytes: int = 0,
+        max_rows: int = 0,
+        max_age_days: int = 90
+    ):
+        """Inicia thread daemon que executa run_maintenance() periodicamente"""
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            return
+        
+        def _loop():
+            while True:
+                self._maintenance_wakeup.wait(timeout=interval_sec)
+                self._maintenance_wakeup.clear()
+                try:
+                    self.run_maintenance(max_bytes=max_bytes, max_rows=max_rows,
+                                         max_age_days=max_age_days)
+                except Exception as e:
+                    logger.warning(f"⚠️ Falha na manutenção do cache: {e}")
+        
+        self._maintenance_thread = threading.Thread(
+            target=_loop, name='spotify-cache-maintenance', daemon=True
+        )
+        self._maintenance_thread.start()
+        logger.info(f"🛠️ Manutenção do cache a cada {interval_sec}s (limite: {max_bytes / (1024 * 1024):.0f} MB)")
+    
+    def request_maintenance(self):
+        """Agenda compactação em segundo plano (acorda a thread ou usa uma avulsa)"""
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            self._maintenance_wakeup.set()
+            return
+        
+        def _reclaim():
+            with self._maintenance_lock:
+                self.reclaim_space()
+        
+        threading.Thread(target=_reclaim, name='spotify-cache-reclaim', daemon=True).start()
 
 
 # Instância global (singleton)
 _cache_instance: Optional[SpotifyCacheManager] = None
 
 
-def get_cache_manager() -> SpotifyCacheManager:
-    """Retorna instância global do cache manager"""
+def get_cache_manager(**kwargs) -> SpotifyCacheManager:
+    """
+    Retorna instância global do cache manager
+    
+    kwargs (ex.: memory_cache_bytes) só têm efeito na primeira chamada.
+    """
     global _cache_instance
     if _cache_instance is None:
-        _cache_instance = SpotifyCacheManager()
+        _cache_instance = SpotifyCacheManager(**kwargs)
     return _cache_instance
 
 
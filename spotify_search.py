@@ -17,8 +17,18 @@ class SpotifySearchEngine:
     MIN_DURATION_SECONDS = 30  # Skip results under 30 seconds
     MAX_DURATION_SECONDS = 600  # Skip results over 10 minutes
     
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, cache=None, request_gate=None):
+        """
+        Args:
+            logger: Logger com info/debug/error (default: imprime no console)
+            cache: SpotifyCacheManager opcional para o cache negativo
+                   (tracks sem match não são buscadas de novo até o backoff expirar)
+            request_gate: Função opcional chamada antes de cada busca no YouTube
+                          (pode bloquear para respeitar o limite de requisições)
+        """
         self.logger = logger or self._dummy_logger()
+        self.cache = cache
+        self.request_gate = request_gate
     
     def _dummy_logger(self):
         """Fallback logger if none provided"""
@@ -65,13 +75,27 @@ class SpotifySearchEngine:
         
         return queries
     
-    def search_youtube_music(self, artist: str, title: str, duration_sec: int) -> Optional[str]:
+    def search_youtube_music(self, artist: str, title: str, duration_sec: int,
+                             spotify_url: Optional[str] = None) -> Optional[str]:
         """
         Search YouTube Music for best match using SpotiFlyer algorithm
+        If spotify_url is given and a cache is configured, tracks that recently
+        had no match are skipped and new misses are recorded with backoff
         Returns: YouTube video ID or None
         """
+        use_negative_cache = self.cache is not None and bool(spotify_url)
+        if use_negative_cache:
+            negative = self.cache.get_negative_entry(spotify_url)
+            if negative:
+                self.logger.info(
+                    f"⏭️ Sem match em cache ({negative['attempts']}x), "
+                    f"próxima tentativa em {negative['next_retry_at']}: {artist} - {title}"
+                )
+                return None
+        
         # Generate fallback queries
         queries = self.clean_search_query(artist, title)
+        completed_queries = 0
         
         for query_artist, query_title in queries:
             search_query = f"{query_artist} - {query_title}"
@@ -86,8 +110,11 @@ class SpotifySearchEngine:
                     'skip_download': True,
                 }
                 
+                if self.request_gate:
+                    self.request_gate()
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                     search_results = ydl.extract_info(f"ytsearch10:{search_query}", download=False)
+                    completed_queries += 1
                     
                     if not search_results or 'entries' not in search_results:
                         continue
@@ -126,6 +153,18 @@ class SpotifySearchEngine:
                 continue
         
         self.logger.error(f"❌ Nenhum match encontrado para: {artist} - {title}")
+        
+        # Só registra falha se alguma busca respondeu (erro de rede não é "sem match")
+        if use_negative_cache and completed_queries:
+            self.cache.cache_track(
+                spotify_url=spotify_url,
+                spotify_id='',
+                title=title,
+                artist=artist,
+                duration_sec=duration_sec,
+                success=False,
+                error_message='Nenhum match encontrado'
+            )
         return None
     
     def _calculate_match_score(
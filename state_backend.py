@@ -0,0 +1,258 @@
+"""
+Estado compartilhado entre processos (status de downloads e fila)
+Backend em memória (um processo) ou SQLite/WAL (vários workers WSGI)
+Escolha via configure_state_backend() ou variável VINC_STATE_BACKEND
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_backend_kind = os.environ.get('VINC_STATE_BACKEND', 'memory').lower()
+_backend_db_path = os.environ.get('VINC_STATE_DB', 'downloads/shared_state.db')
+
+
+def process_alive(pid) -> bool:
+    """
+    Processo ainda existe? (dono de uma execução/vaga registrada no estado compartilhado)
+
+    Na dúvida responde True: quem chama só libera o recurso de processos mortos.
+    """
+    if str(pid) == str(os.getpid()):
+        return True
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) encerraria o processo no Windows
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, ValueError):
+        return True
+    return True
+
+
+class MemoryStateBackend(MutableMapping):
+    """Dict protegido por lock: visível apenas no processo atual"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = value
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            del self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @contextmanager
+    def transaction(self, key: str):
+        """Lê-modifica-grava atômico de um dict (mutável no próprio lugar)"""
+        with self._lock:
+            yield self._data.setdefault(key, {})
+
+
+class SQLiteStateBackend(MutableMapping):
+    """
+    Mapeamento persistido em SQLite (WAL), compartilhado por todos os workers
+
+    - Valores serializados em JSON; leitura sempre vê a última gravação de qualquer processo
+    - Gravações repetidas da mesma chave (ex.: progresso) são agrupadas: no máximo
+      uma a cada write_interval_sec, exceto quando o campo 'status' muda
+    - transaction() usa BEGIN IMMEDIATE: exclusão mútua entre processos
+    """
+
+    def __init__(self, namespace: str, db_path: str = 'downloads/shared_state.db',
+                 write_interval_sec: float = 0.25):
+        self.namespace = namespace
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.write_interval_sec = write_interval_sec
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Any] = {}
+        self._last_write: Dict[str, float] = {}
+        self._last_status: Dict[str, Any] = {}
+        self._flusher_pid: Optional[int] = None
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _init_db(self):
+        """Cria tabela se não existir"""
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS shared_state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+        ''')
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, key: str, value: Any):
+        conn.execute('''
+            INSERT INTO shared_state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(namespace, key) DO UPDATE SET
+                value = excluded.value,
+                updated_at = excluded.updated_at
+        ''', (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time()))
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT value FROM shared_state WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).fetchone()
+        conn.close()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key: str, value: Any):
+        status = value.get('status') if isinstance(value, dict) else None
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_write.get(key)
+            if last is not None and status == self._last_status.get(key) \
+                    and now - last < self.write_interval_sec:
+                # Só progresso: agrupa com a próxima gravação
+                self._pending[key] = value
+                self._ensure_flusher()
+                return
+            self._pending.pop(key, None)
+            self._last_write[key] = now
+            self._last_status[key] = status
+            conn = self._connect()
+            self._write(conn, key, value)
+            conn.close()
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._last_write.pop(key, None)
+            self._last_status.pop(key, None)
+            conn = self._connect()
+            deleted = conn.execute(
+                'DELETE FROM shared_state WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).rowcount
+            conn.close()
+        if not deleted:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        conn = self._connect()
+        keys = [row[0] for row in conn.execute(
+            'SELECT key FROM shared_state WHERE namespace = ?', (self.namespace,)
+        )]
+        conn.close()
+        return iter(keys)
+
+    def __len__(self) -> int:
+        conn = self._connect()
+        total = conn.execute(
+            'SELECT COUNT(*) FROM shared_state WHERE namespace = ?', (self.namespace,)
+        ).fetchone()[0]
+        conn.close()
+        return total
+
+    def _ensure_flusher(self):
+        """Thread que grava valores agrupados (uma por processo; chamado sob lock)"""
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name=f'state-flush-{self.namespace}', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.write_interval_sec)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao gravar estado compartilhado: {e}")
+
+    def flush(self):
+        """Grava imediatamente os valores agrupados pendentes"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            now = time.monotonic()
+            conn = self._connect()
+            conn.execute('BEGIN')
+            for key, value in pending.items():
+                self._write(conn, key, value)
+                self._last_write[key] = now
+            conn.execute('COMMIT')
+            conn.close()
+
+    @contextmanager
+    def transaction(self, key: str):
+        """Lê-modifica-grava atômico de um dict, exclusivo entre processos"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT value FROM shared_state WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).fetchone()
+            value = json.loads(row[0]) if row else {}
+            yield value
+            # Sem alteração: só encerra a transação (nada gravado no WAL)
+            if row is None or json.dumps(value, ensure_ascii=False) != row[0]:
+                self._write(conn, key, value)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+
+def configure_state_backend(kind: str, db_path: Optional[str] = None):
+    """Define o backend usado pelas próximas chamadas de get_state_backend()"""
+    global _backend_kind, _backend_db_path
+    if kind not in ('memory', 'sqlite'):
+        raise ValueError(f"Backend de estado desconhecido: {kind}")
+    _backend_kind = kind
+    if db_path:
+        _backend_db_path = db_path
+    logger.info(f"🧩 Backend de estado: {kind}")
+
+
+def get_state_backend(namespace: str) -> MutableMapping:
+    """Cria o mapeamento compartilhado de um namespace no backend configurado"""
+    if _backend_kind == 'sqlite':
+        return SQLiteStateBackend(namespace, db_path=_backend_db_path)
+    return MemoryStateBackend(namespace)
@@ -0,0 +1,107 @@
+"""
+Testes do arquivo de downloads (sem rede)
+Bloom filter na frente do SQLite, chaves do yt-dlp e importação do .txt legado
+"""
+
+import pytest
+
+from download_archive import BloomFilter, DownloadArchive, archive_key_from_url
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return DownloadArchive(db_path=str(tmp_path / 'download_archive.db'), legacy_txt=None)
+
+
+def test_archive_key_from_url():
+    assert archive_key_from_url('https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1') == 'youtube dQw4w9WgXcQ'
+    assert archive_key_from_url('https://youtu.be/dQw4w9WgXcQ') == 'youtube dQw4w9WgXcQ'
+    assert archive_key_from_url('https://youtube.com/shorts/dQw4w9WgXcQ') == 'youtube dQw4w9WgXcQ'
+    assert archive_key_from_url('https://www.youtube.com/watch?v=curto') is None
+    assert archive_key_from_url('https://vimeo.com/123') is None
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f'youtube {n:011d}' for n in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f'vimeo {n}' in bloom for n in range(10000))
+    assert false_positives < 10000 * 0.03
+
+
+def test_miss_is_answered_by_bloom_without_database(archive, monkeypatch):
+    archive.add('youtube dQw4w9WgXcQ', url='https://youtu.be/dQw4w9WgXcQ')
+
+    def _no_db():
+        raise AssertionError('consulta ao banco para item ausente')
+
+    monkeypatch.setattr(archive, '_connect', _no_db)
+    assert 'youtube aaaaaaaaaaa' not in archive
+    assert archive.lookup(url='https://vimeo.com/1') is None
+
+
+def test_lookup_by_key_or_url(archive, tmp_path):
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'x')
+    archive.add('vimeo 1', url='https://vimeo.com/1', platform='Vimeo')
+    archive.set_file('https://vimeo.com/1', str(video))
+    archive.add('youtube dQw4w9WgXcQ', url='https://youtu.be/dQw4w9WgXcQ')
+
+    assert 'vimeo 1' in archive
+    assert archive.lookup(url='https://vimeo.com/1')['archive_key'] == 'vimeo 1'
+    # Chave calculada da URL, mesmo com outra forma da URL
+    found = archive.lookup(url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    assert found['archive_key'] == 'youtube dQw4w9WgXcQ'
+    assert archive.lookup_existing_file(url='https://vimeo.com/1')['file_path'] == str(video)
+    assert archive.lookup_existing_file(url='https://youtu.be/dQw4w9WgXcQ') is None
+
+    video.unlink()
+    assert archive.lookup_existing_file(url='https://vimeo.com/1') is None
+
+
+def test_ytdlp_view_records_source_url(archive):
+    view = archive.for_url('https://vimeo.com/2', platform='Vimeo')
+    assert 'vimeo 2' not in view
+    view.add('vimeo 2')
+
+    assert 'vimeo 2' in view
+    assert archive.lookup(archive_key='vimeo 2')['url'] == 'https://vimeo.com/2'
+    assert archive.count() == 1
+
+
+def test_bloom_is_rebuilt_when_over_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(DownloadArchive, 'BLOOM_MIN_CAPACITY', 4)
+    archive = DownloadArchive(db_path=str(tmp_path / 'download_archive.db'), legacy_txt=None)
+    keys = [f'vimeo {n}' for n in range(20)]
+    for key in keys:
+        archive.add(key)
+
+    assert archive._bloom.capacity >= archive._bloom.count
+    assert all(key in archive for key in keys)
+
+
+def test_legacy_txt_is_imported_once(tmp_path):
+    legacy = tmp_path / 'download_archive.txt'
+    legacy.write_text('youtube dQw4w9WgXcQ\nvimeo 1\n\n', encoding='utf-8')
+    db_path = str(tmp_path / 'download_archive.db')
+
+    assert DownloadArchive(db_path=db_path, legacy_txt=str(legacy)).count() == 2
+    legacy.write_text('vimeo 2\n', encoding='utf-8')
+    reopened = DownloadArchive(db_path=db_path, legacy_txt=str(legacy))
+    assert reopened.count() == 2 and 'vimeo 2' not in reopened
+
+
+def test_shared_archive_sees_other_workers_entries(tmp_path):
+    db_path = str(tmp_path / 'download_archive.db')
+    first = DownloadArchive(db_path=db_path, legacy_txt=None)
+    second = DownloadArchive(db_path=db_path, legacy_txt=None)
+    first.shared = second.shared = True
+
+    second.add('vimeo 1', url='https://vimeo.com/1')
+
+    assert 'vimeo 1' in first
+    assert first.lookup(url='https://vimeo.com/1')['archive_key'] == 'vimeo 1'
+    assert 'vimeo 2' not in first
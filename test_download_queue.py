@@ -0,0 +1,232 @@
+"""
+Testes da fila de downloads (sem rede)
+Pausa/retomada/cancelamento cooperativos e estado compartilhado em SQLite
+"""
+
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from download_queue import CancellationToken, DownloadQueue, DownloadStatus
+from state_backend import SQLiteStateBackend
+
+
+@pytest.fixture
+def queue():
+    return DownloadQueue(max_parallel=2)
+
+
+def _add(queue, n: int = 1) -> str:
+    return queue.add(f'https://example.com/{n}', f'Vídeo {n}', 'YouTube')
+
+
+def test_claim_respects_order_and_parallel_limit(queue):
+    ids = [_add(queue, n) for n in range(3)]
+
+    first, second = queue.claim_next_task(), queue.claim_next_task()
+
+    assert [first.id, second.id] == ids[:2]
+    assert first.status == DownloadStatus.DOWNLOADING.value
+    assert queue.claim_next_task() is None
+    queue.complete_task(first.id, '/tmp/a.mp4')
+    assert queue.claim_next_task().id == ids[2]
+
+
+def test_pause_interrupts_run_and_frees_slot(queue):
+    task_id = _add(queue)
+    queue.claim_next_task()
+    token = queue.token_for(task_id)
+
+    queue.pause_task(task_id)
+
+    assert token.is_set() and token.reason == DownloadStatus.PAUSED.value
+    assert queue.interruption(task_id, token) == DownloadStatus.PAUSED.value
+    assert queue.get_task(task_id).status == DownloadStatus.PAUSED.value
+    assert queue.get_statistics()['active_slots'] == 0
+
+
+def test_resume_waits_for_paused_run_to_exit(queue):
+    task_id = _add(queue)
+    queue.claim_next_task()
+    old_token = queue.token_for(task_id)
+    queue.pause_task(task_id)
+    queue.resume_task(task_id)
+
+    # A thread pausada ainda não saiu: não pode haver duas no mesmo .part
+    assert queue.get_task(task_id).status == DownloadStatus.WAITING.value
+    assert queue.get_next_task() is None
+    assert queue.claim_next_task() is None
+
+    queue.release_token(task_id, old_token)
+    task = queue.claim_next_task()
+
+    assert task.id == task_id
+    new_token = queue.token_for(task_id)
+    assert new_token is not old_token and not new_token.is_set()
+    assert queue.is_current_run(task_id, new_token)
+    assert not queue.is_current_run(task_id, old_token)
+    assert task.run_owner == new_token.owner
+
+    # Liberação tardia da execução antiga não derruba a nova
+    queue.release_token(task_id, old_token)
+    assert queue.get_task(task_id).run_owner == new_token.owner
+
+
+def test_cancel_and_retry(queue):
+    task_id = _add(queue)
+    queue.claim_next_task()
+    token = queue.token_for(task_id)
+
+    queue.cancel_task(task_id)
+
+    assert token.reason == DownloadStatus.CANCELED.value
+    assert queue.get_task(task_id).status == DownloadStatus.CANCELED.value
+    queue.release_token(task_id, token)
+    queue.retry_task(task_id)
+    assert queue.claim_next_task().id == task_id
+
+
+def test_completed_task_cannot_be_canceled(queue):
+    task_id = _add(queue)
+    queue.claim_next_task()
+    queue.complete_task(task_id, '/tmp/a.mp4')
+
+    queue.cancel_task(task_id)
+
+    assert queue.get_task(task_id).status == DownloadStatus.COMPLETED.value
+    assert not queue.token_for(task_id).is_set()
+
+
+def test_bulk_operations(queue):
+    ids = [_add(queue, n) for n in range(3)]
+    queue.claim_next_task()
+
+    queue.pause_all()
+    assert all(queue.get_task(i).status == DownloadStatus.PAUSED.value for i in ids)
+
+    queue.resume_all()
+    assert sorted(queue.queue) == sorted(ids)
+    assert queue.get_statistics()['waiting'] == 3
+    queue.cancel_all()
+    assert queue.get_statistics()['canceled'] == 3
+
+
+def test_run_owner_of_dead_process_is_finished(queue):
+    task_id = _add(queue)
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    task = queue.get_task(task_id)
+
+    task.run_owner = f'{child.pid}:execucao'
+    if sys.platform != 'win32':
+        assert queue._run_finished(task)
+    # Deste processo, mas sem token vivo (thread já liberou a execução)
+    task.run_owner = CancellationToken().owner
+    assert queue._run_finished(task)
+
+
+def test_dispatcher_never_overlaps_runs_of_same_task(queue):
+    """Pausa seguida de retomada imediata: a nova execução começa após a antiga sair"""
+    task_id = _add(queue)
+    started = threading.Semaphore(0)
+    release_first = threading.Event()
+    finished = threading.Event()
+    running, overlaps, runs = [], [], []
+
+    def runner(task, token):
+        if running:
+            overlaps.append(task.id)
+        running.append(token)
+        runs.append(token)
+        started.release()
+        try:
+            if len(runs) == 1:
+                # Primeira execução: demora a perceber a pausa
+                release_first.wait(5)
+            else:
+                queue.complete_task(task.id, '/tmp/a.mp4')
+                finished.set()
+        finally:
+            running.remove(token)
+
+    queue.start_dispatcher(runner, poll_sec=0.05)
+    try:
+        assert started.acquire(timeout=5)
+        queue.pause_task(task_id)
+        queue.resume_task(task_id)
+        assert not started.acquire(timeout=0.3)
+
+        release_first.set()
+        assert started.acquire(timeout=5)
+        assert finished.wait(5)
+    finally:
+        queue.running = False
+        queue._wakeup.set()
+
+    assert overlaps == []
+    assert len(runs) == 2 and runs[0].reason == DownloadStatus.PAUSED.value
+    assert queue.get_task(task_id).status == DownloadStatus.COMPLETED.value
+
+
+# ----------------------------------------------------------------------
+# Estado compartilhado (dois "workers" no mesmo banco)
+# ----------------------------------------------------------------------
+
+@pytest.fixture
+def workers(tmp_path):
+    db_path = str(tmp_path / 'shared_state.db')
+    first, second = DownloadQueue(), DownloadQueue()
+    first.attach_backend(SQLiteStateBackend('download_queue', db_path=db_path))
+    second.attach_backend(SQLiteStateBackend('download_queue', db_path=db_path))
+    return first, second
+
+
+def _version(queue):
+    return queue.backend.get('state')['version']
+
+
+def test_shared_state_is_seen_by_other_worker(workers):
+    first, second = workers
+    task_id = _add(first)
+
+    assert second.get_task(task_id).title == 'Vídeo 1'
+    task = second.claim_next_task()
+    assert task.id == task_id and first.claim_next_task() is None
+
+
+def test_pause_from_other_worker_reaches_running_download(workers):
+    first, second = workers
+    task_id = _add(first)
+    first.claim_next_task()
+    token = first.token_for(task_id)
+
+    second.pause_task(task_id)
+
+    assert first.interruption(task_id, token, recheck_sec=0) == DownloadStatus.PAUSED.value
+    assert token.is_set()
+
+
+def test_reads_do_not_bump_shared_version(workers):
+    first, second = workers
+    task_id = _add(first)
+    version = _version(first)
+
+    second.get_task(task_id)
+    second.get_all_tasks()
+    second.get_statistics()
+    second.get_next_task()
+    second.update_progress('inexistente', 10.0)
+
+    assert _version(first) == version
+    first.update_progress(task_id, 10.0)
+    assert _version(first) == version + 1
+
+
+def test_write_inside_read_only_section_is_rejected(workers):
+    first, _ = workers
+    with first._locked(write=False):
+        with pytest.raises(RuntimeError):
+            with first._locked():
+                pass
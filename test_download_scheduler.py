@@ -0,0 +1,344 @@
+"""
+Testes do agendador de downloads (sem rede)
+Token bucket com relógio simulado, perfis de horário e cortesia por host
+"""
+
+import json
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import download_scheduler
+from download_scheduler import DownloadScheduler, TokenBucket
+from state_backend import SQLiteStateBackend
+
+
+class FakeClock:
+    """Substitui o módulo time do agendador: dormir só avança o relógio"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(download_scheduler, 'time', fake)
+    return fake
+
+
+def _scheduler(**config):
+    return DownloadScheduler(config_provider=lambda: config)
+
+
+# ----------------------------------------------------------------------
+# Token bucket
+# ----------------------------------------------------------------------
+
+def test_unlimited_bucket_never_waits(clock):
+    assert TokenBucket(0).reserve(10 ** 9) == 0.0
+
+
+def test_bucket_debt_is_paid_with_time(clock):
+    bucket = TokenBucket(rate_bps=1000, burst_sec=1.0)
+
+    # Começa vazio: 500 bytes custam 0.5 s; o débito acumula
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    assert bucket.reserve(500) == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.reserve(0) == pytest.approx(0.0)
+
+
+def test_bucket_burst_is_capped(clock):
+    bucket = TokenBucket(rate_bps=1000, burst_sec=2.0, full=True)
+    assert bucket.reserve(2000) == 0.0
+
+    # Ocioso por muito tempo: acumula no máximo burst_sec * rate
+    clock.now += 60
+    assert bucket.reserve(2000) == 0.0
+    assert bucket.reserve(1000) == pytest.approx(1.0)
+
+
+def test_bucket_rate_change_keeps_debt(clock):
+    bucket = TokenBucket(rate_bps=1000)
+    bucket.reserve(1000)
+    bucket.set_rate(2000)
+    assert bucket.reserve(0) == pytest.approx(0.5)
+    bucket.set_rate(0)
+    assert bucket.reserve(10 ** 6) == 0.0
+
+
+# ----------------------------------------------------------------------
+# Limites de banda
+# ----------------------------------------------------------------------
+
+def test_scheduled_limit_crosses_midnight():
+    schedule = [{'start': '08:00', 'end': '18:00', 'limit_kbps': 100},
+                {'start': '22:00', 'end': '02:00', 'limit_kbps': 500},
+                {'start': 'inválido'}]
+    at = lambda hour: datetime(2026, 1, 1, hour, 30)
+
+    assert DownloadScheduler._scheduled_limit(schedule, 0, at(9)) == 100
+    assert DownloadScheduler._scheduled_limit(schedule, 0, at(23)) == 500
+    assert DownloadScheduler._scheduled_limit(schedule, 0, at(1)) == 500
+    assert DownloadScheduler._scheduled_limit(schedule, 42, at(20)) == 42
+
+
+def test_progress_hook_throttles_by_global_and_platform_limits(clock):
+    scheduler = _scheduler(bandwidth_limit_kbps=100,
+                           bandwidth_platform_limits_kbps={'YouTube': 50})
+    hook = scheduler.make_progress_hook('YouTube')
+
+    # O primeiro relatório de cada arquivo é a base (nada a cobrar)
+    hook({'status': 'downloading', 'filename': 'a', 'downloaded_bytes': 0})
+    hook({'status': 'downloading', 'filename': 'a', 'downloaded_bytes': 50 * 1024})
+    hook({'status': 'downloading', 'filename': 'a', 'downloaded_bytes': 100 * 1024})
+
+    # O bucket da plataforma (50 KB/s) é o mais restritivo: 100 KB levam 2 s
+    assert sum(clock.slept) == pytest.approx(2.0)
+    clock.slept.clear()
+
+    # Outra plataforma só paga o bucket global (100 KB/s): a rajada acumulada
+    # enquanto o YouTube dormia cobre o primeiro bloco, o segundo espera 1 s
+    other = scheduler.make_progress_hook('Vimeo')
+    other({'status': 'downloading', 'filename': 'b', 'downloaded_bytes': 0})
+    other({'status': 'downloading', 'filename': 'b', 'downloaded_bytes': 100 * 1024})
+    assert clock.slept == []
+    other({'status': 'downloading', 'filename': 'b', 'downloaded_bytes': 200 * 1024})
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+
+def test_progress_hook_does_not_charge_resumed_part(clock):
+    scheduler = _scheduler(bandwidth_limit_kbps=100)
+    hook = scheduler.make_progress_hook('YouTube')
+
+    # .part de 50 MB retomado: o primeiro relatório já traz o tamanho no disco
+    hook({'status': 'downloading', 'filename': 'a', 'downloaded_bytes': 50 * 1024 * 1024})
+    assert clock.slept == []
+    hook({'status': 'downloading', 'filename': 'a', 'downloaded_bytes': 50 * 1024 * 1024 + 100 * 1024})
+    assert sum(clock.slept) == pytest.approx(1.0)
+    clock.slept.clear()
+
+    # Com resume_len, o primeiro bloco lido nesta execução também é cobrado
+    hook({'status': 'finished', 'filename': 'a'})
+    hook({'status': 'downloading', 'filename': 'b', 'resume_len': 1024 * 1024,
+          'downloaded_bytes': 1024 * 1024 + 100 * 1024})
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+
+def test_subprocess_rate_limit_is_fair_share(clock):
+    scheduler = _scheduler(bandwidth_limit_kbps=1000,
+                           bandwidth_platform_limits_kbps={'Spotify': 200})
+    assert scheduler.subprocess_rate_limit('YouTube') == 1000 * 1024
+
+    with scheduler.transfer('YouTube'):
+        assert scheduler.subprocess_rate_limit('YouTube') == 500 * 1024
+        assert scheduler.subprocess_rate_limit('Spotify') == 200 * 1024
+
+    assert _scheduler().subprocess_rate_limit('YouTube') == 0
+
+
+# ----------------------------------------------------------------------
+# Cortesia por host
+# ----------------------------------------------------------------------
+
+def _start_transfer(scheduler, platform, log):
+    """Inicia transfer() numa thread; retorna (waiting, entered, leave, thread)"""
+    waiting, entered, leave = threading.Event(), threading.Event(), threading.Event()
+
+    def _run():
+        with scheduler.transfer(platform, on_wait=waiting.set):
+            log.append(platform)
+            entered.set()
+            leave.wait(5)
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return waiting, entered, leave, thread
+
+
+def test_host_slots_queue_in_arrival_order():
+    scheduler = _scheduler(host_max_concurrent={'YouTube': 1})
+    log = []
+    first = _start_transfer(scheduler, 'YouTube', log)
+    assert first[1].wait(5)
+    second = _start_transfer(scheduler, 'YouTube', log)
+    assert second[0].wait(5) and not second[1].is_set()
+
+    # Outro host não espera o YouTube
+    other = _start_transfer(scheduler, 'Vimeo', log)
+    assert other[1].wait(5) and not other[0].is_set()
+    assert scheduler.get_status()['hosts']['YouTube']['waiting'] == 1
+
+    first[2].set()
+    assert second[1].wait(5)
+    for _, _, leave, thread in (first, second, other):
+        leave.set()
+        thread.join(5)
+    assert log == ['YouTube', 'Vimeo', 'YouTube']
+    assert scheduler.get_status()['active_transfers'] == {}
+
+
+def test_rate_limited_host_backs_off_to_one_slot(clock):
+    scheduler = _scheduler(host_default_max_concurrent=3, host_backoff_sec=60)
+    assert not scheduler.report_error('YouTube', 'HTTP Error 404')
+    assert scheduler.report_error('YouTube', 'HTTP Error 429: Too Many Requests')
+
+    with scheduler.transfer('YouTube'):
+        status = scheduler.get_status()['hosts']['YouTube']
+        assert status['max_concurrent'] == 1
+        assert status['backoff_remaining_sec'] == pytest.approx(60)
+
+    clock.now += 61
+    assert scheduler.get_status()['hosts']['YouTube']['max_concurrent'] == 3
+
+
+def test_requests_per_minute_allow_burst_then_space(clock):
+    scheduler = _scheduler(host_requests_per_minute={'YouTube': 60})
+    for _ in range(DownloadScheduler.HOST_REQUEST_BURST):
+        scheduler.pace_request('YouTube')
+    assert clock.slept == []
+
+    scheduler.pace_request('YouTube')
+    scheduler.pace_request('YouTube')
+    assert clock.slept == [pytest.approx(1.0), pytest.approx(1.0)]
+
+    # Host sem limite configurado não espera
+    scheduler.pace_request('Vimeo')
+    assert len(clock.slept) == 2
+
+
+# ----------------------------------------------------------------------
+# Vários workers (estado em SQLite)
+# ----------------------------------------------------------------------
+
+def _shared_scheduler(db_path, **config):
+    scheduler = _scheduler(**config)
+    scheduler.attach_backend(SQLiteStateBackend('download_scheduler', db_path=str(db_path)))
+    return scheduler
+
+
+def test_shared_buckets_are_charged_by_every_worker(clock, tmp_path):
+    db_path = tmp_path / 'shared_state.db'
+    first = _shared_scheduler(db_path, bandwidth_limit_kbps=100)
+    second = _shared_scheduler(db_path, bandwidth_limit_kbps=100)
+    # Dormir não avança o relógio: os dois workers debitam no mesmo instante
+    clock.sleep = clock.slept.append
+
+    first.throttle('YouTube', 50 * 1024)
+    second.throttle('Vimeo', 50 * 1024)
+
+    # O débito do primeiro worker é visto pelo segundo (buckets separados: 0.5 s cada)
+    assert clock.slept == [pytest.approx(0.5), pytest.approx(1.0)]
+
+
+def test_shared_host_slot_and_backoff(tmp_path):
+    db_path = tmp_path / 'shared_state.db'
+    first = _shared_scheduler(db_path, host_max_concurrent={'YouTube': 1}, host_backoff_sec=60)
+    second = _shared_scheduler(db_path, host_max_concurrent={'YouTube': 1})
+    log = []
+
+    running = _start_transfer(first, 'YouTube', log)
+    assert running[1].wait(5)
+    waiting = _start_transfer(second, 'YouTube', log)
+    assert waiting[0].wait(5) and not waiting[1].is_set()
+    assert first.get_status()['hosts']['YouTube'] == pytest.approx({
+        'active': 1, 'waiting': 1, 'max_concurrent': 1,
+        'requests_per_minute': 0, 'backoff_remaining_sec': 0
+    })
+
+    running[2].set()
+    assert waiting[1].wait(5)
+    waiting[2].set()
+    for _, _, _, thread in (running, waiting):
+        thread.join(5)
+    assert log == ['YouTube', 'YouTube']
+    assert second.get_status()['active_transfers'] == {}
+
+    # 429 em um worker reduz o host a 1 slot em todos
+    first.report_error('Vimeo', 'HTTP Error 429')
+    assert second.get_status()['hosts']['Vimeo']['max_concurrent'] == 1
+
+
+def test_slot_of_dead_worker_is_released(tmp_path):
+    scheduler = _shared_scheduler(tmp_path / 'shared_state.db', host_max_concurrent={'YouTube': 1})
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    with scheduler.backend.transaction('hosts') as hosts:
+        hosts['YouTube'] = {'active': [f'{child.pid}:morto'], 'waiting': []}
+
+    if sys.platform != 'win32':
+        with scheduler.transfer('YouTube'):
+            assert scheduler.get_status()['active_transfers'] == {'YouTube': 1}
+
+
+_WORKER = """
+import json, sys, time
+from download_scheduler import DownloadScheduler
+from state_backend import SQLiteStateBackend
+
+db_path, mode, start_at = sys.argv[1], sys.argv[2], float(sys.argv[3])
+config = {'bandwidth_limit_kbps': 100, 'host_max_concurrent': {'YouTube': 1 if mode == 'host' else 0}}
+scheduler = DownloadScheduler(config_provider=lambda: config)
+scheduler.attach_backend(SQLiteStateBackend('download_scheduler', db_path=db_path))
+time.sleep(max(0.0, start_at - time.time()))
+if mode == 'host':
+    with scheduler.transfer('YouTube'):
+        entered = time.time()
+        time.sleep(0.3)
+        left = time.time()
+else:
+    entered = time.time()
+    for _ in range(10):
+        scheduler.throttle('YouTube', 5 * 1024)
+    left = time.time()
+print(json.dumps([entered, left]))
+"""
+
+
+def _run_workers(tmp_path, mode: str):
+    """Dois processos partindo juntos; retorna [(entrada, saída)] e o instante de partida"""
+    db_path = str(tmp_path / 'shared_state.db')
+    SQLiteStateBackend('download_scheduler', db_path=db_path)
+    start_at = time.time() + 1.5
+    workers = [
+        subprocess.Popen([sys.executable, '-c', _WORKER, db_path, mode, str(start_at)],
+                         cwd=str(Path(__file__).parent), stdout=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    results = []
+    for worker in workers:
+        out, _ = worker.communicate(timeout=30)
+        assert worker.returncode == 0
+        results.append(json.loads(out))
+    return sorted(results), start_at
+
+
+def test_two_processes_share_one_bandwidth_cap(tmp_path):
+    results, start_at = _run_workers(tmp_path, 'bandwidth')
+
+    # 2 x 50 KB a 100 KB/s: com buckets por processo cada um terminaria em 0.5 s
+    assert max(left for _, left in results) - start_at >= 0.9
+
+
+def test_two_processes_share_one_host_slot(tmp_path):
+    results, _ = _run_workers(tmp_path, 'host')
+    (_, first_left), (second_entered, _) = results
+
+    assert second_entered >= first_left
@@ -0,0 +1,127 @@
+"""
+Testes do catálogo de arquivos (sem rede)
+Totais mantidos por triggers, reconciliação com o disco e dedupe por hardlink
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from file_catalog import FileCatalog, classify_path
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return FileCatalog(root=str(tmp_path / 'downloads'))
+
+
+def _write(catalog, rel, data: bytes):
+    path = catalog.root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def _exact_totals(catalog):
+    conn = sqlite3.connect(str(catalog.db_path))
+    rows = conn.execute('''
+        SELECT COALESCE(platform, 'other'), COUNT(*), SUM(size) FROM catalog_files
+        GROUP BY COALESCE(platform, 'other')
+    ''').fetchall()
+    conn.close()
+    return {platform: {'files': files, 'bytes': size} for platform, files, size in rows}
+
+
+def test_classify_path():
+    assert classify_path('audio/YouTube/Artista/a.mp3') == ('audio', 'YouTube')
+    assert classify_path('spotify/Artista/a.mp3') == ('audio', 'Spotify')
+    assert classify_path('solto.mp4') == (None, None)
+
+
+def test_totals_follow_inserts_updates_and_deletes(catalog):
+    a = _write(catalog, 'audio/YouTube/a.mp3', b'a' * 10)
+    b = _write(catalog, 'video/Vimeo/b.mp4', b'b' * 20)
+    _write(catalog, 'spotify/c.mp3', b'c' * 30)
+    catalog.record_file(a)
+    catalog.record_file(b)
+    catalog.reconcile()
+
+    a.write_bytes(b'a' * 15)
+    catalog.record_file(a)
+    catalog.forget_file(b)
+
+    totals = catalog.get_totals()
+    assert totals['files'] == 2 and totals['bytes'] == 45
+    assert totals['by_platform'] == _exact_totals(catalog)
+    assert totals['by_media_type'] == {'audio': {'files': 2, 'bytes': 45}}
+
+
+def test_reconcile_picks_up_external_changes(catalog):
+    kept = _write(catalog, 'audio/YouTube/a.mp3', b'1')
+    gone = _write(catalog, 'audio/YouTube/b.mp3', b'22')
+    _write(catalog, 'file_catalog.db-wal', b'ignorado')
+    assert catalog.reconcile() == {'scanned': 2, 'updated': 2, 'removed': 0}
+
+    gone.unlink()
+    _write(catalog, 'audio/YouTube/c.mp3', b'333')
+    assert catalog.reconcile() == {'scanned': 2, 'updated': 1, 'removed': 1}
+
+    listed = catalog.list_files(sort='size', order='asc')
+    assert [entry['name'] for entry in listed['files']] == [kept.name, 'c.mp3']
+    assert catalog.get_totals()['bytes'] == 4
+
+
+def test_dedupe_links_identical_content(catalog):
+    payload = os.urandom(4096)
+    original = _write(catalog, 'audio/YouTube/a.mp3', payload)
+    copy = _write(catalog, 'audio/YouTube/b.mp3', payload)
+    catalog.record_file(original)
+    catalog.record_file(copy)
+
+    # Só o mais recente (empate de added_at: maior caminho) vira link
+    assert catalog.dedupe_file('audio/YouTube/a.mp3') == 0
+    assert catalog.dedupe_file('audio/YouTube/b.mp3') == len(payload)
+
+    assert os.stat(original).st_ino == os.stat(copy).st_ino
+    assert copy.read_bytes() == payload
+    assert not list(catalog.root.rglob('*.dedupe-tmp'))
+    assert catalog.get_dedupe_stats() == {'linked_files': 1, 'reclaimed_bytes': len(payload), 'pending': 0}
+
+    # Já é o mesmo inode: nada a fazer na próxima passada
+    assert catalog.dedupe_all()['linked'] == 0
+
+
+def test_dedupe_skips_same_size_different_content(catalog):
+    a = _write(catalog, 'audio/YouTube/a.mp3', b'x' * 1000)
+    b = _write(catalog, 'audio/YouTube/b.mp3', b'y' * 1000)
+    catalog.record_file(a)
+    catalog.record_file(b)
+
+    assert catalog.dedupe_all() == {'checked': 2, 'linked': 0, 'reclaimed_bytes': 0}
+    assert os.stat(a).st_ino != os.stat(b).st_ino
+    assert b.read_bytes() == b'y' * 1000
+
+
+def test_dedupe_all_keeps_oldest_entry(catalog):
+    payload = b'z' * 2048
+    files = [_write(catalog, f'audio/YouTube/{n}.mp3', payload) for n in range(3)]
+    for path in files:
+        catalog.record_file(path)
+
+    result = catalog.dedupe_all()
+
+    assert result['linked'] == 2 and result['reclaimed_bytes'] == 2 * len(payload)
+    assert len({os.stat(path).st_ino for path in files}) == 1
+
+
+def test_periodic_runs_are_claimed_by_one_worker(catalog):
+    other = FileCatalog(root=str(catalog.root))
+
+    assert catalog._claim_run('reconcile_due', 600)
+    assert not other._claim_run('reconcile_due', 600)
+    assert not catalog._claim_run('reconcile_due', 600)
+
+    # Reserva vencida: qualquer worker pega a próxima rodada
+    assert other._claim_run('dedupe_backfill_due', 0)
+    assert catalog._claim_run('dedupe_backfill_due', 0)
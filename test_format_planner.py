@@ -0,0 +1,92 @@
+"""
+Testes do planejador de formatos (sem rede, sem ffmpeg)
+Seletores do yt-dlp que permitem cópia de stream em vez de reencode
+"""
+
+import pytest
+
+from format_planner import (
+    audio_codec_family, codec_matches, parse_quality, plan_audio, plan_video,
+    quality_label, resolve_audio_format, QUALITY_LADDER, QUALITY_ORDER,
+)
+
+
+@pytest.mark.parametrize('height, fps, label', [
+    (4320, 30, '8K'), (2160, 60, '4K'), (1440, None, '2K'),
+    (1080, 30, '1080p'), (1080, 60, '1080p60'), (720, 25, '720p'), (720, 50, '720p60'),
+    (480, 30, '480p'), (360, None, '360p'), (144, None, '240p'),
+])
+def test_quality_label(height, fps, label):
+    assert quality_label(height, fps) == label
+
+
+def test_quality_ladder_round_trips():
+    assert set(QUALITY_LADDER) == set(QUALITY_ORDER)
+    for label, (height, fps) in QUALITY_LADDER.items():
+        assert parse_quality(label) == (height, fps, None)
+        assert quality_label(height, fps) == label
+
+
+@pytest.mark.parametrize('quality, expected', [
+    (None, (None, None, None)),
+    ('best', (None, None, None)),
+    ('2160p', (2160, None, None)),
+    ('1080p', (1080, 30, None)),
+    ('720p60', (720, 60, None)),
+    ('137', (None, None, '137')),
+    ('hls-1080p', (None, None, 'hls-1080p')),
+    ('rm -rf /', (None, None, None)),
+])
+def test_parse_quality(quality, expected):
+    assert parse_quality(quality) == expected
+
+
+def test_audio_codec_families():
+    assert audio_codec_family('mp4a.40.2') == 'm4a'
+    assert audio_codec_family('opus') == 'opus'
+    assert audio_codec_family('none') is None
+    assert codec_matches('aac', 'mp4a.40.5')
+    assert codec_matches('m4a', 'mp4a.40.2')
+    assert not codec_matches('mp3', 'opus')
+    assert not codec_matches('mp3', None)
+
+
+def test_plan_audio_prefers_stream_in_target_codec():
+    assert plan_audio('m4a') == {'format': 'ba[acodec^=mp4a]/bestaudio/best'}
+    assert plan_audio('opus') == {'format': 'ba[acodec=opus]/bestaudio/best'}
+    assert plan_audio('wav') == {'format': 'bestaudio/best'}
+
+
+@pytest.mark.parametrize('requested, acodec, keep_native, expected', [
+    ('mp3', 'opus', False, 'mp3'),
+    ('mp3', 'opus', True, 'opus'),
+    ('mp3', 'mp4a.40.2', True, 'm4a'),
+    ('flac', 'opus', True, 'flac'),
+    ('wav', 'mp4a.40.2', True, 'wav'),
+    ('mp3', 'flac', True, 'mp3'),
+    ('mp3', None, True, 'mp3'),
+])
+def test_resolve_audio_format(requested, acodec, keep_native, expected):
+    assert resolve_audio_format(requested, acodec, keep_native) == expected
+
+
+def test_plan_video_mp4_prefers_copyable_pair():
+    opts = plan_video()
+    assert opts['format'] == 'bv*+ba/b'
+    assert opts['format_sort'] == ['res', 'fps', 'ext:mp4:m4a']
+    assert opts['merge_output_format'] == 'mp4/mkv'
+
+
+def test_plan_video_caps_resolution_and_fps():
+    opts = plan_video(container='webm', quality='1080p')
+    assert opts['format_sort'] == ['res:1080', 'fps:30', 'ext:webm:webm']
+    assert opts['merge_output_format'] == 'webm/mkv'
+
+    assert plan_video(quality='4K')['format_sort'][:2] == ['res:2160', 'fps']
+
+
+def test_plan_video_codec_and_format_id():
+    opts = plan_video(video_codec='vp9', container='mkv', quality='137')
+    assert opts['format'] == '137/bv*[vcodec*=vp9]+ba/bv*[vcodec*=vp9]/b'
+    assert opts['format_sort'] == ['res', 'fps']
+    assert opts['merge_output_format'] == 'mkv'
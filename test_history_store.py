@@ -0,0 +1,81 @@
+"""
+Testes do histórico de downloads em SQLite (sem rede)
+Agregados mantidos por triggers, retenção e paginação
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from history_store import DownloadHistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DownloadHistoryStore(db_path=str(tmp_path / 'history.db'))
+
+
+def _record(n: int, status: str = 'completed', platform: str = 'YouTube', days_ago: float = 0):
+    return {
+        'url': f'https://example.com/{n}',
+        'title': f'Vídeo {n}',
+        'platform': platform,
+        'status': status,
+        'size': 1024 * 1024 * n,
+        'format': 'mp4',
+        'timestamp': (datetime.now() - timedelta(days=days_ago)).isoformat(),
+    }
+
+
+def test_statistics_follow_inserts_and_cleanup(store):
+    store.add(_record(1))
+    store.add(_record(2, platform='Vimeo'))
+    store.add(_record(3, status='failed'))
+    store.add(_record(4, days_ago=40))
+
+    stats = store.get_statistics()
+    assert stats['total_downloads'] == 4
+    assert stats['successful'] == 3 and stats['failed'] == 1
+    assert stats['total_size_mb'] == 1 + 2 + 4
+    assert stats['platforms'] == {'YouTube': 3, 'Vimeo': 1}
+
+    assert store.cleanup(30) == 1
+    stats = store.get_statistics()
+    assert stats['total_downloads'] == 3
+    assert stats['total_size_mb'] == 1 + 2
+    assert stats['success_rate'] == pytest.approx(200 / 3)
+
+
+def test_import_records_keeps_order_and_extra_fields(store):
+    legacy = [_record(n, days_ago=n) for n in range(1, 4)]
+    assert store.import_records(legacy) == 3
+
+    recent = store.recent()
+    assert [r['title'] for r in recent] == ['Vídeo 1', 'Vídeo 2', 'Vídeo 3']
+    assert recent[0]['format'] == 'mp4'
+    assert store.recent(limit=1, offset=1, status='completed')[0]['title'] == 'Vídeo 2'
+
+
+def test_retention_prunes_on_add(tmp_path):
+    store = DownloadHistoryStore(db_path=str(tmp_path / 'history.db'), retention_days=7)
+    store.add(_record(1, days_ago=30))
+    store._last_prune = time.time() - DownloadHistoryStore.PRUNE_INTERVAL_SEC
+    store.add(_record(2))
+
+    assert [r['title'] for r in store.recent()] == ['Vídeo 2']
+    assert store.get_statistics()['total_downloads'] == 1
+
+
+def test_statistics_count_each_download_once(store):
+    # Registro 'queued' (versões antigas) seguido do resultado do mesmo download
+    store.add(_record(1, status='queued'))
+    store.add(_record(1))
+    store.add(_record(2, status='queued'))
+    store.add(_record(2, status='failed'))
+
+    stats = store.get_statistics()
+    assert stats['total_downloads'] == 2
+    assert stats['success_rate'] == pytest.approx(50)
+    assert stats['platforms'] == {'YouTube': 2}
+    assert len(store.recent()) == 4
@@ -0,0 +1,100 @@
+"""
+Testes do pool de pós-processamento (sem ffmpeg)
+Cópia de stream quando o codec já serve; reencode só quando necessário
+"""
+
+from pathlib import Path
+
+import pytest
+
+import postprocess_pool
+from postprocess_pool import PostProcessPool
+
+
+class FakeToolchain:
+    ffmpeg = 'ffmpeg'
+
+    @staticmethod
+    def pick_encoder(encoders):
+        return encoders[-1]
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    """ffmpeg simulado: registra o comando e cria o arquivo de saída"""
+    executed = []
+
+    def _fake_run(cmd, creationflags=0):
+        executed.append(cmd)
+        Path(cmd[-1]).write_bytes(b'audio')
+        return 0, '', 0.25
+
+    monkeypatch.setattr(postprocess_pool, 'get_toolchain', lambda: FakeToolchain())
+    monkeypatch.setattr(postprocess_pool, '_run_measured', _fake_run)
+    return executed
+
+
+@pytest.fixture
+def pool():
+    pool = PostProcessPool(workers=1, niceness=0)
+    yield pool
+    pool.shutdown()
+
+
+def test_matching_codec_is_stream_copied(pool, commands, tmp_path):
+    src = tmp_path / 'faixa.webm'
+    src.write_bytes(b'original')
+
+    result = pool.convert_audio(str(src), 'opus', tags={'title': 'Faixa'},
+                                source_codec='opus', duration=200)
+
+    assert result['stream_copy'] and result['path'] == str(tmp_path / 'faixa.opus')
+    cmd = commands[0]
+    assert cmd[cmd.index('-c:a') + 1] == 'copy'
+    assert '-b:a' not in cmd
+    assert 'title=Faixa' in cmd
+    # Estimativa pela tabela padrão: 0.015 s de CPU por segundo de mídia
+    assert result['cpu_saved_sec'] == pytest.approx(0.015 * 200 - 0.25)
+    assert not src.exists() and Path(result['path']).read_bytes() == b'audio'
+    assert not list(tmp_path.glob('*.temp.*'))
+
+
+def test_different_codec_is_transcoded(pool, commands, tmp_path):
+    src = tmp_path / 'faixa.webm'
+    src.write_bytes(b'original')
+
+    result = pool.convert_audio(str(src), 'mp3', bitrate='192', source_codec='opus', duration=100)
+
+    assert not result['stream_copy'] and result['cpu_saved_sec'] == 0
+    cmd = commands[0]
+    assert cmd[cmd.index('-c:a') + 1] == 'libshine'
+    assert cmd[cmd.index('-b:a') + 1] == '192k'
+
+    # Os contadores de conclusão são atualizados pelo callback do Future
+    pool.shutdown()
+    status = pool.get_status()
+    assert status['transcodes'] == 1 and status['stream_copies'] == 0
+    assert status['completed'] == 1 and status['queued'] == 0
+
+
+def test_lossless_target_has_no_bitrate(pool, commands, tmp_path):
+    src = tmp_path / 'faixa.m4a'
+    src.write_bytes(b'original')
+
+    pool.convert_audio(str(src), 'flac', bitrate='320', source_codec='mp4a.40.2')
+
+    assert '-b:a' not in commands[0]
+
+
+def test_ffmpeg_failure_keeps_source(pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(postprocess_pool, 'get_toolchain', lambda: FakeToolchain())
+    monkeypatch.setattr(postprocess_pool, '_run_measured', lambda cmd, creationflags=0: (1, 'erro', 0.1))
+    src = tmp_path / 'faixa.webm'
+    src.write_bytes(b'original')
+
+    with pytest.raises(RuntimeError, match='ffmpeg falhou'):
+        pool.convert_audio(str(src), 'mp3', source_codec='opus')
+
+    assert src.read_bytes() == b'original'
+    pool.shutdown()
+    assert pool.get_status()['failed'] == 1
@@ -0,0 +1,53 @@
+"""
+Testes do alocador de numeração (sem rede)
+Sequências por pasta e números de artista compartilhados entre workers
+"""
+
+import json
+
+import pytest
+
+from sequence_allocator import SequenceAllocator
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'sequences.db')
+
+
+def test_sequence_continues_legacy_seq_and_is_shared(db_path, tmp_path):
+    folder = tmp_path / 'Playlist'
+    folder.mkdir()
+    (folder / '.seq').write_text('7', encoding='utf-8')
+    first, second = SequenceAllocator(db_path), SequenceAllocator(db_path)
+
+    # Dois workers alternando na mesma pasta nunca repetem número
+    numbers = [alloc.next_sequence(folder) for alloc in (first, second, first, second)]
+
+    assert numbers == [8, 9, 10, 11]
+    assert SequenceAllocator(db_path).next_sequence(tmp_path / 'Outra') == 1
+
+
+def test_artist_numbers_are_stable_across_workers(db_path, tmp_path):
+    scope = tmp_path / 'YouTube'
+    scope.mkdir()
+    (scope / '.artists_index.json').write_text(
+        json.dumps({'map': {'artista antigo': 4}, 'next': 5}), encoding='utf-8')
+    first, second = SequenceAllocator(db_path), SequenceAllocator(db_path)
+
+    assert first.artist_number(scope, 'Artista Antigo') == 4
+    assert first.artist_number(scope, 'Novo') == 5
+    # O segundo worker carregou antes da atribuição: consulta o banco
+    assert second.artist_number(scope, 'NOVO') == 5
+    assert second.artist_number(scope, 'Outro') == 6
+    assert first.artist_number(scope, 'outro') == 6
+
+
+def test_connection_is_reopened_in_new_process(db_path, tmp_path):
+    allocator = SequenceAllocator(db_path)
+    assert allocator.next_sequence(tmp_path) == 1
+    inherited = allocator._conn
+
+    allocator._conn_pid = -1  # como após um fork
+    assert allocator.next_sequence(tmp_path) == 2
+    assert allocator._conn is not inherited
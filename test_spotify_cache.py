@@ -0,0 +1,229 @@
+"""
+Testes do cache do Spotify (sem rede)
+Diff incremental de playlists, contadores por trigger e backoff do cache negativo
+"""
+
+import sqlite3
+
+import pytest
+
+from spotify_cache import SpotifyCacheManager, _longest_increasing_run
+
+
+def _track(n: int) -> dict:
+    return {
+        'url': f'https://open.spotify.com/track/{n:022d}',
+        'title': f'Música {n}',
+        'artist': f'Artista {n % 3}',
+        'duration': 180 + n,
+    }
+
+
+def _titles(entries):
+    return [entry['title'] for entry in entries]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SpotifyCacheManager(db_path=str(tmp_path / 'spotify_cache.db'))
+
+
+def _positions(cache, playlist_id):
+    conn = sqlite3.connect(str(cache.db_path))
+    rows = dict(conn.execute(
+        'SELECT entry_key, position FROM playlist_tracks WHERE playlist_id = ?', (playlist_id,)
+    ).fetchall())
+    conn.close()
+    return rows
+
+
+# ----------------------------------------------------------------------
+# Playlists: posições fracionárias + maior subsequência crescente
+# ----------------------------------------------------------------------
+
+def test_longest_increasing_run():
+    assert _longest_increasing_run([]) == set()
+    assert _longest_increasing_run([1.0, 5.0, 2.0, 3.0, 4.0]) == {0, 2, 3, 4}
+    assert len(_longest_increasing_run([3.0, 2.0, 1.0])) == 1
+
+
+def test_playlist_first_sync_adds_everything(cache):
+    tracks = [_track(n) for n in range(5)]
+    summary = cache.cache_playlist('pl', 'https://open.spotify.com/playlist/pl', 'Lista', 5, tracks)
+
+    assert summary['added'] == tracks
+    assert summary['removed'] == [] and summary['moved'] == 0
+    assert _titles(cache.get_cached_playlist('pl')['metadata']) == _titles(tracks)
+
+
+def test_playlist_insert_keeps_existing_positions(cache):
+    tracks = [_track(n) for n in range(5)]
+    cache.cache_playlist('pl', 'url', 'Lista', 5, tracks)
+    before = _positions(cache, 'pl')
+
+    tracks.insert(2, _track(99))
+    summary = cache.cache_playlist('pl', 'url', 'Lista', 6, tracks)
+
+    assert summary['added'] == [_track(99)]
+    assert summary['moved'] == 0 and summary['removed'] == []
+    after = _positions(cache, 'pl')
+    assert all(after[key] == position for key, position in before.items())
+    assert _titles(cache.get_cached_playlist('pl')['metadata']) == _titles(tracks)
+
+
+def test_playlist_move_rewrites_only_moved_track(cache):
+    tracks = [_track(n) for n in range(6)]
+    cache.cache_playlist('pl', 'url', 'Lista', 6, tracks)
+
+    tracks.insert(0, tracks.pop())
+    summary = cache.cache_playlist('pl', 'url', 'Lista', 6, tracks)
+
+    assert summary['moved'] == 1
+    assert summary['added'] == [] and summary['removed'] == []
+    assert _titles(cache.get_cached_playlist('pl')['metadata']) == _titles(tracks)
+
+
+def test_playlist_removal(cache):
+    tracks = [_track(n) for n in range(4)]
+    cache.cache_playlist('pl', 'url', 'Lista', 4, tracks)
+
+    removed = tracks.pop(1)
+    summary = cache.cache_playlist('pl', 'url', 'Lista', 3, tracks)
+
+    assert summary['removed'] == [removed['url'].rsplit('/', 1)[1]]
+    assert summary['moved'] == 0
+    assert _titles(cache.get_cached_playlist('pl')['metadata']) == _titles(tracks)
+
+
+def test_playlist_duplicate_tracks_stay_distinct(cache):
+    tracks = [_track(1), _track(2), _track(1)]
+    cache.cache_playlist('pl', 'url', 'Lista', 3, tracks)
+
+    assert _titles(cache.get_cached_playlist('pl')['metadata']) == _titles(tracks)
+    assert len(_positions(cache, 'pl')) == 3
+
+
+def test_playlist_renumbers_when_gap_is_exhausted(cache):
+    tracks = [_track(0), _track(1)]
+    cache.cache_playlist('pl', 'url', 'Lista', 2, tracks)
+
+    # Sempre logo após a primeira: o intervalo é dividido ao meio a cada sync
+    for n in range(100, 160):
+        tracks.insert(1, _track(n))
+        cache.cache_playlist('pl', 'url', 'Lista', len(tracks), tracks)
+        assert _titles(cache.get_cached_playlist('pl')['metadata']) == _titles(tracks)
+
+
+def test_diff_playlist_does_not_write(cache):
+    tracks = [_track(n) for n in range(3)]
+    cache.cache_playlist('pl', 'url', 'Lista', 3, tracks)
+
+    diff = cache.diff_playlist('pl', tracks + [_track(7)])
+
+    assert diff['added'] == [_track(7)] and not diff['unchanged']
+    assert len(cache.get_cached_playlist('pl')['metadata']) == 3
+
+
+def test_playlist_same_snapshot_updates_only_playlist_row(cache):
+    tracks = [_track(n) for n in range(3)]
+    cache.cache_playlist('pl', 'url', 'Lista', 3, tracks, owner='ana', snapshot_id='s1')
+
+    # Mesmo snapshot: as tracks nem são comparadas, mas nome/URL mudam
+    summary = cache.cache_playlist('pl', 'url2', 'Renomeada', 3, [], snapshot_id='s1')
+
+    assert summary['unchanged']
+    cached = cache.get_cached_playlist('pl')
+    assert cached['name'] == 'Renomeada' and cached['playlist_url'] == 'url2'
+    assert cached['owner'] == 'ana'
+    assert _titles(cached['metadata']) == _titles(tracks)
+
+
+# ----------------------------------------------------------------------
+# Contadores materializados (triggers) x recálculo exato
+# ----------------------------------------------------------------------
+
+def _counters(stats):
+    return stats['tracks'], stats['playlists'], stats['negative']['total']
+
+
+def test_stat_triggers_match_exact_recompute(cache):
+    for n in range(6):
+        cache.cache_track(_track(n)['url'], '', f'Música {n}', f'Artista {n % 2}', 200,
+                          score=50.0 + n, file_size_bytes=1000 * n, success=n % 3 != 0)
+    # Substituições passam pelo trigger de UPDATE (sucesso -> falha, troca de artista)
+    cache.cache_track(_track(1)['url'], '', 'Música 1', 'Outro', 200, success=False)
+    cache.cache_track(_track(3)['url'], '', 'Música 3', 'Artista 1', 200,
+                      score=99.0, file_size_bytes=5, success=True)
+    cache.cache_playlist('a', 'url', 'A', 3, [_track(n) for n in range(3)])
+    cache.cache_playlist('b', 'url', 'B', 2, [_track(n) for n in range(2)])
+    cache.cache_playlist('a', 'url', 'A', 4, [_track(n) for n in range(4)])
+    cache.evict_to_budget(max_rows=4)
+
+    incremental = _counters(cache.get_cache_stats())
+    exact = _counters(cache.get_cache_stats(exact=True))
+
+    assert incremental == exact
+    assert incremental[0]['total'] == 4
+    assert incremental[1] == {'total': 2, 'total_tracks': 6}
+
+
+# ----------------------------------------------------------------------
+# Cache negativo: backoff exponencial
+# ----------------------------------------------------------------------
+
+def _retry_delay_sec(cache, track_id):
+    conn = sqlite3.connect(str(cache.db_path))
+    row = conn.execute('''
+        SELECT attempts,
+               CAST(ROUND((julianday(next_retry_at) - julianday(timestamp)) * 86400) AS INTEGER)
+        FROM cached_tracks WHERE track_id = ?
+    ''', (track_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def test_negative_cache_backoff_doubles_until_cap(cache):
+    url = _track(1)['url']
+    track_id = url.rsplit('/', 1)[1]
+    base = SpotifyCacheManager.NEGATIVE_BACKOFF_BASE_SEC
+
+    delays = []
+    for _ in range(10):
+        cache.cache_track(url, '', 'Música', 'Artista', 200, success=False, error_message='not found')
+        delays.append(_retry_delay_sec(cache, track_id))
+
+    assert delays[0] == (1, base)
+    assert delays[1] == (2, base * 2)
+    assert delays[2] == (3, base * 4)
+    assert delays[-1] == (10, SpotifyCacheManager.NEGATIVE_BACKOFF_MAX_SEC)
+
+    entry = cache.get_negative_entry(url)
+    assert entry['attempts'] == 10 and entry['error_message'] == 'not found'
+    assert cache.get_cache_stats()['negative']['backing_off'] == 1
+
+
+def test_negative_cache_expired_backoff_allows_retry(cache):
+    url = _track(2)['url']
+    cache.cache_track(url, '', 'Música', 'Artista', 200, success=False)
+    conn = sqlite3.connect(str(cache.db_path))
+    conn.execute("UPDATE cached_tracks SET next_retry_at = datetime('now', '-1 seconds')")
+    conn.commit()
+    conn.close()
+
+    assert cache.get_negative_entry(url) is None
+    assert cache.get_cache_stats()['negative']['retry_ready'] == 1
+
+
+def test_success_resets_negative_entry(cache):
+    url = _track(3)['url']
+    cache.cache_track(url, '', 'Música', 'Artista', 200, success=False)
+    cache.cache_track(url, '', 'Música', 'Artista', 200, success=False)
+    cache.cache_track(url, '', 'Música', 'Artista', 200, youtube_video_id='abc', success=True)
+
+    assert cache.get_negative_entry(url) is None
+    assert _retry_delay_sec(cache, url.rsplit('/', 1)[1]) == (0, None)
+    assert cache.get_cached_track(url)['youtube_video_id'] == 'abc'
+
+    # Falha depois de um sucesso recomeça do primeiro degrau
+    cache.cache_track(url, '', 'Música', 'Artista', 200, success=False)
+    assert cache.get_negative_entry(url)['attempts'] == 1
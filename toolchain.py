@@ -0,0 +1,232 @@
+"""
+Registro do Toolchain (ffmpeg/ffprobe)
+Sonda caminhos, versão, encoders e muxers uma vez e guarda em cache
+Cache em disco por assinatura do executável: workers e reinícios não voltam a sondar
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+
+# Linha de "ffmpeg -encoders": " A....D libmp3lame   libmp3lame MP3 ..."
+_ENCODER_LINE = re.compile(r'^\s*([VAS])[\w.]{5}\s+(\S+)')
+# Linha de "ffmpeg -muxers": "  E mp4             MP4 (MPEG-4 Part 14)"
+_MUXER_LINE = re.compile(r'^\s*D?E\s+(\S+)')
+
+
+def _exe_name(name: str) -> str:
+    return f"{name}.exe" if sys.platform == 'win32' else name
+
+
+def _locate(name: str) -> Optional[str]:
+    """Procura no PATH e na pasta onde o spotdl instala o ffmpeg (~/.spotdl)"""
+    found = shutil.which(name)
+    if found:
+        return found
+    candidate = Path.home() / '.spotdl' / _exe_name(name)
+    return str(candidate) if candidate.is_file() else None
+
+
+def _signature(path: Optional[str]) -> Optional[List[Any]]:
+    """Identifica o executável (troca/atualização invalida o cache)"""
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+
+class Toolchain:
+    """
+    Capacidades do ffmpeg disponíveis para o pipeline
+
+    - probe() roda ffmpeg -version/-encoders/-muxers uma única vez
+    - Resultado gravado em cache_file; reaproveitado enquanto o executável não mudar
+    - Consultas (has_encoder, pick_encoder...) não criam processos
+    """
+
+    def __init__(self, cache_file: str = 'downloads/toolchain_cache.json'):
+        self.cache_file = Path(cache_file)
+        self._lock = threading.Lock()
+        self._caps: Optional[Dict[str, Any]] = None
+        self._install_attempted = False
+
+    # ------------------------------------------------------------------
+    # Sondagem
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _run(args: List[str]) -> str:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=30,
+                                creationflags=_NO_WINDOW)
+        return result.stdout if result.returncode == 0 else ''
+
+    def _probe_ffmpeg(self, ffmpeg: str) -> Dict[str, Any]:
+        """Executa as sondagens (3 processos, só quando o cache não serve)"""
+        version_out = self._run([ffmpeg, '-hide_banner', '-version'])
+        match = re.search(r'ffmpeg version (\S+)', version_out)
+        encoders: Dict[str, List[str]] = {'audio': [], 'video': [], 'subtitle': []}
+        kinds = {'A': 'audio', 'V': 'video', 'S': 'subtitle'}
+        for line in self._run([ffmpeg, '-hide_banner', '-encoders']).splitlines():
+            m = _ENCODER_LINE.match(line)
+            if m and m.group(2) != '=':
+                encoders[kinds[m.group(1)]].append(m.group(2))
+        muxers: List[str] = []
+        for line in self._run([ffmpeg, '-hide_banner', '-muxers']).splitlines():
+            m = _MUXER_LINE.match(line)
+            if m and m.group(1) != '=':
+                muxers.extend(m.group(1).split(','))
+        return {
+            'version': match.group(1) if match else None,
+            'encoders': encoders,
+            'muxers': sorted(set(muxers)),
+        }
+
+    def _load_cache(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cache(self, caps: Dict[str, Any]):
+        """Gravação atômica (vários workers podem sondar ao mesmo tempo)"""
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.toolchain-', suffix='.tmp',
+                                            dir=str(self.cache_file.parent))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(caps, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível gravar o cache do toolchain: {e}")
+
+    def probe(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Localiza ffmpeg/ffprobe e carrega suas capacidades
+
+        Args:
+            force: Ignora o cache em memória e em disco (ex.: após instalar o ffmpeg)
+        """
+        with self._lock:
+            if self._caps is not None and not force:
+                return self._caps
+
+            ffmpeg, ffprobe = _locate('ffmpeg'), _locate('ffprobe')
+            signature = _signature(ffmpeg)
+            cached = None if force else self._load_cache()
+            if cached and cached.get('signature') == signature and cached.get('ffprobe') == ffprobe:
+                caps = cached
+            else:
+                caps = {'ffmpeg': ffmpeg, 'ffprobe': ffprobe, 'signature': signature,
+                        'version': None, 'encoders': {'audio': [], 'video': [], 'subtitle': []},
+                        'muxers': []}
+                if ffmpeg:
+                    try:
+                        caps.update(self._probe_ffmpeg(ffmpeg))
+                    except (OSError, subprocess.SubprocessError) as e:
+                        logger.warning(f"⚠️ Falha ao sondar o ffmpeg ({ffmpeg}): {e}")
+                self._save_cache(caps)
+
+            self._caps = caps
+            if ffmpeg:
+                logger.info(f"🧰 ffmpeg {caps.get('version') or '?'}: "
+                            f"{len(caps['encoders']['audio'])} encoders de áudio, "
+                            f"{len(caps['muxers'])} muxers")
+            else:
+                logger.warning("⚠️ ffmpeg não encontrado")
+            return caps
+
+    def probe_async(self):
+        """Sonda em segundo plano (inicialização não espera os processos)"""
+        threading.Thread(target=self.probe, name='toolchain-probe', daemon=True).start()
+
+    # ------------------------------------------------------------------
+    # Consultas (sem processos)
+    # ------------------------------------------------------------------
+
+    @property
+    def ffmpeg(self) -> Optional[str]:
+        return self.probe()['ffmpeg']
+
+    @property
+    def ffprobe(self) -> Optional[str]:
+        return self.probe()['ffprobe']
+
+    @property
+    def available(self) -> bool:
+        return bool(self.ffmpeg)
+
+    def has_encoder(self, name: str) -> bool:
+        encoders = self.probe()['encoders']
+        return any(name in names for names in encoders.values())
+
+    def has_muxer(self, name: str) -> bool:
+        return name in self.probe()['muxers']
+
+    def pick_encoder(self, candidates: Iterable[str]) -> Optional[str]:
+        """Primeiro encoder disponível na ordem de preferência"""
+        for name in candidates:
+            if self.has_encoder(name):
+                return name
+        return None
+
+    def ensure_ffmpeg(self) -> bool:
+        """
+        Garante o ffmpeg para o spotdl
+
+        Sem ffmpeg, tenta 'spotdl --download-ffmpeg' uma única vez por processo.
+        """
+        if self.available:
+            return True
+        with self._lock:
+            if self._install_attempted:
+                return False
+            self._install_attempted = True
+        logger.info("📥 FFmpeg não encontrado. Instalando via spotdl...")
+        try:
+            subprocess.run([sys.executable, '-m', 'spotdl', '--download-ffmpeg'],
+                           check=True, creationflags=_NO_WINDOW)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error(f"❌ Erro ao instalar FFmpeg: {e}")
+            return False
+        return bool(self.probe(force=True)['ffmpeg'])
+
+    def get_status(self) -> Dict[str, Any]:
+        """Capacidades em cache (para a API)"""
+        caps = self.probe()
+        return {
+            'ffmpeg': caps['ffmpeg'],
+            'ffprobe': caps['ffprobe'],
+            'version': caps.get('version'),
+            'encoders': caps['encoders'],
+            'muxers': caps['muxers'],
+        }
+
+
+# Instância global (singleton)
+_toolchain_instance: Optional[Toolchain] = None
+_toolchain_lock = threading.Lock()
+
+
+def get_toolchain(**kwargs) -> Toolchain:
+    """Retorna instância global do toolchain (kwargs só valem na primeira chamada)"""
+    global _toolchain_instance
+    with _toolchain_lock:
+        if _toolchain_instance is None:
+            _toolchain_instance = Toolchain(**kwargs)
+    return _toolchain_instance
@@ -3,7 +3,7 @@ Interface Web para Download de Vídeos
 Servidor Flask que fornece interface web para listar e baixar vídeos
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
 import sys
 import webbrowser
@@ -15,6 +15,9 @@ import subprocess
 from urllib.parse import urlparse
 import logging
 import re
+import functools
+import glob
+import time
 
 try:
     import yt_dlp
@@ -24,8 +27,18 @@ except ImportError:
     sys.exit(1)
 
 # Importa cache manager e novos módulos
-from spotify_cache import get_cache_manager
-from download_queue import download_queue, DownloadTask
+from spotify_cache import get_cache_manager, parse_spotify_url
+from download_archive import get_download_archive
+from file_catalog import get_file_catalog
+from sequence_allocator import get_sequence_allocator
+from config_manager import get_config_manager
+from history_store import get_history_store
+from state_backend import configure_state_backend, get_state_backend
+from download_scheduler import get_download_scheduler
+from postprocess_pool import get_postprocess_pool, tags_from_info
+from toolchain import get_toolchain
+from format_planner import plan_audio, plan_video, resolve_audio_format, quality_label, QUALITY_ORDER
+from download_queue import download_queue, DownloadTask, DownloadStatus
 from settings_manager import SettingsManager
 from i18n_manager import I18nManager
 
@@ -37,31 +50,37 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Inicializa managers
-settings_manager = SettingsManager()
+# Write-behind: alterações próximas viram um único save atômico (flush no encerramento)
+# Histórico de downloads em SQLite (append-only, retenção por MaxHistoryDays)
+settings_manager = SettingsManager(debounce_sec=1.0, history_store=get_history_store())
+settings_manager.cleanup_history()
 i18n = I18nManager(default_language='pt-br')
 
-# Função para verificar e instalar FFmpeg para spotdl
-def ensure_ffmpeg():
-    """Verifica se FFmpeg está instalado e instala se necessário"""
+I18N_COOKIE = 'lang'
+
+
+def _request_language() -> str:
+    """Idioma da requisição: ?lang=, cookie 'lang' ou Accept-Language"""
     try:
-        # Verifica se FFmpeg já está disponível
-        subprocess.run(['ffmpeg', '-version'], 
-                      capture_output=True, 
-                      check=True,
-                      creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("FFmpeg não encontrado. Instalando via spotdl...")
-        try:
-            # Instala FFmpeg usando spotdl
-            subprocess.run([sys.executable, '-m', 'spotdl', '--download-ffmpeg'],
-                          check=True,
-                          creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-            print("✓ FFmpeg instalado com sucesso!")
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao instalar FFmpeg: {e}")
-            return False
+        requested = request.args.get('lang') or request.cookies.get(I18N_COOKIE)
+        return i18n.resolve_language(requested, request.headers.get('Accept-Language'))
+    except RuntimeError:
+        # Fora de contexto de requisição
+        return i18n.current_language
+
+
+def _t(key_path: str, default: str = '') -> str:
+    """Tradução no idioma da requisição atual"""
+    return i18n.get(key_path, default, language=_request_language())
+
+# Orçamento do cache SQLite em disco (Performance.MaxCacheSize em MB)
+_cache_budget_bytes = int(settings_manager.get('Performance.MaxCacheSize', 1024) or 0) * 1024 * 1024
+# LRU em memória à frente dele, por processo (Performance.MemoryCacheSize em MB; 0 desativa)
+_memory_cache_bytes = int(settings_manager.get('Performance.MemoryCacheSize', 64) or 0) * 1024 * 1024
+get_cache_manager(memory_cache_bytes=_memory_cache_bytes)
+
+# ffmpeg/ffprobe: caminhos, encoders e muxers sondados uma vez (cache em disco)
+get_toolchain(cache_file=str(Path('downloads') / 'toolchain_cache.json'))
 
 app = Flask(__name__)
 
@@ -90,8 +109,9 @@ def is_known_drm_site(check_url: str) -> bool:
     return any(host.endswith(d) for d in DRM_DOMAINS)
 
 
+@functools.lru_cache(maxsize=None)
 def get_windows_videos_folder():
-    """Retorna o caminho da pasta Meus Vídeos do Windows"""
+    """Retorna o caminho da pasta Meus Vídeos do Windows (resolvido uma vez)"""
     if sys.platform == 'win32':
         import winreg
         try:
@@ -164,8 +184,48 @@ def handle_error(error):
 DOWNLOAD_PATH = Path("downloads")
 DOWNLOAD_PATH.mkdir(exist_ok=True)
 
-# Armazenar status dos downloads
-download_status = {}
+# Catálogo de arquivos baixados; duplicatas de conteúdo viram hardlinks em segundo plano
+get_file_catalog(root=str(DOWNLOAD_PATH))
+
+_background_pid = None
+_background_lock = threading.Lock()
+
+
+def start_background_services():
+    """
+    Threads de manutenção do processo que atende as requisições (uma vez por processo)
+
+    Não são iniciadas na importação: no gunicorn o módulo é importado pelo
+    master e threads não sobrevivem ao fork. O worker as inicia no post_fork;
+    os demais modos, na primeira requisição.
+    """
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+
+    # Cache do Spotify: idade, orçamento de bytes e compactação incremental
+    if settings_manager.get('Performance.AutoCleanCache', True):
+        get_cache_manager().start_maintenance(max_bytes=_cache_budget_bytes, max_age_days=90)
+    get_toolchain().probe_async()
+    if settings_manager.get('Performance.DedupeDownloads', True):
+        get_file_catalog().start_dedupe()
+    # Reconciliação com o disco (arquivos adicionados/removidos fora do app)
+    get_file_catalog().start_reconcile(interval_sec=600)
+
+
+# Limite global de banda (token bucket) compartilhado por todos os downloads
+download_scheduler = get_download_scheduler(config_provider=lambda: get_config_manager().get())
+
+# Conversões ffmpeg em estágio próprio (um worker por núcleo, prioridade reduzida)
+get_postprocess_pool(
+    workers=get_config_manager().get().get('postprocess_workers') or None,
+    niceness=get_config_manager().get().get('postprocess_nice', 10)
+)
+
+# Armazenar status dos downloads (memória ou SQLite compartilhado entre workers)
+download_status = get_state_backend('download_status')
 
 # Configuração de downloads simultâneos (aumentado de 3 para 8)
 MAX_CONCURRENT_DOWNLOADS = 8
@@ -284,23 +344,8 @@ class WebVideoDownloader:
                                 fps = fmt.get('fps') or 30
                                 filesize = fmt.get('filesize') or fmt.get('filesize_approx') or 0
                                 
-                                # Identificar qualidade
-                                if height >= 4320:
-                                    quality = '8K'
-                                elif height >= 2160:
-                                    quality = '4K'
-                                elif height >= 1440:
-                                    quality = '2K'
-                                elif height >= 1080:
-                                    quality = '1080p' if fps <= 30 else '1080p60'
-                                elif height >= 720:
-                                    quality = '720p' if fps <= 30 else '720p60'
-                                elif height >= 480:
-                                    quality = '480p'
-                                elif height >= 360:
-                                    quality = '360p'
-                                else:
-                                    quality = '240p'
+                                # Identificar qualidade (mesma escada usada no download)
+                                quality = quality_label(height, fps)
                                 
                                 # Evitar duplicatas de qualidade
                                 quality_key = f"{quality}_{fmt.get('ext', 'mp4')}"
@@ -319,8 +364,7 @@ class WebVideoDownloader:
                                     })
                     
                     # Ordenar formatos por qualidade (maior primeiro)
-                    quality_order = {'8K': 8, '4K': 7, '2K': 6, '1080p60': 5, '1080p': 4, '720p60': 3, '720p': 2, '480p': 1, '360p': 0, '240p': -1}
-                    formats.sort(key=lambda x: quality_order.get(x['quality'], -2), reverse=True)
+                    formats.sort(key=lambda x: QUALITY_ORDER.get(x['quality'], -2), reverse=True)
                     
                     return {
                         'success': True,
@@ -445,6 +489,113 @@ class WebVideoDownloader:
         else:
             return 'generic'
     
+    @staticmethod
+    def _archive_id(info):
+        """Chave do arquivo de downloads no formato do yt-dlp ("extractor id")"""
+        extractor = info.get('extractor_key') or info.get('ie_key') or ''
+        return f"{extractor.lower()} {info.get('id')}"
+
+    def _download_split_streams(self, ydl, info, ydl_opts, video_id, extra_hooks=()):
+        """
+        Baixa os streams de vídeo e áudio em paralelo e une com ffmpeg (-c copy)
+
+        O yt-dlp baixa requested_formats um após o outro; aqui cada stream usa seu
+        próprio YoutubeDL (mesmas opções, sem nova extração) numa thread.
+
+        Returns:
+            info com filepath/requested_downloads apontando para o arquivo final
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        ffmpeg = ydl_opts.get('ffmpeg_location') or get_toolchain().ffmpeg
+        if not ffmpeg:
+            raise RuntimeError('FFmpeg não encontrado para unir vídeo e áudio')
+
+        final_path = Path(ydl.prepare_filename(info))
+        stem = final_path.with_suffix('')
+        progress = {}
+        progress_lock = threading.Lock()
+
+        def _make_hook(format_id):
+            def _hook(d):
+                if d.get('status') != 'downloading':
+                    return
+                with progress_lock:
+                    progress[format_id] = (
+                        d.get('downloaded_bytes') or 0,
+                        d.get('total_bytes') or d.get('total_bytes_estimate') or 0,
+                        d.get('speed') or 0
+                    )
+                    done = sum(p[0] for p in progress.values())
+                    total = sum(p[1] for p in progress.values())
+                    speed = sum(p[2] for p in progress.values())
+                download_status[video_id] = {
+                    'status': 'downloading',
+                    'progress': int(done * 100 / total) if total else 0,
+                    'speed': f"{self._format_bytes(speed)}/s" if speed else 'N/A',
+                    'eta': f"{int((total - done) / speed)}s" if speed and total else 'N/A',
+                    'filename': str(final_path)
+                }
+            return _hook
+
+        def _fetch(fmt):
+            stream_info = dict(info)
+            stream_info.pop('requested_formats', None)
+            stream_info.update(fmt)
+            part_path = f"{stem}.f{fmt['format_id']}.{fmt['ext']}"
+            opts = dict(ydl_opts, progress_hooks=[_make_hook(fmt['format_id']), *extra_hooks])
+            opts.pop('download_archive', None)
+            with yt_dlp.YoutubeDL(opts) as stream_ydl:
+                result = stream_ydl.dl(part_path, stream_info)
+            ok = result[0] if isinstance(result, tuple) else result
+            if not ok:
+                raise RuntimeError(f"Falha ao baixar stream {fmt['format_id']}")
+            return fmt, part_path
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            parts = list(pool.map(_fetch, info['requested_formats']))
+
+        download_status[video_id] = {
+            'status': 'processing',
+            'progress': 100,
+            'speed': 'N/A',
+            'eta': 'N/A',
+            'filename': str(final_path)
+        }
+        video_part = next((p for f, p in parts if f.get('vcodec') not in (None, 'none')), parts[0][1])
+        audio_part = next((p for f, p in parts if p != video_part), None)
+        temp_path = f"{stem}.temp{final_path.suffix}"
+        cmd = [ffmpeg, '-y', '-loglevel', 'error', '-i', video_part]
+        if audio_part:
+            cmd += ['-i', audio_part, '-map', '0:v:0', '-map', '1:a:0']
+        cmd += ['-c', 'copy', temp_path]
+        merge = subprocess.run(cmd, capture_output=True, text=True)
+        if merge.returncode != 0:
+            raise RuntimeError(f"ffmpeg falhou ao unir streams: {merge.stderr.strip()[:300]}")
+        os.replace(temp_path, final_path)
+        for _, part_path in parts:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+
+        archive_view = ydl_opts.get('download_archive')
+        if archive_view is not None:
+            archive_view.add(self._archive_id(info))
+        return dict(info, filepath=str(final_path), requested_downloads=[{'filepath': str(final_path)}])
+
+    @staticmethod
+    def _remove_partial_files(partial_files):
+        """Remove .part, fragmentos (.part-FragN) e .ytdl de um download cancelado"""
+        for tmp in partial_files:
+            base = tmp[:-len('.part')] if tmp.endswith('.part') else tmp
+            for path in glob.glob(glob.escape(tmp) + '*') + [base + '.ytdl']:
+                if path != base:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
     def _format_bytes(self, bytes_size):
         """Converte bytes para formato legível (KB, MB, GB)"""
         if not bytes_size or bytes_size == 0:
@@ -457,19 +608,18 @@ class WebVideoDownloader:
         return f"{bytes_size:.1f} PB"
     
     def download_video(self, url, video_id, quality="best", audio_only=False, mp3_bitrate="320", 
-                     audio_format="mp3", video_codec="auto", playlist_name=None):
-        """Faz download de um vídeo"""
+                     audio_format="mp3", video_codec="auto", playlist_name=None,
+                     task_id=None, cancel_token=None):
+        """
+        Faz download de um vídeo
+
+        Com task_id (fila), pausa/cancelamento são verificados a cada bloco lido:
+        pausa mantém o .part (retomado com o mesmo template), cancelamento remove.
+        """
         global download_status
         
-        # Carrega configurações atuais
-        config = {}
-        try:
-            cfg_path = Path('config.json')
-            if cfg_path.exists():
-                with open(cfg_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-        except Exception:
-            config = {}
+        # Snapshot das configurações atuais (cache revalidado por mtime)
+        config = get_config_manager().get()
 
         prevent_sleep = bool(config.get('prevent_sleep', True))
         create_subdirs = bool(config.get('create_subdirs', True))
@@ -477,7 +627,18 @@ class WebVideoDownloader:
         skip_duplicates = bool(config.get('skip_duplicates', True))
         generate_m3u = bool(config.get('generate_m3u', True))
         embed_subtitles = bool(config.get('embed_subtitles', False))
+        # Fragmentos HLS/DASH simultâneos por perfil e busca paralela de vídeo+áudio
+        concurrent_fragments = max(1, int(config.get(
+            'concurrent_fragments_audio' if audio_only else 'concurrent_fragments_video',
+            4 if audio_only else 8
+        ) or 1))
+        parallel_streams = bool(config.get('parallel_av_streams', True))
         auto_audio_tags = bool(config.get('auto_audio_tags', True))
+        # Conversão de áudio fora do slot de download (pool de pós-processamento)
+        decoupled_postprocessing = bool(config.get('decoupled_postprocessing', True))
+        # Mantém AAC/Opus de origem (cópia) em vez de reencodar para o formato pedido
+        keep_native_audio = bool(config.get('keep_native_audio', False))
+        video_container = config.get('video_container', 'mp4')
 
         download_status[video_id] = {
             'status': 'downloading',
@@ -507,24 +668,16 @@ class WebVideoDownloader:
             output_base_folder = platform_folder / safe_name
             output_base_folder.mkdir(exist_ok=True, parents=True)
 
-        # Sequenciador opcional por playlist
+        # Sequenciador opcional por playlist (alocação atômica, segura entre threads)
+        allocator = get_sequence_allocator()
         def _next_seq(folder: Path) -> str:
-            seq_path = folder / '.seq'
             try:
-                n = 0
-                if seq_path.exists():
-                    with open(seq_path, 'r', encoding='utf-8') as f:
-                        n = int((f.read() or '0').strip())
-                n += 1
-                with open(seq_path, 'w', encoding='utf-8') as f:
-                    f.write(str(n))
-                return f"{n:03d}"
+                return f"{allocator.next_sequence(folder):03d}"
             except Exception:
                 return "001"
 
         # Organização por artista para áudios: pasta "NNN - Artista" por plataforma
         artist_folder = None
-        artist_index_file = None
         artist_name = None
         if audio_only:
             try:
@@ -545,27 +698,7 @@ class WebVideoDownloader:
                 except Exception:
                     artist_name = raw_artist or 'Desconhecido'
                 # Índice estável por artista (por plataforma)
-                artist_index_file = platform_folder / '.artists_index.json'
-                artists_index = {'next': 1, 'map': {}}
-                if artist_index_file.exists():
-                    try:
-                        with open(artist_index_file, 'r', encoding='utf-8') as f:
-                            artists_index = json.load(f) or artists_index
-                    except Exception:
-                        pass
-                amap = artists_index.get('map', {})
-                nextn = int(artists_index.get('next', 1))
-                key = artist_name.lower()
-                if key not in amap:
-                    amap[key] = nextn
-                    artists_index['map'] = amap
-                    artists_index['next'] = nextn + 1
-                    try:
-                        with open(artist_index_file, 'w', encoding='utf-8') as f:
-                            json.dump(artists_index, f, indent=2, ensure_ascii=False)
-                    except Exception:
-                        pass
-                num = int(amap.get(key, 1))
+                num = allocator.artist_number(platform_folder, artist_name)
                 artist_folder = platform_folder / f"{num:03d} - {artist_name}"
                 artist_folder.mkdir(exist_ok=True, parents=True)
                 output_base_folder = artist_folder
@@ -573,12 +706,43 @@ class WebVideoDownloader:
                 # Se falhar a detecção de artista, mantém a pasta padrão
                 pass
 
-        # Template de saída (numeração de arquivo opcional)
-        if number_files:
+        # Template de saída (numeração de arquivo opcional); tarefa retomada
+        # reaproveita o template do primeiro início para continuar o .part
+        task = download_queue.get_task(task_id) if task_id else None
+        if task and task.output_template:
+            output_path = task.output_template
+        elif number_files:
             seq_prefix = _next_seq(output_base_folder)
             output_path = str(output_base_folder / f"{seq_prefix} - %(title)s.%(ext)s")
         else:
             output_path = str(output_base_folder / '%(title)s.%(ext)s')
+        if task and not task.output_template:
+            download_queue.set_output_template(task_id, output_path)
+
+        # Pausa/cancelamento cooperativos: verificados antes de cada bloco
+        partial_files = set()
+        last_queue_update = [0.0]
+
+        def _interrupt_hook(d):
+            if d.get('tmpfilename'):
+                partial_files.add(d['tmpfilename'])
+            if not task_id:
+                return
+            reason = download_queue.interruption(task_id, cancel_token)
+            if reason:
+                raise yt_dlp.utils.DownloadCancelled(reason)
+            now = time.monotonic()
+            if d.get('status') == 'downloading' and now - last_queue_update[0] >= 1.0:
+                last_queue_update[0] = now
+                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded = d.get('downloaded_bytes') or 0
+                download_queue.update_progress(
+                    task_id,
+                    downloaded * 100.0 / total if total else 0.0,
+                    speed=f"{self._format_bytes(d.get('speed') or 0)}/s",
+                    eta=f"{d.get('eta')}s" if d.get('eta') else '',
+                    downloaded_size=self._format_bytes(downloaded)
+                )
 
         # Hook de progresso para atualizar status em tempo real
         def _progress_hook(d):
@@ -611,8 +775,9 @@ class WebVideoDownloader:
         
         if audio_only:
             ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': (
+                # Prefere o stream cujo codec já é o da saída (cópia em vez de reencode)
+                **plan_audio(audio_format),
+                'postprocessors': [] if decoupled_postprocessing else (
                     [
                         {
                             'key': 'FFmpegExtractAudio',
@@ -631,7 +796,9 @@ class WebVideoDownloader:
             output_folder = platform_folder
         else:
             ydl_opts = {
-                'format': 'best' if video_codec == 'auto' else f"bestvideo[vcodec*={video_codec}]+bestaudio/best",
+                # Par vídeo+áudio compatível com o contêiner (união por cópia de stream),
+                # limitado à qualidade pedida: nada acima do alvo é baixado
+                **plan_video(video_codec, video_container, quality),
                 'outtmpl': output_path,
                 'quiet': True,
                 'no_warnings': True,
@@ -648,18 +815,78 @@ class WebVideoDownloader:
             ydl_opts['subtitleslangs'] = ['all']
             ydl_opts['embedsubtitles'] = True
 
-        # Evitar re-downloads (baseado em ID) se habilitado
+        ydl_opts['concurrent_fragment_downloads'] = concurrent_fragments
+
+        # ffmpeg já localizado na inicialização (inclusive o instalado pelo spotdl)
+        toolchain = get_toolchain()
+        if toolchain.ffmpeg:
+            ydl_opts['ffmpeg_location'] = toolchain.ffmpeg
+
+        # Evitar re-downloads (baseado em ID) se habilitado: arquivo SQLite compartilhado
+        archive = get_download_archive()
         if skip_duplicates:
-            archive_file = self.download_path / 'download_archive.txt'
-            ydl_opts['download_archive'] = str(archive_file)
+            ydl_opts['download_archive'] = archive.for_url(url, platform)
         
         try:
             # Evita suspensão enquanto há downloads ativos
             if prevent_sleep:
                 _prevent_sleep_acquire()
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            def _mark_waiting_host():
+                status_obj = download_status.get(video_id, {})
+                status_obj['waiting_host'] = platform
+                download_status[video_id] = status_obj
+
+            # Cortesia por host (slots e requisições/min) e banda: cada bloco
+            # lido passa pelo limite global/da plataforma
+            with download_scheduler.transfer(platform, on_wait=_mark_waiting_host) as throttle_hook, \
+                    yt_dlp.YoutubeDL(dict(ydl_opts, progress_hooks=[
+                        _interrupt_hook, _progress_hook, throttle_hook
+                    ])) as ydl:
+                # Pausado/cancelado enquanto aguardava slot do host
+                if task_id and download_queue.interruption(task_id, cancel_token):
+                    raise yt_dlp.utils.DownloadCancelled(download_queue.interruption(task_id, cancel_token))
+                if parallel_streams and toolchain.available and not audio_only and not embed_subtitles:
+                    # Extrai uma vez; vídeo+áudio separados são baixados em paralelo
+                    probe = ydl.extract_info(url, download=False)
+                    if probe and len(probe.get('requested_formats') or []) == 2 \
+                            and not (skip_duplicates and self._archive_id(probe) in archive):
+                        info = self._download_split_streams(ydl, probe, ydl_opts, video_id,
+                                                            extra_hooks=[_interrupt_hook, throttle_hook])
+                    else:
+                        info = ydl.process_ie_result(probe, download=True) if probe else None
+                else:
+                    info = ydl.extract_info(url, download=True)
+
+            # Caminho final (após pós-processamento) para o fast path de re-downloads
+            final_path = None
+            if info:
+                requested = info.get('requested_downloads') or [{}]
+                final_path = requested[0].get('filepath') or info.get('filepath')
+            if final_path and audio_only and decoupled_postprocessing:
+                # Slot do host já liberado: a conversão aguarda na fila do pool
+                status_obj = download_status.get(video_id, {})
+                status_obj.update({'status': 'processing', 'progress': 100, 'filename': final_path})
+                download_status[video_id] = status_obj
+                conversion = get_postprocess_pool().convert_audio(
+                    final_path,
+                    resolve_audio_format(audio_format, info.get('acodec'), keep_native_audio),
+                    mp3_bitrate,
+                    tags=tags_from_info(info) if auto_audio_tags else None,
+                    source_codec=info.get('acodec'),
+                    duration=info.get('duration')
+                )
+                final_path = conversion['path']
+                status_obj = download_status.get(video_id, {})
+                status_obj.update({
+                    'stream_copy': conversion['stream_copy'],
+                    'cpu_sec': conversion['cpu_sec'],
+                    'cpu_saved_sec': conversion['cpu_saved_sec']
+                })
+                download_status[video_id] = status_obj
+            if final_path:
+                archive.set_file(url, final_path)
+                get_file_catalog().record_file(final_path, platform=platform, media_type=media_type)
 
             # Se chegou aqui, terminou com sucesso (inclusive pós-processamento)
             status_obj = download_status.get(video_id, {})
@@ -668,12 +895,38 @@ class WebVideoDownloader:
                 'progress': 100,
                 'output_path': str(output_folder)
             })
+            if final_path:
+                status_obj['filename'] = final_path
             download_status[video_id] = status_obj
+            settings_manager.add_to_history({
+                'url': url,
+                'title': (info or {}).get('title') or os.path.basename(final_path or ''),
+                'platform': platform,
+                'status': 'completed',
+                'size': os.path.getsize(final_path) if final_path and os.path.exists(final_path) else 0
+            })
         except Exception as e:
+            reason = download_queue.interruption(task_id, cancel_token) if task_id else None
+            if reason:
+                # Slot já liberado ao sair do transfer(); cancelamento descarta os parciais
+                if reason == DownloadStatus.CANCELED.value:
+                    self._remove_partial_files(partial_files)
+                # Uma nova execução (retomada) é dona do status; esta não o sobrescreve
+                if download_queue.is_current_run(task_id, cancel_token):
+                    download_status[video_id] = {'status': reason, 'progress': 0}
+                logger.info(f"⏸️ Download {video_id} interrompido: {reason}")
+                return
+            download_scheduler.report_error(platform, e)
             download_status[video_id] = {
                 'status': 'error',
                 'error': str(e)
             }
+            settings_manager.add_to_history({
+                'url': url,
+                'platform': platform,
+                'status': 'failed',
+                'error': str(e)
+            })
         finally:
             # Gera/atualiza playlist .m3u
             try:
@@ -737,6 +990,35 @@ def process_ultradown_shortcuts(url):
 # Criar instância do downloader
 downloader = WebVideoDownloader(DOWNLOAD_PATH)
 
+# Formatos da fila que significam "só áudio"
+_QUEUE_AUDIO_FORMATS = ('mp3', 'm4a', 'opus', 'flac', 'wav', 'audio')
+
+
+def _run_queue_task(task: DownloadTask, token):
+    """Executa uma tarefa da fila (thread do despachante) e registra o desfecho"""
+    audio_only = task.format in _QUEUE_AUDIO_FORMATS
+    downloader.download_video(
+        task.url, task.id, task.quality,
+        audio_only=audio_only,
+        audio_format=task.format if audio_only and task.format != 'audio' else 'mp3',
+        task_id=task.id,
+        cancel_token=token
+    )
+    status = download_status.get(task.id, {})
+    if status.get('status') == 'completed':
+        download_queue.complete_task(task.id, status.get('filename') or status.get('output_path', ''))
+    elif status.get('status') == 'error':
+        download_queue.fail_task(task.id, status.get('error', ''))
+
+
+@app.before_request
+def _ensure_queue_dispatcher():
+    """Threads de manutenção e despachante da fila: um de cada por processo"""
+    start_background_services()
+    config = get_config_manager().get()
+    download_queue.max_parallel = max(1, int(config.get('simultaneous_transfers', 4) or 1))
+    download_queue.start_dispatcher(_run_queue_task)
+
 
 @app.route('/')
 def index():
@@ -800,6 +1082,22 @@ def start_download():
     url = process_ultradown_shortcuts(url)
     if is_known_drm_site(url):
         return jsonify({'success': False, 'error': 'Conteúdo protegido por DRM — este site de streaming não é suportado.', 'code': 'drm_protected'}), 200
+
+    # Fast path: já baixado e o arquivo ainda existe → conclui sem extração nem thread
+    if get_config_manager().get().get('skip_duplicates', True):
+        archived = get_download_archive().lookup_existing_file(url=url)
+        if archived:
+            file_path = Path(archived['file_path'])
+            download_status[video_id] = {
+                'status': 'completed',
+                'progress': 100,
+                'speed': 'N/A',
+                'eta': 'N/A',
+                'filename': str(file_path),
+                'output_path': str(file_path.parent),
+                'archived': True
+            }
+            return jsonify({'success': True, 'video_id': video_id, 'status': 'completed', 'archived': True})
     
     # Inicia o download em uma thread separada
     thread = threading.Thread(
@@ -838,37 +1136,47 @@ def download_spotify():
     try:
         import subprocess
         
-        # Inicializa cache manager
+        # Inicializa cache manager e arquivo de downloads
         cache = get_cache_manager()
+        archive = get_download_archive()
         logger.info(f"🎵 Iniciando download Spotify: {url}")
         
         # Criar pasta para downloads do Spotify
         spotify_path = DOWNLOAD_PATH / 'spotify'
         spotify_path.mkdir(exist_ok=True)
         
-        # Verificar e instalar FFmpeg se necessário
-        if not ensure_ffmpeg():
+        # Verificar e instalar FFmpeg se necessário (capacidades em cache, sem processo)
+        if not get_toolchain().ensure_ffmpeg():
             return jsonify({
                 'success': False,
                 'error': 'FFmpeg não pôde ser instalado. Necessário para spotdl.'
             }), 500
         
-        # Extrai ID da playlist/album/track
-        spotify_id = None
-        if '/track/' in url:
-            spotify_id = re.search(r'/track/([a-zA-Z0-9]+)', url)
-        elif '/playlist/' in url:
-            spotify_id = re.search(r'/playlist/([a-zA-Z0-9]+)', url)
-        elif '/album/' in url:
-            spotify_id = re.search(r'/album/([a-zA-Z0-9]+)', url)
-        
-        spotify_id = spotify_id.group(1) if spotify_id else None
+        # Extrai tipo e ID da playlist/album/track (URL, URI ou ID)
+        spotify_kind, spotify_id = parse_spotify_url(url)
+
+        # Fast path: track única já baixada e arquivo ainda presente
+        if spotify_kind == 'track' and spotify_id:
+            archived = archive.lookup_existing_file(archive_key=f'spotify {spotify_id}')
+            if archived:
+                logger.info(f"⏭️ Já no arquivo de downloads: {archived['file_path']}")
+                return jsonify({
+                    'success': True,
+                    'message': 'Música já baixada anteriormente',
+                    'output_path': str(Path(archived['file_path']).parent),
+                    'archived': True,
+                    'stats': {'downloaded': 0, 'skipped': 1, 'failed': 0,
+                              'cache_hits': 1, 'cache_misses': 0}
+                })
         
         # Para playlists, verifica cache de metadata
         cache_hits = 0
         cache_misses = 0
+        # (artista, título) normalizados -> URL da track, para cachear cada
+        # música sob a própria chave e não sob a da playlist
+        track_urls_by_name = {}
         
-        if '/playlist/' in url and spotify_id:
+        if spotify_kind == 'playlist' and spotify_id:
             cached_playlist = cache.get_cached_playlist(spotify_id, max_age_days=7)
             if cached_playlist:
                 logger.info(f"📦 Playlist em cache: {cached_playlist['name']} ({cached_playlist['total_tracks']} tracks)")
@@ -876,6 +1184,9 @@ def download_spotify():
                 # Verifica quais tracks já estão cacheadas
                 for track_meta in cached_playlist['metadata']:
                     track_url = track_meta.get('url', '')
+                    if track_meta.get('artist') and track_meta.get('title'):
+                        name_key = (track_meta['artist'].lower(), track_meta['title'].lower())
+                        track_urls_by_name[name_key] = track_url
                     if track_url:
                         cached_track = cache.get_cached_track(track_url, max_age_days=30)
                         if cached_track and cached_track['success']:
@@ -885,6 +1196,7 @@ def download_spotify():
                             cache_misses += 1
         
         # Comando spotdl com configurações otimizadas
+        spotdl_threads = 4
         cmd = [
             sys.executable,
             '-m', 'spotdl',
@@ -893,23 +1205,36 @@ def download_spotify():
             '--output', str(spotify_path),
             '--format', 'mp3',
             '--bitrate', '320k',
-            '--threads', '4',  # Download paralelo
+            '--threads', str(spotdl_threads),  # Download paralelo
             '--print-errors',  # Mostrar erros detalhados
             '--search-query', '{artists} - {title}',  # Query mais precisa
         ]
+        if get_toolchain().ffmpeg:
+            cmd += ['--ffmpeg', get_toolchain().ffmpeg]
+        
+        # spotdl roda fora do processo: recebe sua fatia do limite global de banda.
+        # --limit-rate vale por download do yt-dlp e o spotdl baixa spotdl_threads
+        # ao mesmo tempo: a fatia é dividida entre as threads
+        spotdl_rate = download_scheduler.subprocess_rate_limit('Spotify')
+        if spotdl_rate:
+            per_thread = max(1, spotdl_rate // spotdl_threads)
+            cmd += ['--yt-dlp-args', f'--limit-rate {per_thread}']
         
         logger.info(f"⚡ Executando spotdl (cache hits: {cache_hits}, misses: {cache_misses})...")
         
         # Executar spotdl COM VERBOSE
         logger.info(f"🔧 Comando: {' '.join(cmd)}")
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=str(Path.cwd()),
-            timeout=1800  # 30 minutos timeout (para playlists grandes)
-        )
+        with download_scheduler.transfer('Spotify'):
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                cwd=str(Path.cwd()),
+                timeout=1800  # 30 minutos timeout (para playlists grandes)
+            )
+        if result.returncode != 0:
+            download_scheduler.report_error('Spotify', result.stderr)
         
         # Log verbose do output
         logger.info(f"📤 STDOUT ({len(result.stdout)} chars):")
@@ -945,14 +1270,22 @@ def download_spotify():
                 match = re.search(r'Downloaded:\s+(.+?)\s+-\s+(.+)', line)
                 if match and spotify_id:
                     artist, title = match.groups()
+                    if spotify_kind == 'track':
+                        track_url = url
+                    else:
+                        track_url = track_urls_by_name.get((artist.lower(), title.lower()), '')
+                    track_kind, track_id = parse_spotify_url(track_url)
+                    if not track_id or track_kind not in ('track', None):
+                        logger.debug(f"Sem ID de track para {artist} - {title}; não cacheado")
+                        continue
                     logger.info(f"📝 Cacheando: {artist} - {title}")
                     # Tenta encontrar arquivo correspondente
                     for mp3_file in spotify_path.glob('*.mp3'):
                         if artist.lower() in mp3_file.stem.lower() and title.lower() in mp3_file.stem.lower():
                             logger.info(f"💾 Salvando no cache: {mp3_file.name}")
                             cache.cache_track(
-                                spotify_url=url,
-                                spotify_id=spotify_id,
+                                spotify_url=track_url,
+                                spotify_id=track_id,
                                 title=title,
                                 artist=artist,
                                 duration_sec=0,  # spotdl não informa duração no output
@@ -960,6 +1293,9 @@ def download_spotify():
                                 file_size_bytes=mp3_file.stat().st_size,
                                 success=True
                             )
+                            archive.add(f'spotify {track_id}', url=track_url,
+                                        file_path=str(mp3_file), platform='Spotify')
+                            get_file_catalog().record_file(mp3_file, platform='Spotify', media_type='audio')
                             break
             
             # Detecta falhas
@@ -1052,6 +1388,7 @@ def download_spotify_advanced():
             '--save-file', str(spotify_path / 'temp_metadata.spotdl'),
         ]
         
+        download_scheduler.pace_request('Spotify')
         result = subprocess.run(
             cmd,
             capture_output=True,
@@ -1085,7 +1422,12 @@ def download_spotify_advanced():
             def debug(self, msg): print(f"[DEBUG] {msg}", flush=True)
             def error(self, msg): print(f"[ERROR] {msg}", flush=True)
         
-        search_engine = SpotifySearchEngine(logger=FlaskLogger())
+        # Buscas no YouTube respeitam o limite de requisições/min do host
+        search_engine = SpotifySearchEngine(
+            logger=FlaskLogger(),
+            cache=get_cache_manager(),
+            request_gate=lambda: download_scheduler.pace_request('YouTube')
+        )
         
         # Processar cada música
         songs = metadata if isinstance(metadata, list) else [metadata]
@@ -1093,9 +1435,36 @@ def download_spotify_advanced():
             'success': True,
             'total': len(songs),
             'downloaded': 0,
+            'skipped': 0,
             'failed': 0,
             'errors': []
         }
+        archive = get_download_archive()
+        
+        # Sincroniza membros da playlist no cache (grava só o que mudou)
+        spotify_kind, spotify_id = parse_spotify_url(url)
+        if spotify_kind == 'playlist' and spotify_id:
+            playlist_tracks = []
+            for song in songs:
+                song_artists = song.get('artists') or []
+                playlist_tracks.append({
+                    'url': song.get('url', ''),
+                    'title': song.get('name', ''),
+                    'artist': song_artists[0] if song_artists and isinstance(song_artists[0], str) else '',
+                    'duration': song.get('duration', 0)
+                })
+            sync = get_cache_manager().cache_playlist(
+                playlist_id=spotify_id,
+                playlist_url=url,
+                name=(songs[0].get('list_name') if songs else None) or 'Playlist',
+                total_tracks=len(playlist_tracks),
+                metadata=playlist_tracks
+            )
+            results['playlist_sync'] = {
+                'added': len(sync['added']),
+                'removed': len(sync['removed']),
+                'moved': sync['moved']
+            }
         
         for song in songs:
             try:
@@ -1110,10 +1479,19 @@ def download_spotify_advanced():
                 duration_ms = song.get('duration', 0)
                 duration_sec = duration_ms // 1000 if duration_ms else 180  # Default 3min
                 
+                # Já baixada e arquivo presente: pula busca e download
+                song_url = song.get('url', '')
+                song_id = song.get('song_id') or parse_spotify_url(song_url)[1]
+                if song_id and archive.lookup_existing_file(archive_key=f'spotify {song_id}'):
+                    results['skipped'] += 1
+                    print(f"[Spotify Advanced] ⏭️ Já baixada: {artist} - {title}")
+                    continue
+                
                 print(f"[Spotify Advanced] Procurando: {artist} - {title}")
                 
-                # Buscar no YouTube com SpotiFlyer algorithm
-                video_id = search_engine.search_youtube_music(artist, title, duration_sec)
+                # Buscar no YouTube com SpotiFlyer algorithm (pula falhas recentes em backoff)
+                video_id = search_engine.search_youtube_music(artist, title, duration_sec,
+                                                              spotify_url=song_url)
                 
                 if not video_id:
                     results['failed'] += 1
@@ -1127,22 +1505,47 @@ def download_spotify_advanced():
                 ydl_opts = {
                     'format': 'bestaudio/best',
                     'outtmpl': output_template,
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '320',
-                    }],
                     'quiet': True,
                     'no_warnings': True,
                 }
                 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([youtube_url])
+                with download_scheduler.transfer('YouTube') as throttle_hook:
+                    ydl_opts['progress_hooks'] = [throttle_hook]
+                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                        info = ydl.extract_info(youtube_url, download=True)
                 
+                # Conversão para MP3 no pool, fora do slot do YouTube
+                requested = (info or {}).get('requested_downloads') or [{}]
+                final_path = requested[0].get('filepath')
+                if final_path:
+                    final_path = get_postprocess_pool().convert_audio(
+                        final_path, 'mp3', '320',
+                        tags={'title': title, 'artist': artist},
+                        source_codec=(info or {}).get('acodec'),
+                        duration=(info or {}).get('duration')
+                    )['path']
                 results['downloaded'] += 1
+                if song_id:
+                    archive.add(f'spotify {song_id}', url=song_url,
+                                file_path=final_path, platform='Spotify')
+                if final_path:
+                    get_file_catalog().record_file(final_path, platform='Spotify', media_type='audio')
                 print(f"[Spotify Advanced] ✅ Baixado: {artist} - {title}")
+                
+                # Sucesso substitui eventual falha em backoff
+                if song_url:
+                    get_cache_manager().cache_track(
+                        spotify_url=song_url,
+                        spotify_id='',
+                        title=title,
+                        artist=artist,
+                        duration_sec=duration_sec,
+                        youtube_video_id=video_id,
+                        youtube_url=youtube_url
+                    )
             
             except Exception as e:
+                download_scheduler.report_error('YouTube', e)
                 results['failed'] += 1
                 results['errors'].append(f"{artist} - {title}: {str(e)}")
                 print(f"[Spotify Advanced] ❌ Erro: {artist} - {title} - {str(e)}")
@@ -1366,14 +1769,10 @@ def smart_download():
     try:
         # Configurar opções baseadas no formato
         if format_type == 'audio':
+            # Conversão para MP3 feita depois, no pool de pós-processamento
             ydl_opts = {
                 'format': 'bestaudio/best',
                 'outtmpl': str(DOWNLOAD_PATH / 'audio' / '%(title)s.%(ext)s'),
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '320',
-                }],
             }
             output_folder = DOWNLOAD_PATH / 'audio'
         else:
@@ -1385,8 +1784,24 @@ def smart_download():
         
         output_folder.mkdir(exist_ok=True)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        platform = detect_platform(url)
+        try:
+            with download_scheduler.transfer(platform) as throttle_hook:
+                ydl_opts['progress_hooks'] = [throttle_hook]
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.extract_info(url, download=True)
+        except Exception as e:
+            download_scheduler.report_error(platform, e)
+            raise
+
+        if format_type == 'audio' and info:
+            requested = info.get('requested_downloads') or [{}]
+            if requested[0].get('filepath'):
+                get_postprocess_pool().convert_audio(
+                    requested[0]['filepath'], 'mp3', '320',
+                    tags=tags_from_info(info), source_codec=info.get('acodec'),
+                    duration=info.get('duration')
+                )
         
         return jsonify({
             'success': True,
@@ -1404,24 +1819,41 @@ def smart_download():
 
 @app.route('/api/downloads')
 def list_downloads():
-    """Lista todos os arquivos baixados (recursivo), categorizado"""
-    files = []
-    for dirpath, dirnames, filenames in os.walk(DOWNLOAD_PATH):
-        for name in filenames:
-            try:
-                p = Path(dirpath) / name
-                rel = p.relative_to(DOWNLOAD_PATH)
-                files.append({
-                    'name': name,
-                    'path': str(rel),
-                    'size': p.stat().st_size,
-                    'modified': datetime.fromtimestamp(p.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                })
-            except Exception:
-                continue
-    # Ordena por data (desc)
-    files.sort(key=lambda f: f['modified'], reverse=True)
-    return jsonify({'files': files, 'base': str(DOWNLOAD_PATH)})
+    """
+    Lista arquivos baixados a partir do catálogo (paginado, sem varrer o disco)
+
+    Query: page, page_size (máx. 1000), sort (modified|name|size), order (asc|desc),
+    platform, type (audio|video)
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = min(int(request.args.get('page_size', 100)), 1000)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'page/page_size inválidos'}), 400
+
+    result = get_file_catalog().list_files(
+        page=page,
+        page_size=page_size,
+        sort=request.args.get('sort', 'modified'),
+        order=request.args.get('order', 'desc'),
+        platform=request.args.get('platform') or None,
+        media_type=request.args.get('type') or None
+    )
+    files = [{
+        'name': f['name'],
+        'path': f['path'],
+        'size': f['size'],
+        'modified': datetime.fromtimestamp(f['mtime']).strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': f['platform'],
+        'type': f['media_type']
+    } for f in result['files']]
+    return jsonify({
+        'files': files,
+        'base': str(DOWNLOAD_PATH),
+        'total': result['total'],
+        'page': result['page'],
+        'page_size': result['page_size']
+    })
 
 
 # ============================================================
@@ -1451,13 +1883,7 @@ def open_download_folder():
         import subprocess
         
         # Lê o caminho configurado
-        config_file = Path('config.json')
-        if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            host_path = config.get('host_download_path', r'C:\Users\renov\Documents\z\downloads')
-        else:
-            host_path = r'C:\Users\renov\Documents\z\downloads'
+        host_path = get_config_manager().get().get('host_download_path', r'C:\Users\renov\Documents\z\downloads')
         
         # Verifica se está rodando em Docker
         is_docker = os.path.exists('/.dockerenv') or os.environ.get('DOCKER_CONTAINER', False)
@@ -1523,12 +1949,7 @@ def select_folder():
     """Abre um seletor de pasta nativo e retorna o caminho escolhido"""
     try:
         # Pasta inicial sugerida: host_download_path ou pasta padrão de Vídeos
-        initial_dir = get_windows_videos_folder()
-        config_file = Path('config.json')
-        if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                cfg = json.load(f)
-                initial_dir = cfg.get('host_download_path', initial_dir)
+        initial_dir = get_config_manager().get().get('host_download_path', get_windows_videos_folder())
 
         # Usar tkinter para exibir diálogo nativo
         try:
@@ -1554,20 +1975,17 @@ def select_folder():
 def get_config():
     """Retorna configurações do servidor"""
     try:
-        # Lê configurações do arquivo se existir
-        config_file = Path('config.json')
-        if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+        # Lê configurações (cache) se o arquivo existir
+        config_manager = get_config_manager()
+        default_videos_folder = get_windows_videos_folder()
+        if config_manager.exists():
+            config = dict(config_manager.get())
         else:
             # Configuração padrão - usa pasta Meus Vídeos do Windows
-            default_videos_folder = get_windows_videos_folder()
             config = {
                 'download_path': str(DOWNLOAD_PATH.absolute()),
                 'host_download_path': default_videos_folder
             }
-        
-        default_videos_folder = get_windows_videos_folder()
 
         # Defaults adicionais para painel avançado / notificações
         advanced_defaults = {
@@ -1586,7 +2004,23 @@ def get_config():
             'confirm_remove_items': False,
             'offer_channel_bulk': True,
             'show_in_notification_center': True,
-            'play_notification_sound': True
+            'play_notification_sound': True,
+            'concurrent_fragments_video': 8,
+            'concurrent_fragments_audio': 4,
+            'parallel_av_streams': True,
+            'bandwidth_limit_kbps': 0,
+            'bandwidth_platform_limits_kbps': {},
+            'bandwidth_schedule': [],
+            'host_max_concurrent': {},
+            'host_default_max_concurrent': 4,
+            'host_requests_per_minute': {},
+            'host_default_requests_per_minute': 0,
+            'host_backoff_sec': 120,
+            'decoupled_postprocessing': True,
+            'postprocess_workers': 0,
+            'postprocess_nice': 10,
+            'keep_native_audio': False,
+            'video_container': 'mp4'
         }
         # Preenche valores ausentes
         for k, v in advanced_defaults.items():
@@ -1613,14 +2047,6 @@ def update_config():
     try:
         data = request.get_json()
         
-        # Lê configuração existente ou cria nova
-        config_file = Path('config.json')
-        if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        else:
-            config = {}
-        
         # Campos permitidos para atualização
         allowed_keys = {
             'host_download_path',
@@ -1639,21 +2065,35 @@ def update_config():
             'confirm_remove_items',
             'offer_channel_bulk',
             'show_in_notification_center',
-            'play_notification_sound'
+            'play_notification_sound',
+            'concurrent_fragments_video',
+            'concurrent_fragments_audio',
+            'parallel_av_streams',
+            'bandwidth_limit_kbps',
+            'bandwidth_platform_limits_kbps',
+            'bandwidth_schedule',
+            'host_max_concurrent',
+            'host_default_max_concurrent',
+            'host_requests_per_minute',
+            'host_default_requests_per_minute',
+            'host_backoff_sec',
+            'decoupled_postprocessing',
+            'postprocess_workers',
+            'postprocess_nice',
+            'keep_native_audio',
+            'video_container'
         }
 
-        for key, value in data.items():
-            if key in allowed_keys:
-                config[key] = value
+        changes = {key: value for key, value in data.items() if key in allowed_keys}
         
-        # Salva configurações
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        # Salva configurações (mescla com o existente, escrita atômica)
+        config = get_config_manager().update(changes)
+        download_scheduler.refresh(force=True)
         
         return jsonify({
             'success': True,
             'message': 'Configurações salvas com sucesso',
-            'config': config
+            'config': dict(config)
         })
     except Exception as e:
         return jsonify({
@@ -1675,27 +2115,14 @@ def get_disk_space():
         import shutil
         
         # Obtém caminho configurado ou padrão
-        config_file = Path('config.json')
-        if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            download_path = config.get('host_download_path', get_windows_videos_folder())
-        else:
-            download_path = get_windows_videos_folder()
+        download_path = get_config_manager().get().get('host_download_path') or get_windows_videos_folder()
         
         # Obtém informações do disco
         disk_usage = shutil.disk_usage(download_path)
         
-        # Calcula tamanho da pasta de downloads
-        downloads_size = 0
-        if DOWNLOAD_PATH.exists():
-            for dirpath, dirnames, filenames in os.walk(DOWNLOAD_PATH):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    try:
-                        downloads_size += os.path.getsize(filepath)
-                    except (OSError, FileNotFoundError):
-                        pass
+        # Tamanho da pasta de downloads: totais incrementais do catálogo
+        totals = get_file_catalog().get_totals()
+        downloads_size = totals['bytes']
         
         def format_bytes(bytes_size):
             """Formata bytes para formato legível"""
@@ -1718,7 +2145,10 @@ def get_disk_space():
             },
             'downloads': {
                 'size': downloads_size,
-                'size_formatted': format_bytes(downloads_size)
+                'size_formatted': format_bytes(downloads_size),
+                'files': totals['files'],
+                'by_platform': totals['by_platform'],
+                'by_media_type': totals['by_media_type']
             },
             'path': download_path
         })
@@ -1748,10 +2178,11 @@ def get_spotify_cache_stats():
 
 @app.route('/api/spotify-cache-clean', methods=['POST'])
 def clean_spotify_cache():
-    """Limpa cache antigo (>90 dias)"""
+    """Limpa cache antigo (>90 dias); compactação roda em segundo plano"""
     try:
         cache = get_cache_manager()
         result = cache.clean_old_cache(days=90)
+        cache.request_maintenance()
         return jsonify({
             'success': True,
             **result
@@ -1763,6 +2194,69 @@ def clean_spotify_cache():
         })
 
 
+@app.route('/api/toolchain', methods=['GET', 'POST'])
+def toolchain_status():
+    """Capacidades do ffmpeg em cache; POST força nova sondagem"""
+    try:
+        toolchain = get_toolchain()
+        if request.method == 'POST':
+            toolchain.probe(force=True)
+        return jsonify({
+            'success': True,
+            **toolchain.get_status()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+
+@app.route('/api/postprocess', methods=['GET'])
+def get_postprocess_status():
+    """Retorna a fila de conversões (pool de pós-processamento)"""
+    try:
+        return jsonify({
+            'success': True,
+            **get_postprocess_pool().get_status()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+
+@app.route('/api/bandwidth', methods=['GET'])
+def get_bandwidth_status():
+    """Retorna limites de banda vigentes, transferências ativas e estado por host"""
+    try:
+        return jsonify({
+            'success': True,
+            **download_scheduler.get_status()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+
+@app.route('/api/dedupe-stats', methods=['GET'])
+def get_dedupe_stats():
+    """Retorna arquivos deduplicados (hardlinks) e bytes recuperados"""
+    try:
+        return jsonify({
+            'success': True,
+            **get_file_catalog().get_dedupe_stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+
 # ==================== NOVAS ROTAS - SISTEMA DE FILA ====================
 
 @app.route('/api/queue/add', methods=['POST'])
@@ -1795,19 +2289,12 @@ def api_queue_add():
             thumbnail=info.get('thumbnail')
         )
         
-        # Salva no histórico do settings_manager
-        settings_manager.add_to_history(
-            url=url,
-            title=info.get('title', 'Download'),
-            platform=platform,
-            status='queued',
-            file_size=0
-        )
+        # Histórico: download_video registra o resultado (um registro por download)
         
         return jsonify({
             'success': True,
             'task_id': task_id,
-            'message': i18n.get('download.analyzing')
+            'message': _t('download.analyzing')
         })
     
     except Exception as e:
@@ -1844,7 +2331,7 @@ def api_queue_pause(task_id):
     """Pausa um download"""
     try:
         download_queue.pause_task(task_id)
-        return jsonify({'success': True, 'message': i18n.get('download.pause')})
+        return jsonify({'success': True, 'message': _t('download.pause')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1854,7 +2341,7 @@ def api_queue_resume(task_id):
     """Resume um download"""
     try:
         download_queue.resume_task(task_id)
-        return jsonify({'success': True, 'message': i18n.get('download.resume')})
+        return jsonify({'success': True, 'message': _t('download.resume')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1864,7 +2351,7 @@ def api_queue_cancel(task_id):
     """Cancela um download"""
     try:
         download_queue.cancel_task(task_id)
-        return jsonify({'success': True, 'message': i18n.get('download.cancel')})
+        return jsonify({'success': True, 'message': _t('download.cancel')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1874,7 +2361,7 @@ def api_queue_retry(task_id):
     """Tenta novamente um download falhado"""
     try:
         download_queue.retry_task(task_id)
-        return jsonify({'success': True, 'message': i18n.get('download.retry')})
+        return jsonify({'success': True, 'message': _t('download.retry')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1894,7 +2381,7 @@ def api_queue_pause_all():
     """Pausa todos os downloads"""
     try:
         download_queue.pause_all()
-        return jsonify({'success': True, 'message': i18n.get('messages.allPaused', 'Todos pausados')})
+        return jsonify({'success': True, 'message': _t('messages.allPaused', 'Todos pausados')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1904,7 +2391,7 @@ def api_queue_resume_all():
     """Resume todos os downloads"""
     try:
         download_queue.resume_all()
-        return jsonify({'success': True, 'message': i18n.get('messages.allResumed', 'Todos retomados')})
+        return jsonify({'success': True, 'message': _t('messages.allResumed', 'Todos retomados')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1914,7 +2401,7 @@ def api_queue_cancel_all():
     """Cancela todos os downloads"""
     try:
         download_queue.cancel_all()
-        return jsonify({'success': True, 'message': i18n.get('messages.allCanceled', 'Todos cancelados')})
+        return jsonify({'success': True, 'message': _t('messages.allCanceled', 'Todos cancelados')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1924,7 +2411,7 @@ def api_queue_retry_all():
     """Tenta novamente todos os downloads falhados"""
     try:
         download_queue.retry_all()
-        return jsonify({'success': True, 'message': i18n.get('messages.allRetried', 'Todos tentados novamente')})
+        return jsonify({'success': True, 'message': _t('messages.allRetried', 'Todos tentados novamente')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1944,7 +2431,7 @@ def api_queue_clear_all():
     """Limpa toda a fila (exceto downloads ativos)"""
     try:
         download_queue.clear_all()
-        return jsonify({'success': True, 'message': i18n.get('history.clearAll')})
+        return jsonify({'success': True, 'message': _t('history.clearAll')})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1966,12 +2453,11 @@ def api_settings_update():
     """Atualiza configurações"""
     try:
         data = request.json
-        for key, value in data.items():
-            settings_manager.set(key, value)
+        settings_manager.update(data)
         
         return jsonify({
             'success': True,
-            'message': i18n.get('messages.settingsSaved')
+            'message': _t('messages.settingsSaved')
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -1994,47 +2480,122 @@ def api_statistics():
         return jsonify({'success': False, 'error': str(e)})
 
 
+def _i18n_response(language: str) -> Response:
+    """Corpo pré-serializado do catálogo com ETag (304 se o cliente já tem)"""
+    body, etag = i18n.get_payload(language)
+    # Lista de tags do cabeçalho comparada por igualdade (comparação fraca, RFC 9110)
+    if request.if_none_match.contains_weak(etag.strip('"')):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Language, Cookie'
+    return response
+
+
 @app.route('/api/i18n/<lang_code>', methods=['GET'])
 def api_i18n_switch(lang_code):
-    """Troca idioma da interface"""
+    """Troca idioma da interface (só para este cliente, via cookie)"""
     try:
-        if i18n.switch_language(lang_code):
-            return jsonify({
-                'success': True,
-                'language': lang_code,
-                'strings': i18n.strings
-            })
-        else:
+        language = lang_code.lower()
+        if language not in i18n.catalogs:
             return jsonify({
                 'success': False,
                 'error': 'Idioma não disponível'
             })
+        response = _i18n_response(language)
+        response.set_cookie(I18N_COOKIE, language, max_age=365 * 24 * 3600, samesite='Lax')
+        return response
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
 @app.route('/api/i18n/strings', methods=['GET'])
 def api_i18n_strings():
-    """Retorna todas as strings do idioma atual"""
+    """Retorna todas as strings do idioma da requisição"""
     try:
-        return jsonify({
-            'success': True,
-            'language': i18n.current_language,
-            'strings': i18n.strings
-        })
+        return _i18n_response(_request_language())
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+def run_production(host: str = '0.0.0.0', port: int = 5002, workers: int = 0, threads: int = 0):
+    """
+    Servidor de produção: vários processos WSGI (gunicorn gthread) com estado em SQLite
+    
+    Status, fila, token buckets, vagas por host e backoff ficam no backend
+    compartilhado, então os limites valem para o conjunto dos workers; o
+    arquivo de downloads confirma ausências no SQLite e o catálogo reserva as
+    tarefas periódicas para um worker. Sem gunicorn (ex.: Windows), usa o
+    servidor do Flask sem debug/reloader, com threads.
+    """
+    global download_status
+    configure_state_backend('sqlite')
+    download_status = get_state_backend('download_status')
+    download_queue.attach_backend(get_state_backend('download_queue'))
+    # Ainda no processo principal: nenhuma transferência em andamento
+    download_scheduler.attach_backend(get_state_backend('download_scheduler'), reset=True)
+    get_download_archive().shared = True
+    workers = workers or os.cpu_count() or 2
+    threads = threads or 8
+    
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.warning("⚠️ gunicorn não instalado; servidor de processo único (pip install gunicorn)")
+        start_background_services()
+        app.run(debug=False, host=host, port=port, threaded=True, use_reloader=False)
+        return
+    
+    class _GunicornApp(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', threads)
+            # Downloads rodam em threads próprias; o timeout só recicla um worker travado
+            self.cfg.set('timeout', 120)
+            self.cfg.set('graceful_timeout', 30)
+            self.cfg.set('post_fork', lambda server, worker: start_background_services())
+        
+        def load(self):
+            return app
+    
+    # Salvamento adiado pendente: o Timer não sobreviveria ao fork do worker
+    settings_manager.flush()
+    logger.info(f"🚀 Produção: {workers} workers x {threads} threads em http://{host}:{port}")
+    _GunicornApp().run()
+
+
 def main():
     """Inicia o servidor"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Servidor web de download de vídeos')
+    parser.add_argument('--production', action='store_true',
+                        default=os.environ.get('VINC_MODE', '').lower() == 'production',
+                        help='Servidor WSGI com estado em SQLite (ou VINC_MODE=production)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('VINC_WORKERS', 0) or 0),
+                        help='Número de workers em produção (padrão: número de CPUs)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('VINC_THREADS', 0) or 0),
+                        help='Threads por worker em produção (padrão: 8)')
+    parser.add_argument('--port', type=int, default=5002)
+    args = parser.parse_args()
+    
+    if args.production:
+        try:
+            run_production(port=args.port, workers=args.workers, threads=args.threads)
+        finally:
+            settings_manager.flush()
+        return
+    
     try:
         print("\n" + "="*60)
         print("SERVIDOR WEB DE DOWNLOAD DE VIDEOS")
         print("="*60)
         print(f"\nPasta de downloads: {DOWNLOAD_PATH.absolute()}")
         print("\nIniciando servidor...")
-        print("\nAcesse: http://localhost:5002")
+        print(f"\nAcesse: http://localhost:{args.port}")
         print("\nPressione CTRL+C para parar o servidor\n")
         print("="*60 + "\n")
     except UnicodeEncodeError:
@@ -2046,10 +2607,21 @@ def main():
     
     try:
         # Abre o navegador após o servidor iniciar
-        threading.Timer(1.0, lambda: webbrowser.open('http://localhost:5002')).start()
+        threading.Timer(1.0, lambda: webbrowser.open(f'http://localhost:{args.port}')).start()
     except Exception:
         pass
-    app.run(debug=True, host='0.0.0.0', port=5002)
+
+    # SIGTERM (ex.: docker stop) encerra via sys.exit para rodar flush/atexit
+    try:
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    except (ValueError, AttributeError):
+        pass
+
+    try:
+        app.run(debug=True, host='0.0.0.0', port=args.port)
+    finally:
+        settings_manager.flush()
 
 
 if __name__ == '__main__':